@@ -9,9 +9,13 @@ import plotly.graph_objects as go
 import pickle
 import numpy as np
 import joblib
-import pymannkendall as mk
 from pathlib import Path
-import requests
+import sys
+
+# Paquete compartido con los notebooks (raíz del repositorio)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from sarida.assets import AssetCache, fetch_http, fetch_s3, is_valid
+from sarida.store import read_monthly
 
 # COLORES
 PALETTE = {
@@ -20,6 +24,13 @@ PALETTE = {
     "text": "#030F12",
 }
 
+# Nombres de los meses (1-12) para etiquetas y selectores
+MESES_ES = {
+    1: "enero", 2: "febrero", 3: "marzo", 4: "abril",
+    5: "mayo", 6: "junio", 7: "julio", 8: "agosto",
+    9: "septiembre", 10: "octubre", 11: "noviembre", 12: "diciembre",
+}
+
 # =========================
 # CONFIG PÁGINA
 # =========================
@@ -110,24 +121,22 @@ st.markdown(
 # =========================
 # HELPERS DESCARGA
 # =========================
-def download_http(url: str, dest_path: str) -> bool:
+def _secret(name: str):
+    try:
+        return st.secrets.get(name) if name and name in st.secrets else None
+    except Exception:
+        return None
+
+def download_http(url: str, dest_path: str, sha256: str=None) -> bool:
     try:
-        dest = Path(dest_path)
-        dest.parent.mkdir(parents=True, exist_ok=True)
-        with requests.get(url, stream=True, timeout=60) as r:
-            r.raise_for_status()
-            with open(dest, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+        fetch_http(url, dest_path, sha256=sha256)
         return True
     except Exception as e:
         st.error(f"Error descargando {url}: {e}")
         return False
 
-def download_from_s3(bucket: str, key: str, dest_path: str, aws_access_key=None, aws_secret_key=None, region_name=None) -> bool:
+def download_from_s3(bucket: str, key: str, dest_path: str, aws_access_key=None, aws_secret_key=None, region_name=None, sha256: str=None) -> bool:
     try:
-        import boto3
         session_kwargs = {}
         if aws_access_key and aws_secret_key:
             session_kwargs = dict(
@@ -135,66 +144,110 @@ def download_from_s3(bucket: str, key: str, dest_path: str, aws_access_key=None,
                 aws_secret_access_key=aws_secret_key,
                 region_name=region_name,
             )
-        s3 = boto3.client("s3", **session_kwargs)
-        dest = Path(dest_path)
-        dest.parent.mkdir(parents=True, exist_ok=True)
-        s3.download_file(bucket, key, str(dest))
+        fetch_s3(bucket, key, dest_path, sha256=sha256, **session_kwargs)
         return True
     except Exception as e:
         st.error(f"Error descargando s3://{bucket}/{key}: {e}")
         return False
 
-def ensure_asset(local_path: str, secret_key_url: str=None, s3_bucket_secret: str=None, s3_key_secret: str=None) -> bool:
-    if Path(local_path).exists():
-        return True
-
-    if secret_key_url:
-        url = None
-        try:
-            url = st.secrets.get(secret_key_url) if secret_key_url in st.secrets else None
-        except Exception:
-            url = None
-        if url:
-            st.info(f"Descargando {local_path} desde URL configurada en secret {secret_key_url}...")
-            return download_http(url, local_path)
-
-    try:
-        s3_bucket = st.secrets.get(s3_bucket_secret) if s3_bucket_secret and s3_bucket_secret in st.secrets else None
-        s3_key = st.secrets.get(s3_key_secret) if s3_key_secret and s3_key_secret in st.secrets else None
-    except Exception:
-        s3_bucket = s3_key = None
+def asset_spec(local_path: str, secret_key_url: str=None, s3_bucket_secret: str=None, s3_key_secret: str=None, sha256_secret: str=None):
+    """Origen de descarga de un asset según Secrets (None si no hay ninguno)."""
+    sha256 = _secret(sha256_secret)
+    url = _secret(secret_key_url)
+    if url:
+        return {"dest": local_path, "url": url, "sha256": sha256, "origen": f"URL configurada en secret {secret_key_url}"}
 
+    s3_bucket = _secret(s3_bucket_secret)
+    s3_key = _secret(s3_key_secret)
     if s3_bucket and s3_key:
-        st.info(f"Descargando {local_path} desde S3 {s3_bucket}/{s3_key} usando credenciales en Secrets...")
-        aws_key = st.secrets.get("AWS_ACCESS_KEY_ID") if "AWS_ACCESS_KEY_ID" in st.secrets else None
-        aws_secret = st.secrets.get("AWS_SECRET_ACCESS_KEY") if "AWS_SECRET_ACCESS_KEY" in st.secrets else None
-        aws_region = st.secrets.get("AWS_REGION") if "AWS_REGION" in st.secrets else None
-        return download_from_s3(s3_bucket, s3_key, local_path, aws_key, aws_secret, aws_region)
-
-    st.warning(f"No se encontró '{local_path}' localmente y no se configuró una URL o S3 en Secrets para descargarlo.")
-    return False
-
-# Descarga condicional de assets
-_ = ensure_asset(
-    local_path="dataset_clima.parquet",
-    secret_key_url="DATASET_URL",
-    s3_bucket_secret="S3_BUCKET",
-    s3_key_secret="DATASET_KEY",
-)
+        s3 = {}
+        if _secret("AWS_ACCESS_KEY_ID") and _secret("AWS_SECRET_ACCESS_KEY"):
+            s3 = dict(
+                aws_access_key_id=_secret("AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=_secret("AWS_SECRET_ACCESS_KEY"),
+                region_name=_secret("AWS_REGION"),
+            )
+        return {"dest": local_path, "bucket": s3_bucket, "key": s3_key, "s3": s3, "sha256": sha256,
+                "origen": f"S3 {s3_bucket}/{s3_key} usando credenciales en Secrets"}
+    return None
 
-_ = ensure_asset(
-    local_path="modelo_sequia_hgb.pkl",
-    secret_key_url="MODEL_URL",
-    s3_bucket_secret="S3_BUCKET",
-    s3_key_secret="MODEL_KEY",
-)
+@st.cache_resource(ttl=3600, show_spinner=False)
+def revalidate_assets(specs: list) -> dict:
+    """
+    Revalida los assets contra su origen (una petición pequeña por asset) y baja
+    solo los que cambiaron. Se cachea una hora para no repetirlo en cada rerun.
+    """
+    cache = AssetCache(Path(".cache") / "assets")
+    results = cache.fetch_all(specs)
+    if any(r is True for r in results.values()):
+        # Hay una versión nueva: los datos cacheados en memoria ya no sirven
+        st.cache_data.clear()
+    return results
+
+def ensure_assets(assets: list) -> dict:
+    """
+    Verifica varios assets en paralelo usando la caché local por contenido.
+    Los mensajes se muestran desde el hilo principal.
+    """
+    status = {}
+    specs = []
+    for kwargs in assets:
+        local_path = kwargs["local_path"]
+        spec = asset_spec(**kwargs)
+        if spec is not None:
+            specs.append(spec)
+        elif is_valid(local_path):
+            status[local_path] = True
+        else:
+            st.warning(f"No se encontró '{local_path}' localmente y no se configuró una URL o S3 en Secrets para descargarlo.")
+            status[local_path] = False
+
+    origen = {spec["dest"]: spec["origen"] for spec in specs}
+    for dest, result in revalidate_assets(specs).items():
+        if isinstance(result, Exception):
+            st.error(f"Error descargando {dest}: {result}")
+            # Si falla la revalidación se sigue usando la versión local
+            status[dest] = is_valid(dest)
+        else:
+            if result and not st.session_state.get(f"aviso_{dest}"):
+                st.info(f"Se descargó una versión nueva de {dest} desde {origen[dest]}.")
+                st.session_state[f"aviso_{dest}"] = True
+            status[dest] = True
+    return status
+
+def ensure_asset(local_path: str, secret_key_url: str=None, s3_bucket_secret: str=None, s3_key_secret: str=None, sha256_secret: str=None) -> bool:
+    return ensure_assets([dict(
+        local_path=local_path,
+        secret_key_url=secret_key_url,
+        s3_bucket_secret=s3_bucket_secret,
+        s3_key_secret=s3_key_secret,
+        sha256_secret=sha256_secret,
+    )])[local_path]
+
+# Descarga condicional de assets (en paralelo: dataset y modelo a la vez)
+_ = ensure_assets([
+    dict(
+        local_path="dataset_clima.parquet",
+        secret_key_url="DATASET_URL",
+        s3_bucket_secret="S3_BUCKET",
+        s3_key_secret="DATASET_KEY",
+        sha256_secret="DATASET_SHA256",
+    ),
+    dict(
+        local_path="modelo_sequia_hgb.pkl",
+        secret_key_url="MODEL_URL",
+        s3_bucket_secret="S3_BUCKET",
+        s3_key_secret="MODEL_KEY",
+        sha256_secret="MODEL_SHA256",
+    ),
+])
 
 # =========================
 # CARGA Y PREPARACIÓN DE DATOS
 # =========================
 @st.cache_data
 def load_data():
-    df = pd.read_parquet("Dashboard/dataset_clima.parquet")
+    df = read_monthly("Dashboard/dataset_clima.parquet")
 
     if "valid_time" in df.columns:
         df["valid_time"] = pd.to_datetime(df["valid_time"])
@@ -248,6 +301,138 @@ def load_modelo_probs():
         st.warning("No se encontró 'dataset_modelo.parquet'. No se mostrará la gráfica de probabilidades de sequía.")
         return None
 
+@st.cache_data(ttl=3600)
+def load_provisional():
+    """Última fila del modo diario (``sarida.daily.run_daily``), si existe."""
+    try:
+        dfp = pd.read_parquet("Dashboard/dataset_provisional.parquet")
+    except FileNotFoundError:
+        return None
+    if dfp.empty:
+        return None
+    return dfp.sort_values("valid_time").iloc[-1]
+
+@st.cache_data
+def load_fire():
+    """Código de Sequía (DC) de la caja y de la grilla desde ``data_stream-moda.nc``."""
+    from sarida.fire import cached_fire, fire_series
+
+    path = Path("Dashboard/data_stream-moda.nc")
+    if not path.exists():
+        return None, None
+    fire = cached_fire(path, Path(".cache") / "fuego")
+    return fire_series(fire), fire["DC"]
+
+def dataset_version() -> str:
+    """Huella barata del dataset (tamaño y fecha de modificación) para las cachés."""
+    info = Path("Dashboard/dataset_clima.parquet").stat()
+    return f"{info.st_size}-{info.st_mtime_ns}"
+
+@st.cache_resource(max_entries=2)
+def load_climatology(version: str):
+    """Climatología mensual y anomalías de toda la serie, una vez por versión del dataset."""
+    from sarida.climatology import Climatology
+
+    data, _ = load_data()
+    clim = Climatology.build(data, version=version)
+    return clim, clim.anomalies(data, time_col="date")
+
+@st.cache_resource(max_entries=2)
+def load_rollups(version: str):
+    """Agregados mensual/estacional/anual/hidrológico/ENSO, una vez por versión del dataset."""
+    from sarida.rollups import cached_rollups, fetch_oni, read_oni
+
+    data, _ = load_data()
+    try:
+        oni = read_oni(fetch_oni(Path(".cache") / "enso"))
+    except Exception:
+        # Sin conexión con NOAA CPC se omite la resolución ENSO
+        oni = None
+    return cached_rollups(data, Path(".cache") / "rollups", version, oni=oni)
+
+@st.cache_resource(max_entries=2)
+def load_trends(version: str):
+    """Mann-Kendall y pendiente de Sen de los 8 SPI/SPEI y la línea de tendencia de SPEI_12."""
+    from sarida.trends import cached_trends
+
+    data, _ = load_data()
+    cols = ["SPI_1", "SPI_3", "SPI_6", "SPI_12", "SPEI_1", "SPEI_3", "SPEI_6", "SPEI_12"]
+    table = cached_trends(data, Path(".cache") / "tendencias", version, cols)
+    trend_df = pd.DataFrame({
+        "Index": table["index"],
+        "Slope": table["slope"],
+        "P_Value": table["p"],
+        "Trend": table["trend"],
+        "Significant": table["p"] < 0.05,
+    })
+    slope = trend_df.loc[trend_df["Index"] == "SPEI_12", "Slope"].iloc[0]
+    trend_line_y = data["SPEI_12"].iloc[0] + slope * np.arange(len(data))
+    return trend_df, trend_line_y
+
+@st.cache_resource(max_entries=2)
+def load_robust_trends(version: str):
+    """Hamed–Rao, pre-blanqueo e intervalos bootstrap por bloques de los 8 SPI/SPEI."""
+    from sarida.trends import cached_robust_trends
+
+    data, _ = load_data()
+    cols = ["SPI_1", "SPI_3", "SPI_6", "SPI_12", "SPEI_1", "SPEI_3", "SPEI_6", "SPEI_12"]
+    return cached_robust_trends(data, Path(".cache") / "tendencias", version, cols)
+
+@st.cache_resource(max_entries=2)
+def load_changepoints(version: str):
+    """Cambios de régimen (Pettitt y segmentación binaria) de todos los SPI/SPEI."""
+    from sarida.changepoints import cached_changepoints
+
+    data, _ = load_data()
+    return cached_changepoints(data, Path(".cache") / "cambios", version)
+
+@st.cache_resource(max_entries=2)
+def load_range_trend(version: str):
+    """Estructura de consultas de Mann-Kendall por rango de años para SPEI_12."""
+    from sarida.trends import cached_range_trend
+
+    data, _ = load_data()
+    return cached_range_trend(data, "SPEI_12", Path(".cache") / "tendencias", version)
+
+TREND_MAPS = Path("Dashboard/tendencias_pixel.nc")
+
+def trend_maps_version() -> str:
+    """Fecha de modificación del NetCDF de mapas (vacía si no existe), para la caché."""
+    return str(TREND_MAPS.stat().st_mtime_ns) if TREND_MAPS.exists() else ""
+
+@st.cache_data(max_entries=2)
+def load_trend_maps(version: str):
+    """Mapas de tendencia por píxel (``sarida.gridded.grid_trends``), si ya se calcularon."""
+    if not version:
+        return None
+    try:
+        import xarray as xr
+    except ImportError:
+        # Sin xarray (o su motor NetCDF) se omiten los mapas, como si no existieran
+        return None
+    try:
+        return xr.load_dataset(TREND_MAPS)
+    except (ImportError, ValueError):
+        return None
+
+@st.cache_resource(max_entries=2)
+def load_events(version: str):
+    """Catálogo de eventos de todos los SPI/SPEI del dataset, una vez por versión del dataset."""
+    from sarida.events import EventCatalogue
+
+    data, _ = load_data()
+    return EventCatalogue.from_frame(data)
+
+@st.cache_resource(max_entries=2)
+def load_extremes(version: str):
+    """Ajustes GEV/GPD de la caja y sus intervalos bootstrap, una vez por versión del dataset."""
+    from sarida.extremes import ExtremeFits, box_series
+
+    data, _ = load_data()
+    fits = ExtremeFits.fit(box_series(data, time_col="date"),
+                           cache=Path(".cache") / "extremos" / "extremos.npz")
+    return fits, fits.return_levels(), fits.bootstrap()
+
 @st.cache_resource
 def load_model():
     try:
@@ -345,12 +530,6 @@ with tab1:
         # Si 'proba' está entre 0 y 1, la pasamos a porcentaje
         df_disp["proba_pct"] = df_disp["proba"] * 100
 
-        MESES_ES = {
-            1: "enero", 2: "febrero", 3: "marzo", 4: "abril",
-            5: "mayo", 6: "junio", 7: "julio", 8: "agosto",
-            9: "septiembre", 10: "octubre", 11: "noviembre", 12: "diciembre",
-        }
-
         df_disp["hover_fecha"] = df_disp["date"].apply(
             lambda d: f"{MESES_ES[d.month]} {d.year}"
         )
@@ -392,6 +571,20 @@ with tab1:
             "inferior para acercarte y ver la variación mes a mes."
         )
 
+        # ===== Valores provisionales del mes en curso (modo diario) =====
+        prov = load_provisional()
+        if prov is not None:
+            st.subheader(f"Mes en curso (provisional): {MESES_ES[prov['valid_time'].month]} {prov['valid_time'].year}")
+            pcol1, pcol2, pcol3 = st.columns(3)
+            pcol1.metric("SPI-1 provisional", f"{prov['SPI_1']:.2f}")
+            pcol2.metric("SPEI-3 provisional", f"{prov['SPEI_3']:.2f}")
+            if pd.notna(prov.get("proba")):
+                pcol3.metric("Probabilidad provisional", f"{prov['proba'] * 100:.1f}%")
+            st.caption(
+                "Calculado con los últimos 30 y 90 días de datos diarios; cambia cada día "
+                "hasta que se publica el promedio mensual definitivo."
+            )
+
         st.markdown("---")
 
         # ===== Recomendaciones + Chatbot en columnas =====
@@ -672,21 +865,32 @@ with tab2:
     # ===== Análisis climático ERA5-Land (Mensual) =====
     st.header("**Análisis climático basado en ERA5-Land (Mensual)**")
 
+    # Las gráficas leen los agregados pre-calculados de la resolución elegida
+    rollups = load_rollups(dataset_version())
+    res_labels = {
+        "month": "Mensual", "season": "Estacional", "year": "Anual",
+        "hydro_year": "Año hidrológico (abr–mar)",
+    }
+    resolution = st.radio("Resolución", options=list(res_labels), format_func=res_labels.get,
+                          horizontal=True)
+    agg = rollups.get(resolution)
+    agg = agg[agg["start"].dt.year.between(start_year, end_year)]
+
     # Gráfico 1: Precipitación vs Evaporación
     fig1 = go.Figure()
     fig1.update_layout(colorway=PALETTE["colors"])
-    if "e" in df_filtered.columns:
+    if "e_mean" in agg.columns:
         fig1.add_trace(go.Scatter(
-            x=df_filtered["date"],
-            y=df_filtered["e"],
+            x=agg["start"],
+            y=agg["e_mean"],
             mode="lines",
             name="Evaporación total (e)"
         ))
 
-    if "tp" in df_filtered.columns:
+    if "tp_mean" in agg.columns:
         fig1.add_trace(go.Scatter(
-            x=df_filtered["date"],
-            y=df_filtered["tp"],
+            x=agg["start"],
+            y=agg["tp_mean"],
             mode="lines",
             name="Precipitación total (tp)"
         ))
@@ -701,13 +905,13 @@ with tab2:
     # Gráfico 2: SPI
     fig2 = go.Figure()
     fig2.update_layout(colorway=PALETTE["colors"])
-    spi_cols = [c for c in ["SPI_1", "SPI_3", "SPI_6", "SPI_12"] if c in df_filtered.columns]
+    spi_cols = [c for c in ["SPI_1", "SPI_3", "SPI_6", "SPI_12"] if f"{c}_mean" in agg.columns]
 
     if spi_cols:
         for c in spi_cols:
             fig2.add_trace(go.Scatter(
-                x=df_filtered["date"],
-                y=df_filtered[c],
+                x=agg["start"],
+                y=agg[f"{c}_mean"],
                 mode="lines",
                 name=c
             ))
@@ -723,13 +927,13 @@ with tab2:
     # Gráfico 3: SPEI
     fig3 = go.Figure()
     fig3.update_layout(colorway=PALETTE["colors"])
-    spei_cols = [c for c in ["SPEI_1", "SPEI_3", "SPEI_6", "SPEI_12"] if c in df_filtered.columns]
+    spei_cols = [c for c in ["SPEI_1", "SPEI_3", "SPEI_6", "SPEI_12"] if f"{c}_mean" in agg.columns]
 
     if spei_cols:
         for c in spei_cols:
             fig3.add_trace(go.Scatter(
-                x=df_filtered["date"],
-                y=df_filtered[c],
+                x=agg["start"],
+                y=agg[f"{c}_mean"],
                 mode="lines",
                 name=c
             ))
@@ -742,13 +946,114 @@ with tab2:
     else:
         fig3.update_layout(title="SPEI no disponible en el dataset")
 
-    t1, t2, t3 = st.tabs(["🌧️ Precipitación / Evaporación", "📈 SPI", "🔥 SPEI"])
+    # Gráfico 4: peligro de incendio (Código de Sequía del FWI) junto al SPEI-3
+    fire_df, fire_grid = load_fire()
+    fig4 = go.Figure()
+    fig4.update_layout(colorway=PALETTE["colors"])
+    if fire_df is not None:
+        fire_mask = fire_df["valid_time"].dt.year.between(start_year, end_year)
+        fire_f = fire_df[fire_mask]
+        fig4.add_trace(go.Scatter(
+            x=fire_f["valid_time"],
+            y=fire_f["DC"],
+            mode="lines",
+            name="Código de Sequía (DC)",
+            customdata=fire_f["DC_clase"],
+            hovertemplate="DC: %{y:.0f} (%{customdata})<extra></extra>",
+        ))
+        if "SPEI_3" in df_filtered.columns:
+            fig4.add_trace(go.Scatter(
+                x=df_filtered["date"],
+                y=df_filtered["SPEI_3"],
+                mode="lines",
+                name="SPEI_3",
+                yaxis="y2",
+            ))
+        fig4.update_layout(
+            title="Peligro de incendio: Código de Sequía (DC) y SPEI_3",
+            xaxis_title="Año",
+            yaxis=dict(title="DC"),
+            yaxis2=dict(title="SPEI_3", overlaying="y", side="right", autorange="reversed"),
+            hovermode="x unified"
+        )
+    else:
+        fig4.update_layout(title="No se encontró 'data_stream-moda.nc' para calcular el DC")
+
+    clim, anomalies = load_climatology(dataset_version())
+
+    t1, t2, t3, t4, t5 = st.tabs([
+        "🌧️ Precipitación / Evaporación", "📈 SPI", "🔥 SPEI", "🌲 Incendios (DC)", "📉 Anomalías",
+    ])
     with t1:
         st.plotly_chart(fig1, use_container_width=True)
     with t2:
         st.plotly_chart(fig2, use_container_width=True)
     with t3:
         st.plotly_chart(fig3, use_container_width=True)
+    with t4:
+        st.plotly_chart(fig4, use_container_width=True)
+        if fire_grid is not None:
+            fire_months = pd.DatetimeIndex(fire_grid["valid_time"].values)
+            fire_month = st.select_slider(
+                "Mes del mapa",
+                options=list(fire_months),
+                value=fire_months[-1],
+                format_func=lambda m: m.strftime("%Y-%m"),
+            )
+            field = fire_grid.sel(valid_time=fire_month)
+            fig5 = go.Figure(go.Heatmap(
+                x=field["longitude"].values,
+                y=field["latitude"].values,
+                z=field.values,
+                colorscale=[[0, "#FDEBD8"], [0.5, "#E36414"], [1, "#5F0F40"]],
+                zmin=0,
+                zmax=max(float(fire_grid.max()), 425),
+                colorbar=dict(title="DC"),
+            ))
+            fig5.update_layout(
+                title=f"Código de Sequía por celda ({fire_month:%Y-%m})",
+                xaxis_title="Longitud",
+                yaxis_title="Latitud",
+            )
+            st.plotly_chart(fig5, use_container_width=True)
+        st.caption(
+            "El Código de Sequía (sistema canadiense FWI, versión mensual) solo usa temperatura y lluvia. "
+            "Clases: bajo < 80, moderado < 190, alto < 300, muy alto < 425, extremo ≥ 425."
+        )
+    with t5:
+        anom_var = st.selectbox(
+            "Variable",
+            options=clim.columns,
+            index=clim.columns.index("tp") if "tp" in clim.columns else 0,
+            key="anom_var",
+        )
+        anom_f = anomalies[anomalies["date"].dt.year.between(start_year, end_year)]
+        anom_values = anom_f[f"{anom_var}_anom"]
+        fig6 = go.Figure(go.Bar(
+            x=anom_f["date"],
+            y=anom_values,
+            marker_color=np.where(anom_values < 0, PALETTE["colors"][1], PALETTE["colors"][4]),
+            customdata=anom_f[f"{anom_var}_pct"],
+            hovertemplate="%{x|%Y-%m}<br>Anomalía: %{y:.2f}<br>Percentil del mes: %{customdata:.0f}<extra></extra>",
+            name="Anomalía",
+        ))
+        fig6.update_layout(
+            title=f"Anomalía mensual de {anom_var} respecto a la climatología del mismo mes",
+            xaxis_title="Año",
+            yaxis_title=f"{anom_var} - media del mes",
+            hovermode="x unified",
+        )
+        st.plotly_chart(fig6, use_container_width=True)
+        with st.expander("Climatología por mes (media)"):
+            st.dataframe(clim.table("mean").round(2), use_container_width=True)
+        if "enso" in rollups.resolutions:
+            with st.expander("Composición por fase ENSO (ONI de NOAA CPC)"):
+                enso = rollups.get("enso").set_index("period").reindex(["El Niño", "Neutral", "La Niña"])
+                enso_cols = [c for c in (f"{anom_var}_mean", "SPEI_12_mean") if c in enso.columns]
+                st.dataframe(
+                    enso[["n_months"] + enso_cols].rename(columns={"n_months": "Meses"}).round(2),
+                    use_container_width=True,
+                )
 
     st.markdown("---")
     st.header("**Análisis de tendencias de sequías (Mann-Kendall)**")
@@ -757,29 +1062,8 @@ with tab2:
         'SPI_1', 'SPI_3', 'SPI_6', 'SPI_12',
         'SPEI_1', 'SPEI_3', 'SPEI_6', 'SPEI_12'
     ]):
-        # ==== Cálculo tendencias (se mantiene igual) ====
-        trend_data = []
-        for col in ['SPI_1', 'SPI_3', 'SPI_6', 'SPI_12',
-                    'SPEI_1', 'SPEI_3', 'SPEI_6', 'SPEI_12']:
-            series = df[col].dropna()
-            if not series.empty:
-                result = mk.original_test(series)
-                trend_data.append({
-                    'Index': col,
-                    'Slope': result.slope,
-                    'P_Value': result.p,
-                    'Trend': result.trend,
-                    'Significant': result.p < 0.05
-                })
-
-        trend_df = pd.DataFrame(trend_data)
-
-        slope_spei12_from_df = trend_df[trend_df['Index'] == 'SPEI_12']['Slope'].iloc[0]
-        numeric_index_for_slope = np.arange(len(df['SPEI_12']))
-        first_spei12_value_in_series = df['SPEI_12'].iloc[0]
-        trend_line_y = first_spei12_value_in_series + slope_spei12_from_df * (
-            numeric_index_for_slope - numeric_index_for_slope[0]
-        )
+        # ==== Cálculo tendencias (en lote y en caché por versión del dataset) ====
+        trend_df, trend_line_y = load_trends(dataset_version())
 
         # ==== 1) PRIMERO: Gráfica recortada + eventos + observaciones (antes del contexto histórico) ====
         n = min(150, len(df))
@@ -802,47 +1086,17 @@ with tab2:
             line=dict(color="#9A031E", dash="dash")
         ))
 
-        # Franjas de eventos históricos
-        fig_hist.add_vrect(
-            x0=pd.to_datetime("2021-02-01"),
-            x1=pd.to_datetime("2021-02-28"),
-            line_width=0,
-            fillcolor="#9A031E",
-            opacity=0.18,
-            layer="below",
-        )
-        fig_hist.add_vrect(
-            x0=pd.to_datetime("2020-01-01"),
-            x1=pd.to_datetime("2020-06-30"),
-            line_width=0,
-            fillcolor="#9A031E",
-            opacity=0.18,
-            layer="below",
-        )
-        fig_hist.add_vrect(
-            x0=pd.to_datetime("2019-03-01"),
-            x1=pd.to_datetime("2019-04-30"),
-            line_width=0,
-            fillcolor="#9A031E",
-            opacity=0.18,
-            layer="below",
-        )
-        fig_hist.add_vrect(
-            x0=pd.to_datetime("2019-02-01"),
-            x1=pd.to_datetime("2019-02-28"),
-            line_width=0,
-            fillcolor="#9A031E",
-            opacity=0.18,
-            layer="below",
-        )
-        fig_hist.add_vrect(
-            x0=pd.to_datetime("2014-01-01"),
-            x1=pd.to_datetime("2014-12-30"),
-            line_width=0,
-            fillcolor="#9A031E",
-            opacity=0.18,
-            layer="below",
-        )
+        # Franjas de los eventos detectados en SPEI_12 (teoría de rachas, SPEI < -1)
+        events = load_events(dataset_version())
+        for interval in events.overlapping(x_last.min(), x_last.max(), index="SPEI_12").index:
+            fig_hist.add_vrect(
+                x0=interval.left,
+                x1=interval.right,
+                line_width=0,
+                fillcolor="#9A031E",
+                opacity=0.18,
+                layer="below",
+            )
 
         fig_hist.update_layout(
             title="Eventos históricos recientes y tendencia de sequía (SPEI_12, últimos registros)",
@@ -855,6 +1109,54 @@ with tab2:
 
         st.plotly_chart(fig_hist, use_container_width=True)
 
+        with st.expander("Catálogo de eventos de sequía detectados"):
+            event_index = st.selectbox(
+                "Índice",
+                options=sorted(events.events["index"].unique(), key=lambda c: (c.rsplit("_", 1)[0], int(c.rsplit("_", 1)[1]))),
+                index=None,
+                placeholder="Todos los índices",
+            )
+            in_range = events.overlapping(f"{start_year}-01-01", f"{end_year}-12-01", index=event_index)
+            st.dataframe(
+                in_range.reset_index(drop=True).rename(columns={
+                    "index": "Índice", "start": "Inicio", "end": "Fin", "duration": "Duración (meses)",
+                    "severity": "Severidad", "intensity": "Intensidad media", "peak": "Pico",
+                    "peak_time": "Mes del pico",
+                }),
+                use_container_width=True,
+                hide_index=True,
+            )
+            st.caption(
+                "Un evento es una racha de meses consecutivos con el índice por debajo de -1. "
+                "Severidad: suma de los valores del índice en la racha (en positivo)."
+            )
+
+        with st.expander("¿Qué tan rara es esta sequía? (periodos de retorno)"):
+            fits, levels, ci = load_extremes(dataset_version())
+            labels = {
+                "deficit_tp_3": "Déficit de lluvia en 3 meses (mm)",
+                "duracion_SPEI_3": "Duración de la sequía SPEI_3 (meses)",
+            }
+            labels.update({n: f"Mínimo anual de {n[:-4]}" for n in fits.names if n.endswith("_min")})
+            series = st.selectbox("Serie", options=fits.names, format_func=lambda n: labels.get(n, n))
+            default = float(events.events.loc[events.events["index"] == "SPEI_12", "peak"].min()) \
+                if series.startswith("SPEI_12") else float(levels.loc[series, "T10"])
+            value = st.number_input("Valor observado", value=round(default, 2), step=0.1)
+            period = fits.return_period(series, value)
+            st.metric("Periodo de retorno estimado",
+                      f"{period:,.0f} años" if np.isfinite(period) else "fuera del rango del ajuste")
+            table = pd.DataFrame({
+                "Periodo (años)": [int(c[1:]) for c in levels.columns],
+                "Nivel de retorno": levels.loc[series].to_numpy(),
+                "IC 90 % inf.": [ci.loc[series, f"{c}_lo"] for c in levels.columns],
+                "IC 90 % sup.": [ci.loc[series, f"{c}_hi"] for c in levels.columns],
+            })
+            st.dataframe(table.round(2), use_container_width=True, hide_index=True)
+            st.caption(
+                "Máximos anuales ajustados con GEV y duraciones de los eventos con GPD (L-momentos). "
+                "Intervalos por bootstrap de los años observados."
+            )
+
         # 🔍 Observaciones clave (pegadas a esta última gráfica)
         st.markdown(
             """
@@ -900,6 +1202,19 @@ with tab2:
         )
 
         # ==== 3) Finalmente: Gráfica completa SPEI_12 + tendencia MK (la que antes iba primero) ====
+        # Tendencia del rango de años elegido: consulta sobre la estructura precalculada
+        range_trend = load_range_trend(dataset_version())
+        trend_years = st.slider(
+            "Rango de años de la tendencia",
+            min_value=year_min,
+            max_value=year_max,
+            value=(year_min, year_max),
+            key="trend_years",
+        )
+        rt = range_trend.query_years(*trend_years)
+        rt_times = range_trend.times[(range_trend.times >= rt["start"]) & (range_trend.times <= rt["end"])]
+        rt_line = rt["intercept"] + rt["slope"] * np.arange(rt["n"])
+
         fig_trend = go.Figure()
         fig_trend.update_layout(colorway=PALETTE["colors"])
         fig_trend.add_trace(go.Scatter(
@@ -909,14 +1224,57 @@ with tab2:
             name='SPEI (k=12 meses)'
         ))
         fig_trend.add_trace(go.Scatter(
-            x=df["valid_time"],
-            y=trend_line_y,
+            x=rt_times,
+            y=rt_line,
             mode='lines',
             name='Tendencia Mann-Kendall',
             line=dict(color='red', dash='dash')
         ))
+        robust = load_robust_trends(dataset_version()).set_index("index")
+        if trend_years == (year_min, year_max) and "SPEI_12" in robust.index:
+            # Banda del 90 % de la pendiente (bootstrap por bloques), pivotando en el centro de la recta
+            center = (rt["n"] - 1) / 2.0
+            pivot = rt["intercept"] + rt["slope"] * center
+            k = np.arange(rt["n"]) - center
+            band_lo = pivot + np.minimum(robust.loc["SPEI_12", "slope_lo"] * k, robust.loc["SPEI_12", "slope_hi"] * k)
+            band_hi = pivot + np.maximum(robust.loc["SPEI_12", "slope_lo"] * k, robust.loc["SPEI_12", "slope_hi"] * k)
+            fig_trend.add_trace(go.Scatter(
+                x=np.concatenate([rt_times, rt_times[::-1]]),
+                y=np.concatenate([band_hi, band_lo[::-1]]),
+                fill="toself",
+                fillcolor="rgba(255, 0, 0, 0.12)",
+                line=dict(width=0),
+                hoverinfo="skip",
+                name="IC 90 % de la pendiente (bootstrap por bloques)",
+            ))
+        # Cambios de régimen de SPEI_12: media de cada tramo (segmentación binaria) y punto de Pettitt
+        changes = load_changepoints(dataset_version())
+        changes = changes[changes["index"] == "SPEI_12"]
+        regimes = changes[changes["method"] == "binseg"].sort_values("time")
+        if not regimes.empty:
+            edges = [df["valid_time"].min()] + list(regimes["time"]) + [df["valid_time"].max()]
+            levels = [regimes["mean_before"].iloc[0]] + list(regimes["mean_after"])
+            fig_trend.add_trace(go.Scatter(
+                x=[t for a, b in zip(edges[:-1], edges[1:]) for t in (a, b)],
+                y=[m for m in levels for _ in (0, 1)],
+                mode="lines",
+                name="Media por régimen (segmentación binaria)",
+                line=dict(color="#5F0F40", width=2, dash="dot"),
+            ))
+        for _, cp in changes[changes["method"] == "pettitt"].iterrows():
+            fig_trend.add_vline(x=cp["time"], line_width=1, line_dash="dash", line_color="#0F4C5C")
+            # La anotación va aparte: add_vline no acepta annotation_text sobre ejes de fechas
+            fig_trend.add_annotation(
+                x=cp["time"],
+                y=1,
+                yref="paper",
+                text=f"Pettitt {cp['time']:%Y-%m} (p={cp['p']:.1g})",
+                showarrow=False,
+                xanchor="right",
+            )
+
         fig_trend.update_layout(
-            title='SPEI_12 con Línea de Tendencia Mann-Kendall (serie completa)',
+            title=f'SPEI_12 con Línea de Tendencia Mann-Kendall ({trend_years[0]}–{trend_years[1]})',
             xaxis_title='Año',
             yaxis_title='Valor de SPEI (k=12 meses)',
             hovermode='x unified'
@@ -924,6 +1282,75 @@ with tab2:
         fig_trend.update_xaxes(rangeslider_visible=True)
 
         st.plotly_chart(fig_trend, use_container_width=True)
+        trend_labels = {"increasing": "creciente", "decreasing": "decreciente", "no trend": "sin tendencia"}
+        st.caption(
+            f"Mann-Kendall {trend_years[0]}–{trend_years[1]}: tendencia {trend_labels[rt['trend']]}, "
+            f"p = {rt['p']:.3g}; pendiente de Sen {rt['slope'] * 120:+.3f} SPEI por década."
+        )
+
+        with st.expander("Tendencias considerando la autocorrelación"):
+            st.dataframe(
+                pd.DataFrame({
+                    "Índice": robust.index,
+                    "p (MK original)": robust["p"].to_numpy(),
+                    "p (Hamed–Rao)": robust["p_hamed_rao"].to_numpy(),
+                    "p (pre-blanqueo)": robust["p_prewhitened"].to_numpy(),
+                    "Pendiente / década": robust["slope"].to_numpy() * 120,
+                    "IC 90 % inf.": robust["slope_lo"].to_numpy() * 120,
+                    "IC 90 % sup.": robust["slope_hi"].to_numpy() * 120,
+                }).round(4),
+                use_container_width=True,
+                hide_index=True,
+            )
+            st.caption(
+                "SPI/SPEI de 6 y 12 meses están autocorrelacionados por construcción, así que el test "
+                "original exagera la significancia. Hamed–Rao corrige la varianza de S, el pre-blanqueo "
+                "quita la autocorrelación de rezago 1 y el intervalo de la pendiente sale de remuestrear "
+                "los residuos en bloques de 24 meses."
+            )
+
+        trend_maps = load_trend_maps(trend_maps_version())
+        if trend_maps is not None:
+            with st.expander("¿Dónde se está secando más rápido? (tendencia por píxel)"):
+                map_index = st.selectbox(
+                    "Índice",
+                    options=list(trend_maps["index"].values),
+                    index=list(trend_maps["index"].values).index("SPEI_12") if "SPEI_12" in trend_maps["index"] else 0,
+                    key="trend_map_index",
+                )
+                layer = trend_maps.sel(index=map_index)
+                per_decade = layer["slope"].values * 120
+                limit = float(np.nanmax(np.abs(per_decade))) if np.isfinite(per_decade).any() else 1.0
+                fig_map = go.Figure(go.Heatmap(
+                    x=layer["longitude"].values,
+                    y=layer["latitude"].values,
+                    z=per_decade,
+                    customdata=layer["q"].values,
+                    colorscale="RdBu",
+                    zmin=-limit,
+                    zmax=limit,
+                    colorbar=dict(title="por década"),
+                    hovertemplate="Pendiente: %{z:+.3f}/década<br>q (FDR): %{customdata:.3g}<extra></extra>",
+                ))
+                sig_lat, sig_lon = np.nonzero(layer["significant"].values)
+                fig_map.add_trace(go.Scatter(
+                    x=layer["longitude"].values[sig_lon],
+                    y=layer["latitude"].values[sig_lat],
+                    mode="markers",
+                    marker=dict(symbol="x", color="black", size=8),
+                    name="Significativa (FDR)",
+                ))
+                fig_map.update_layout(
+                    title=f"Pendiente de Sen de {map_index} por celda (hasta {trend_maps.attrs.get('last_month', '')})",
+                    xaxis_title="Longitud",
+                    yaxis_title="Latitud",
+                )
+                st.plotly_chart(fig_map, use_container_width=True)
+                st.caption(
+                    "Mann-Kendall por píxel con corrección de Benjamini–Hochberg "
+                    f"(tasa de falsos descubrimientos {trend_maps.attrs.get('alpha', 0.05):g}). "
+                    "Valores negativos: el índice baja, es decir, la zona se vuelve más seca."
+                )
 
     else:
         st.info("⚠️ Aún no se han calculado los índices SPI/SPEI necesarios para el análisis de tendencias.")
@@ -1032,6 +1459,13 @@ with tab3:
                     )
                     st.caption("Cantidad de agua que cae con la lluvia en el mes.")
 
+                ref_month = st.selectbox(
+                    "Mes de referencia para comparar con lo normal",
+                    options=list(range(1, 13)),
+                    index=int(last_row["date"].month) - 1,
+                    format_func=lambda m: MESES_ES[m].capitalize(),
+                )
+
                 submitted = st.form_submit_button("Calcular probabilidad de sequía")
 
                 if submitted:
@@ -1090,6 +1524,27 @@ with tab3:
                     except Exception as e:
                         st.error(f"Ocurrió un error al generar la predicción: {e}")
 
+                    # ¿Qué tan normales son los valores ingresados para ese mes?
+                    clim, _ = load_climatology(dataset_version())
+                    inputs = dict(zip(
+                        ["t2m", "swvl1", "swvl2", "swvl3", "swvl4", "ssrd", "pev", "e", "tp"],
+                        X_input[0],
+                    ))
+                    st.markdown(f"**Comparación con la climatología de {MESES_ES[ref_month]}**")
+                    st.dataframe(
+                        pd.DataFrame([
+                            {
+                                "Variable": var,
+                                "Valor ingresado": value,
+                                "Media del mes": clim.normal(var, ref_month)["mean"],
+                                "Percentil": clim.percentile(var, ref_month, value),
+                            }
+                            for var, value in inputs.items() if var in clim.columns
+                        ]).round(2),
+                        use_container_width=True,
+                        hide_index=True,
+                    )
+
 # =========================
 # TAB 4: Buzón de reportes
 # =========================
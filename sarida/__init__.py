@@ -0,0 +1,6 @@
+"""
+S-ARIDA: utilidades compartidas entre los notebooks y el dashboard.
+
+Los módulos se importan de forma explícita (``from sarida.store import MonthlyStore``)
+para que el dashboard no cargue xarray/netCDF si no los necesita.
+"""
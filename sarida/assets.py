@@ -0,0 +1,364 @@
+"""
+Descarga de assets del dashboard (dataset y modelo) de forma segura.
+
+- Se escribe a ``<destino>.part`` con buffers grandes y solo al final se renombra
+  con ``os.replace``: un corte nunca deja un archivo truncado en la ruta final.
+- Si ya existe un ``.part`` de un intento anterior, se continúa con
+  ``Range: bytes=N-`` (HTTP) o ``Range`` de ``get_object`` (S3).
+- Si se conoce el SHA-256 esperado, se verifica antes de renombrar.
+- :func:`fetch_all` baja varios assets en paralelo.
+- :class:`AssetCache` guarda las versiones por contenido (SHA-256) y en cada
+  arranque solo revalida con ``If-None-Match``/``head_object``: una petición
+  pequeña por asset y descarga solo si el objeto cambió.
+
+Este módulo no depende de Streamlit: lanza excepciones y ``Dashboard/app.py``
+se encarga de mostrar los mensajes.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+
+class ChecksumError(ValueError):
+    """El archivo descargado no coincide con el SHA-256 esperado."""
+
+
+def sha256_file(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def is_valid(path, sha256=None) -> bool:
+    """El archivo existe y, si se da ``sha256``, su contenido coincide."""
+    path = Path(path)
+    if not path.exists():
+        return False
+    return sha256 is None or sha256_file(path) == sha256.lower()
+
+
+def _finish(part: Path, dest: Path, sha256=None) -> Path:
+    if sha256 is not None:
+        got = sha256_file(part)
+        if got != sha256.lower():
+            part.unlink(missing_ok=True)
+            _etag_file(part).unlink(missing_ok=True)
+            raise ChecksumError(f"SHA-256 de {dest.name} no coincide: {got} != {sha256}")
+    os.replace(part, dest)
+    _etag_file(part).unlink(missing_ok=True)
+    return dest
+
+
+def _etag_file(part: Path) -> Path:
+    # ETag de la versión que se está bajando en ``part`` (para ``If-Range``)
+    return part.with_name(part.name + ".etag")
+
+
+def _range_total(content_range):
+    """Tamaño total de un ``Content-Range`` (``bytes */1234`` o ``bytes 0-9/1234``)."""
+    try:
+        total = content_range.rsplit("/", 1)[1]
+        return None if total == "*" else int(total)
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _stream_http(url: str, part: Path, extra_headers=None, timeout: int = 60, session=None):
+    """
+    Baja ``url`` a ``part`` retomando lo que ya tenga; devuelve ``(status, etag)``.
+
+    Al retomar se manda ``If-Range`` con el ETag del intento anterior: si el
+    archivo cambió en el servidor llega completo (200) en vez de mezclar versiones.
+    Un 304 (con ``If-None-Match`` en ``extra_headers``) no escribe nada. Un 416
+    solo cuenta como completo si ``Content-Range`` (``bytes */total``) coincide
+    con el tamaño del ``.part``; si no, el ``.part`` es de otra versión y se
+    vuelve a bajar desde cero.
+    """
+    import requests
+
+    part.parent.mkdir(parents=True, exist_ok=True)
+    offset = part.stat().st_size if part.exists() else 0
+    headers = {}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        if _etag_file(part).exists():
+            headers["If-Range"] = _etag_file(part).read_text()
+    headers.update(extra_headers or {})
+
+    http = session or requests
+    with http.get(url, stream=True, timeout=timeout, headers=headers) as r:
+        etag = r.headers.get("ETag")
+        if r.status_code == 304:
+            return r.status_code, etag
+        if r.status_code == 416 and offset:
+            if _range_total(r.headers.get("Content-Range")) == offset:
+                return r.status_code, etag
+            # .part más largo o de tamaño desconocido: no se puede confiar en él
+            part.unlink(missing_ok=True)
+            _etag_file(part).unlink(missing_ok=True)
+            return _stream_http(url, part, extra_headers, timeout, session)
+        r.raise_for_status()
+        if etag:
+            _etag_file(part).write_text(etag)
+        # 206 = el servidor aceptó el rango; 200 = hay que empezar de cero
+        mode = "ab" if offset and r.status_code == 206 else "wb"
+        with open(part, mode, buffering=CHUNK_SIZE) as f:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
+        return r.status_code, etag
+
+
+def fetch_http(url: str, dest_path, sha256=None, timeout: int = 60, session=None) -> Path:
+    """Descarga ``url`` a ``dest_path`` retomando un ``.part`` previo si existe."""
+    dest = Path(dest_path)
+    part = dest.with_name(dest.name + ".part")
+    _stream_http(url, part, timeout=timeout, session=session)
+    return _finish(part, dest, sha256)
+
+
+def _s3_client(client=None, **session_kwargs):
+    if client is not None:
+        return client
+    import boto3
+
+    return boto3.client("s3", **session_kwargs)
+
+
+def _stream_s3(client, bucket: str, key: str, part: Path) -> str:
+    """Baja ``s3://bucket/key`` a ``part`` retomando lo que ya tenga; devuelve el ETag."""
+    part.parent.mkdir(parents=True, exist_ok=True)
+    head = client.head_object(Bucket=bucket, Key=key)
+    etag = head["ETag"]
+    offset = part.stat().st_size if part.exists() else 0
+    if offset and (not _etag_file(part).exists() or _etag_file(part).read_text() != etag):
+        # El .part es de otra versión del objeto
+        offset = 0
+    _etag_file(part).write_text(etag)
+    if offset < head["ContentLength"]:
+        kwargs = {"Range": f"bytes={offset}-"} if offset else {}
+        body = client.get_object(Bucket=bucket, Key=key, **kwargs)["Body"]
+        with open(part, "ab" if offset else "wb", buffering=CHUNK_SIZE) as f:
+            for chunk in body.iter_chunks(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+    return etag
+
+
+def fetch_s3(bucket: str, key: str, dest_path, sha256=None, client=None, **session_kwargs) -> Path:
+    """Descarga ``s3://bucket/key`` a ``dest_path`` retomando un ``.part`` previo."""
+    dest = Path(dest_path)
+    part = dest.with_name(dest.name + ".part")
+    _stream_s3(_s3_client(client, **session_kwargs), bucket, key, part)
+    return _finish(part, dest, sha256)
+
+
+def fetch(spec: dict) -> Path:
+    """
+    Descarga un asset descrito por ``spec``.
+
+    ``spec`` tiene ``dest`` y ``sha256`` (opcional), más ``url`` para HTTP o
+    ``bucket``/``key`` (y credenciales opcionales en ``s3``) para S3.
+    """
+    if spec.get("url"):
+        return fetch_http(spec["url"], spec["dest"], sha256=spec.get("sha256"))
+    return fetch_s3(spec["bucket"], spec["key"], spec["dest"], sha256=spec.get("sha256"),
+                    **spec.get("s3", {}))
+
+
+def fetch_all(specs, max_workers: int = 4) -> dict:
+    """
+    Descarga varios assets en paralelo.
+
+    Devuelve ``{dest: None}`` si salió bien o ``{dest: excepción}`` si falló, para
+    que quien llama decida cómo reportarlo.
+    """
+    def _run(spec):
+        try:
+            fetch(spec)
+            return spec["dest"], None
+        except Exception as e:
+            return spec["dest"], e
+
+    if not specs:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(specs))) as pool:
+        return dict(pool.map(_run, specs))
+
+
+def source_key(spec: dict) -> str:
+    """Clave de caché de un asset: su URL o ``s3://bucket/key``."""
+    if spec.get("url"):
+        return spec["url"]
+    return f"s3://{spec['bucket']}/{spec['key']}"
+
+
+class AssetCache:
+    """
+    Caché local direccionada por contenido para los assets del dashboard.
+
+    Estructura en disco::
+
+        root/objects/<sha256>   contenido de cada versión
+        root/staging/           descargas en curso (retomables)
+        root/index.json         fuente -> {sha256, etag}; sha256 -> {size, last_used}
+
+    :meth:`get` revalida contra la fuente con una sola petición (``GET`` con
+    ``If-None-Match`` o ``head_object`` en S3), descarga solo si cambió y deja una
+    copia/enlace en ``dest``. Las versiones viejas se eliminan por LRU cuando el
+    total supera ``max_bytes``.
+    """
+
+    def __init__(self, root, max_bytes: int = 2 * 1024 ** 3):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pinned = set()
+        self.index = self._load_index()
+
+    # ----- índice -----
+    def _load_index(self) -> dict:
+        path = self.root / "index.json"
+        if path.exists():
+            return json.loads(path.read_text(encoding="utf-8"))
+        return {"sources": {}, "objects": {}}
+
+    def _save_index(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / "index.json.tmp"
+        tmp.write_text(json.dumps(self.index, indent=1), encoding="utf-8")
+        os.replace(tmp, self.root / "index.json")
+
+    def _object(self, sha256: str) -> Path:
+        return self.root / "objects" / sha256
+
+    def _touch(self, sha256: str):
+        self.index["objects"].setdefault(sha256, {"size": self._object(sha256).stat().st_size})
+        self.index["objects"][sha256]["last_used"] = time.time()
+        self._pinned.add(sha256)
+
+    # ----- revalidación y descarga -----
+    def _cached(self, key: str):
+        entry = self.index["sources"].get(key)
+        if entry and self._object(entry["sha256"]).exists():
+            return entry
+        return None
+
+    def _store(self, key: str, part: Path, etag, sha256=None) -> str:
+        digest = sha256_file(part)
+        if sha256 is not None and digest != sha256.lower():
+            part.unlink(missing_ok=True)
+            _etag_file(part).unlink(missing_ok=True)
+            raise ChecksumError(f"SHA-256 de {key} no coincide: {digest} != {sha256}")
+        obj = self._object(digest)
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(part, obj)
+        _etag_file(part).unlink(missing_ok=True)
+        with self._lock:
+            self.index["sources"][key] = {"sha256": digest, "etag": etag}
+            self._touch(digest)
+            self._save_index()
+        return digest
+
+    def revalidate(self, spec: dict):
+        """
+        Asegura que la caché tenga la versión actual de ``spec``.
+
+        Devuelve ``(sha256, cambió)``.
+        """
+        key = source_key(spec)
+        part = self.root / "staging" / hashlib.sha1(key.encode()).hexdigest()
+        entry = self._cached(key)
+
+        if spec.get("url"):
+            headers = {"If-None-Match": entry["etag"]} if entry and entry.get("etag") else None
+            status, etag = _stream_http(spec["url"], part, extra_headers=headers)
+            if status == 304:
+                part.unlink(missing_ok=True)
+                _etag_file(part).unlink(missing_ok=True)
+                with self._lock:
+                    self._touch(entry["sha256"])
+                return entry["sha256"], False
+        else:
+            client = _s3_client(**spec.get("s3", {}))
+            if entry and entry.get("etag"):
+                head = client.head_object(Bucket=spec["bucket"], Key=spec["key"])
+                if head["ETag"] == entry["etag"]:
+                    with self._lock:
+                        self._touch(entry["sha256"])
+                    return entry["sha256"], False
+            etag = _stream_s3(client, spec["bucket"], spec["key"], part)
+
+        digest = self._store(key, part, etag, sha256=spec.get("sha256"))
+        return digest, entry is None or entry["sha256"] != digest
+
+    def materialize(self, sha256: str, dest) -> Path:
+        """Deja el objeto en ``dest`` (enlace duro si se puede, si no copia)."""
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        obj = self._object(sha256)
+        if dest.exists() and os.path.samefile(dest, obj):
+            return dest
+        tmp = dest.with_name(dest.name + ".tmp")
+        tmp.unlink(missing_ok=True)
+        try:
+            os.link(obj, tmp)
+        except OSError:
+            shutil.copy2(obj, tmp)
+        os.replace(tmp, dest)
+        return dest
+
+    def get(self, spec: dict):
+        """Revalida ``spec`` y lo deja en ``spec["dest"]``; devuelve si cambió."""
+        digest, changed = self.revalidate(spec)
+        self.materialize(digest, spec["dest"])
+        return changed
+
+    # ----- expulsión -----
+    def evict(self) -> list:
+        """Elimina versiones por LRU hasta quedar bajo ``max_bytes``."""
+        with self._lock:
+            objects = self.index["objects"]
+            total = sum(o["size"] for o in objects.values())
+            removed = []
+            for sha in sorted(objects, key=lambda s: objects[s].get("last_used", 0)):
+                if total <= self.max_bytes:
+                    break
+                if sha in self._pinned:
+                    continue
+                self._object(sha).unlink(missing_ok=True)
+                total -= objects.pop(sha)["size"]
+                removed.append(sha)
+            self.index["sources"] = {
+                k: v for k, v in self.index["sources"].items() if v["sha256"] in objects
+            }
+            self._save_index()
+        return removed
+
+    def fetch_all(self, specs, max_workers: int = 4) -> dict:
+        """
+        Revalida y materializa varios assets en paralelo y luego aplica la LRU.
+
+        Devuelve ``{dest: True/False}`` (si se descargó una versión nueva) o
+        ``{dest: excepción}`` si falló.
+        """
+        def _run(spec):
+            try:
+                return spec["dest"], self.get(spec)
+            except Exception as e:
+                return spec["dest"], e
+
+        if not specs:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(specs))) as pool:
+            results = dict(pool.map(_run, specs))
+        self.evict()
+        return results
@@ -0,0 +1,312 @@
+"""
+Corrección de sesgo de la precipitación ERA5-Land con estaciones (mapeo de cuantiles).
+
+ERA5-Land tiene sesgos conocidos sobre la costa de La Guajira. Esta etapa:
+
+1. Lee CSV de estaciones con el formato de descarga de IDEAM/DHIME
+   (``CodigoEstacion``, ``Latitud``, ``Longitud``, ``Fecha``, ``Valor`` con la
+   lluvia diaria en mm) y arma series mensuales en unidades ERA5 (m/día).
+2. Ajusta, por mes calendario y por estación (o por la caja completa), un mapa
+   empírico de cuantiles ERA5 → estación con los meses en que ambos tienen dato.
+   Todas las estaciones y meses salen de un ``nanquantile`` vectorizado.
+3. Aplica los mapas a toda la serie (o a cada celda del cubo, con la estación
+   más cercana) con una interpolación por filas en NumPy, sin bucles por valor.
+
+Las tablas de cuantiles se guardan en un ``.npz`` junto con la huella (SHA-256)
+de los CSV de estaciones: mientras no lleguen datos nuevos se reutilizan y
+corregir la serie cuesta una interpolación.
+"""
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from sarida.era5 import TIME_DIM
+
+# Niveles de probabilidad de la tabla de cuantiles
+N_QUANTILES = 51
+# Años mínimos con dato en ERA5 y estación para ajustar un mes calendario
+MIN_YEARS = 8
+# Fracción mínima de días con dato para aceptar un mes de estación
+MIN_DAYS_FRACTION = 0.8
+
+_COLUMNS = {
+    "codigoestacion": "station",
+    "latitud": "lat",
+    "longitud": "lon",
+    "fecha": "date",
+    "valor": "value",
+}
+
+
+def read_station_csvs(paths) -> pd.DataFrame:
+    """
+    Lee uno o varios CSV de estaciones (o una carpeta) en formato IDEAM.
+
+    Devuelve un DataFrame diario con ``station``, ``lat``, ``lon``, ``date`` y
+    ``value`` (mm/día).
+    """
+    paths = _station_files(paths)
+    frames = []
+    for path in paths:
+        raw = pd.read_csv(path, sep=None, engine="python", encoding="utf-8-sig")
+        raw = raw.rename(columns={c: _COLUMNS[c.strip().lower()] for c in raw.columns
+                                  if c.strip().lower() in _COLUMNS})
+        missing = {"station", "date", "value"} - set(raw.columns)
+        if missing:
+            raise ValueError(f"{path}: faltan las columnas {sorted(missing)}")
+        frames.append(raw[[c for c in ("station", "lat", "lon", "date", "value") if c in raw]])
+    daily = pd.concat(frames, ignore_index=True)
+    daily["station"] = daily["station"].astype(str)
+    daily["date"] = pd.to_datetime(daily["date"]).dt.normalize()
+    daily["value"] = pd.to_numeric(daily["value"], errors="coerce")
+    return daily.drop_duplicates(["station", "date"], keep="last")
+
+
+def _station_files(paths) -> list:
+    if isinstance(paths, (str, bytes)) or hasattr(paths, "__fspath__"):
+        paths = [paths]
+    files = []
+    for p in map(Path, paths):
+        files += sorted(p.glob("*.csv")) if p.is_dir() else [p]
+    return files
+
+
+def stations_fingerprint(paths) -> str:
+    """Huella de los CSV de estaciones: cambia solo si llega información nueva."""
+    from sarida.assets import sha256_file
+
+    h = hashlib.sha256()
+    for f in _station_files(paths):
+        h.update(f.name.encode())
+        h.update(sha256_file(f).encode())
+    return h.hexdigest()
+
+
+def station_monthly(daily: pd.DataFrame):
+    """
+    Series mensuales por estación en unidades ERA5 (m/día, promedio del mes).
+
+    Los meses con menos de ``MIN_DAYS_FRACTION`` de días válidos quedan en NaN.
+    Devuelve ``(wide, meta)``: ``wide`` con índice ``valid_time`` y una columna
+    por estación, y ``meta`` con ``lat``/``lon`` por estación.
+    """
+    month = daily["date"].dt.to_period("M").dt.to_timestamp()
+    grouped = daily.assign(**{TIME_DIM: month}).groupby(["station", TIME_DIM])["value"]
+    stats = grouped.agg(["mean", "count"]).reset_index()
+    days = stats[TIME_DIM].dt.days_in_month
+    stats.loc[stats["count"] < MIN_DAYS_FRACTION * days, "mean"] = np.nan
+    wide = stats.pivot(index=TIME_DIM, columns="station", values="mean") / 1000.0
+    wide = wide.asfreq("MS")
+
+    coords = [c for c in ("lat", "lon") if c in daily]
+    meta = daily.groupby("station")[coords].first() if coords else pd.DataFrame(index=wide.columns)
+    return wide, meta.reindex(wide.columns)
+
+
+class QuantileMaps:
+    """
+    Tablas de cuantiles ERA5 y observados por (serie, mes calendario).
+
+    ``q_model`` y ``q_obs`` tienen forma ``(series, 12, N_QUANTILES)``; una fila
+    con NaN (pocos años de traslape) deja los valores sin corregir. ``lat`` y
+    ``lon`` son la posición de cada serie cuando los mapas son por estación.
+    """
+
+    def __init__(self, q_model: np.ndarray, q_obs: np.ndarray, names=None, fingerprint: str = "",
+                 lat=None, lon=None):
+        self.q_model = q_model
+        self.q_obs = q_obs
+        self.names = list(names) if names is not None else list(range(q_model.shape[0]))
+        self.fingerprint = fingerprint
+        self.lat = None if lat is None else np.asarray(lat, dtype=float)
+        self.lon = None if lon is None else np.asarray(lon, dtype=float)
+
+    @classmethod
+    def fit(cls, model: np.ndarray, obs: np.ndarray, months: np.ndarray, names=None,
+            n_quantiles: int = N_QUANTILES, fingerprint: str = "", lat=None, lon=None) -> "QuantileMaps":
+        """
+        Ajusta los mapas para ``model`` y ``obs`` de forma ``(series, tiempo)``.
+
+        Solo se usan los pares donde ambos tienen dato, así el mapa compara las
+        mismas fechas.
+        """
+        model = np.atleast_2d(np.asarray(model, dtype=float))
+        obs = np.atleast_2d(np.asarray(obs, dtype=float))
+        months = np.asarray(months)
+        probs = np.linspace(0, 1, n_quantiles)
+        paired = np.isfinite(model) & np.isfinite(obs)
+        model = np.where(paired, model, np.nan)
+        obs = np.where(paired, obs, np.nan)
+
+        shape = (model.shape[0], 12, n_quantiles)
+        q_model, q_obs = np.full(shape, np.nan), np.full(shape, np.nan)
+        for m in range(1, 13):
+            sel = months == m
+            enough = paired[:, sel].sum(axis=1) >= MIN_YEARS
+            if not enough.any():
+                continue
+            q_model[enough, m - 1] = np.nanquantile(model[enough][:, sel], probs, axis=1).T
+            q_obs[enough, m - 1] = np.nanquantile(obs[enough][:, sel], probs, axis=1).T
+        return cls(q_model, q_obs, names=names, fingerprint=fingerprint, lat=lat, lon=lon)
+
+    def apply(self, values: np.ndarray, months: np.ndarray, series=None) -> np.ndarray:
+        """
+        Corrige ``values`` de forma ``(n, tiempo)``.
+
+        ``series`` indica qué mapa usar para cada una de las ``n`` filas (por
+        defecto, la fila i usa el mapa i).
+        """
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        n, t = values.shape
+        series = np.arange(n) if series is None else np.asarray(series)
+        months = np.asarray(months)
+        rows = (series[:, None] * 12 + (months[None, :] - 1)).ravel()
+        n_q = self.q_model.shape[-1]
+        out = _interp_rows(
+            values.ravel(), rows,
+            self.q_model.reshape(-1, n_q), self.q_obs.reshape(-1, n_q),
+        )
+        return out.reshape(n, t)
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        extra = {} if self.lat is None else {"lat": self.lat, "lon": self.lon}
+        np.savez_compressed(
+            path, q_model=self.q_model, q_obs=self.q_obs,
+            names=np.array(json.dumps([str(x) for x in self.names])),
+            fingerprint=np.array(self.fingerprint), **extra,
+        )
+
+    @classmethod
+    def load(cls, path) -> "QuantileMaps":
+        with np.load(path) as data:
+            return cls(data["q_model"], data["q_obs"], names=json.loads(str(data["names"])),
+                       fingerprint=str(data["fingerprint"]),
+                       lat=data["lat"] if "lat" in data else None,
+                       lon=data["lon"] if "lon" in data else None)
+
+
+def _interp_rows(x: np.ndarray, rows: np.ndarray, xp: np.ndarray, fp: np.ndarray) -> np.ndarray:
+    """
+    ``np.interp`` de cada ``x[i]`` con la tabla ``xp[rows[i]] -> fp[rows[i]]``.
+
+    Las tablas se vuelven una sola secuencia creciente sumando un desplazamiento
+    por fila, así que basta un ``searchsorted``. Fuera del rango de la tabla se
+    escala por el cociente del extremo (la lluvia es multiplicativa).
+    """
+    out = x.copy()
+    ok_rows = np.isfinite(xp).all(axis=1) & np.isfinite(fp).all(axis=1)
+    use = np.isfinite(x) & ok_rows[rows]
+    if not use.any():
+        return out
+    x, r = x[use], rows[use]
+    n_q = xp.shape[1]
+
+    span = np.nanmax(xp[ok_rows]) - np.nanmin(xp[ok_rows]) + 1.0
+    offset = np.arange(xp.shape[0])[:, None] * span
+    lo, hi = xp[r, 0], xp[r, -1]
+    xc = np.clip(x, lo, hi)
+    base = np.nanmin(xp[ok_rows])
+    flat = (np.where(ok_rows[:, None], xp, base) + offset).ravel()
+    pos = np.searchsorted(flat, xc + offset[r, 0], side="right") - 1 - r * n_q
+    pos = np.clip(pos, 0, n_q - 2)
+
+    x0, x1 = xp[r, pos], xp[r, pos + 1]
+    y0, y1 = fp[r, pos], fp[r, pos + 1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        w = np.where(x1 > x0, (xc - x0) / (x1 - x0), 1.0)
+        y = y0 + w * (y1 - y0)
+        above = np.where(hi > 0, x * fp[r, -1] / hi, fp[r, -1])
+        below = np.where(lo > 0, x * fp[r, 0] / lo, fp[r, 0])
+    y = np.where(x > hi, above, np.where(x < lo, below, y))
+    out[use] = np.maximum(y, 0.0)
+    return out
+
+
+def _nearest(lat_grid, lon_grid, lat, lon) -> np.ndarray:
+    """Índice de la estación más cercana a cada punto (aproximación plana)."""
+    d2 = (lat_grid[:, None] - lat[None, :]) ** 2 + (
+        (lon_grid[:, None] - lon[None, :]) * np.cos(np.deg2rad(lat_grid[:, None]))
+    ) ** 2
+    return d2.argmin(axis=1)
+
+
+def fit_series_maps(df: pd.DataFrame, stations, cache_dir=None, col: str = "tp") -> QuantileMaps:
+    """
+    Mapa de cuantiles para la serie de la caja (``df`` en unidades ERA5).
+
+    La referencia observada es el promedio de las estaciones disponibles cada
+    mes. Con ``cache_dir`` los mapas se reutilizan mientras los CSV no cambien.
+    """
+    fingerprint = stations_fingerprint(stations)
+    cache = Path(cache_dir) / "qm_serie.npz" if cache_dir else None
+    if cache is not None and cache.exists():
+        maps = QuantileMaps.load(cache)
+        if maps.fingerprint == fingerprint:
+            return maps
+
+    wide, _ = station_monthly(read_station_csvs(stations))
+    times = pd.DatetimeIndex(df[TIME_DIM])
+    obs = wide.mean(axis=1).reindex(times).to_numpy()
+    maps = QuantileMaps.fit(df[col].to_numpy(), obs, times.month, names=["caja"],
+                            fingerprint=fingerprint)
+    if cache is not None:
+        maps.save(cache)
+    return maps
+
+
+def correct_series(df: pd.DataFrame, maps: QuantileMaps, col: str = "tp",
+                   keep_original: bool = True) -> pd.DataFrame:
+    """Devuelve ``df`` con ``col`` corregida (y el original en ``{col}_era5``)."""
+    out = df.copy()
+    months = pd.DatetimeIndex(out[TIME_DIM]).month
+    if keep_original:
+        out[f"{col}_era5"] = out[col]
+    out[col] = maps.apply(out[col].to_numpy(), months)[0]
+    return out
+
+
+def fit_grid_maps(da, stations, cache_dir=None) -> QuantileMaps:
+    """Mapas por estación contra su celda más cercana del cubo ``da`` (``tp``)."""
+    fingerprint = stations_fingerprint(stations)
+    cache = Path(cache_dir) / "qm_estaciones.npz" if cache_dir else None
+    if cache is not None and cache.exists():
+        maps = QuantileMaps.load(cache)
+        if maps.fingerprint == fingerprint:
+            return maps
+
+    wide, meta = station_monthly(read_station_csvs(stations))
+    meta = meta.dropna(subset=["lat", "lon"])
+    wide = wide[meta.index]
+    times = pd.DatetimeIndex(da[TIME_DIM].values)
+    cells = da.sel(
+        latitude=_xr_points(meta["lat"]), longitude=_xr_points(meta["lon"]), method="nearest",
+    ).transpose("station", TIME_DIM)
+    obs = wide.reindex(times).to_numpy().T
+    maps = QuantileMaps.fit(cells.values, obs, times.month, names=list(meta.index),
+                            fingerprint=fingerprint, lat=meta["lat"], lon=meta["lon"])
+    if cache is not None:
+        maps.save(cache)
+    return maps
+
+
+def _xr_points(values):
+    import xarray as xr
+
+    return xr.DataArray(np.asarray(values, dtype=float), dims="station")
+
+
+def correct_grid(da, maps: QuantileMaps):
+    """Corrige cada celda de ``da`` (tiempo × lat × lon) con su estación más cercana."""
+    da = da.transpose(TIME_DIM, "latitude", "longitude")
+    lat2d, lon2d = np.meshgrid(da["latitude"].values, da["longitude"].values, indexing="ij")
+    nearest = _nearest(lat2d.ravel(), lon2d.ravel(), maps.lat, maps.lon)
+    months = pd.DatetimeIndex(da[TIME_DIM].values).month
+    n_t = da.sizes[TIME_DIM]
+    values = da.values.reshape(n_t, -1).T
+    corrected = maps.apply(values, months, series=nearest).T.reshape(da.shape)
+    return da.copy(data=corrected)
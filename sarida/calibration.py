@@ -0,0 +1,177 @@
+"""
+SPI/SPEI con calibración fija e indices persistidos.
+
+Ajustar las distribuciones con toda la serie en cada corrida hace que los índices de
+meses pasados cambien cada vez que entra un mes nuevo. Aquí las distribuciones
+se ajustan una sola vez sobre un periodo de calibración (por defecto
+1991–2020, la normal climatológica de la OMM) y se guardan junto a los índices::
+
+    root/
+      calibracion.json   # ventanas, periodo y parámetros por mes calendario
+      indices.parquet    # SPI_k / SPEI_k ya calculados, una fila por mes
+
+El SPI se calibra con la gamma de 2 parámetros (``loc = 0``, ``SPI_FLOC``), la
+del SPI estándar de McKee. La gamma de 3 parámetros de xclim pone ``loc`` justo
+debajo del mínimo de la muestra: con toda la serie ningún mes queda por debajo,
+pero con un periodo fijo los meses más secos que la calibración caen fuera del
+soporte y el índice se iba a la cota −8.21. La lluvia nunca es negativa, así que
+``loc = 0`` cubre cualquier mes futuro. El SPEI (balance hídrico, que sí es
+negativo) usa la log-logística por L-momentos de :func:`sarida.indices.fit_glo`:
+su cota no depende del mínimo de la muestra, así que los meses más secos del
+periodo (o de después) no quedan pegados a ella.
+
+Agregar un mes solo necesita sus medias móviles (los últimos ``max(windows)``
+meses de la serie) y la transformación con los parámetros guardados; las filas
+que ya estaban no se vuelven a escribir. Cambiar la calibración es una
+operación aparte, :meth:`IndexStore.recalibrate`, que reajusta y recalcula toda
+la serie.
+"""
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from sarida.era5 import TIME_DIM
+from sarida.indices import WINDOWS, indices_frame, spi_spei
+
+DEFAULT_PERIOD = ("1991-01", "2020-12")
+CALIB_FILE = "calibracion.json"
+INDEX_FILE = "indices.parquet"
+PARAM_KEYS = ("a", "loc", "scale", "p0", "glo")
+SPI_FLOC = 0.0
+
+
+class Calibration:
+    """
+    Parámetros por ventana × (SPI, SPEI) × mes calendario.
+
+    ``params`` tiene el formato de :func:`sarida.indices.fit_params` (arreglos
+    ``(2 × len(windows), 12)`` en el orden de :func:`~sarida.indices.spi_spei`).
+    """
+
+    def __init__(self, params: dict, windows=WINDOWS, period=DEFAULT_PERIOD, fitted_at=None):
+        self.params = {k: np.asarray(params[k], dtype=float) for k in PARAM_KEYS}
+        self.windows = tuple(int(w) for w in windows)
+        self.period = tuple(str(p) for p in period)
+        self.fitted_at = fitted_at
+
+    @classmethod
+    def fit(cls, pr, pet, times, windows=WINDOWS, period=DEFAULT_PERIOD) -> "Calibration":
+        """Ajusta las distribuciones con los meses de ``times`` dentro de ``period``."""
+        times = pd.DatetimeIndex(times)
+        start, end = (pd.Period(p, freq="M") for p in period)
+        in_period = (times.to_period("M") >= start) & (times.to_period("M") <= end)
+        if not in_period.any():
+            raise ValueError(f"La serie no tiene meses dentro del periodo de calibración {period}.")
+        _, _, params = spi_spei(pr, pet, times.month, windows, fit_mask=in_period, spi_floc=SPI_FLOC)
+        return cls(params, windows, period, fitted_at=pd.Timestamp.now().isoformat(timespec="seconds"))
+
+    def indices(self, pr, pet, times) -> pd.DataFrame:
+        """``SPI_k``/``SPEI_k`` de la serie completa con los parámetros guardados."""
+        return indices_frame(pr, pet, times, self.windows, params=self.params)
+
+    # ----- persistencia -----
+    def to_dict(self) -> dict:
+        def clean(row):
+            return [None if not np.isfinite(x) else float(x) for x in row]
+
+        return {
+            "windows": list(self.windows),
+            "period": list(self.period),
+            "fitted_at": self.fitted_at,
+            "params": {k: [clean(row) for row in self.params[k]] for k in PARAM_KEYS},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Calibration":
+        params = {
+            k: [[np.nan if x is None else x for x in row] for row in data["params"][k]]
+            for k in PARAM_KEYS if k in data["params"]
+        }
+        # Calibraciones anteriores a la log-logística: todas las filas son gamma
+        params.setdefault("glo", np.zeros_like(np.asarray(params["a"], dtype=float)))
+        return cls(params, data["windows"], data["period"], data.get("fitted_at"))
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self.to_dict(), indent=1), encoding="utf-8")
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path) -> "Calibration":
+        return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+
+
+class IndexStore:
+    """Carpeta con la calibración y los índices ya calculados."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.calib_path = self.root / CALIB_FILE
+        self.index_path = self.root / INDEX_FILE
+
+    def calibration(self):
+        """La calibración guardada, o ``None`` si todavía no hay."""
+        return Calibration.load(self.calib_path) if self.calib_path.exists() else None
+
+    def read(self) -> pd.DataFrame:
+        """Índices guardados, indexados por ``valid_time``."""
+        if not self.index_path.exists():
+            return pd.DataFrame(index=pd.DatetimeIndex([], name=TIME_DIM))
+        return pd.read_parquet(self.index_path)
+
+    def _write(self, df: pd.DataFrame):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_suffix(".parquet.tmp")
+        df.sort_index().to_parquet(tmp)
+        os.replace(tmp, self.index_path)
+
+    def recalibrate(self, pr, pet, times, windows=None, period=None) -> pd.DataFrame:
+        """
+        Reajusta las distribuciones y recalcula todos los índices.
+
+        Es la única operación que cambia valores ya publicados. Si no se dan
+        ``windows`` o ``period`` se conservan los de la calibración anterior.
+        """
+        old = self.calibration()
+        windows = windows or (old.windows if old else WINDOWS)
+        period = period or (old.period if old else DEFAULT_PERIOD)
+        calib = Calibration.fit(pr, pet, times, windows, period)
+        out = calib.indices(pr, pet, times)
+        calib.save(self.calib_path)
+        self._write(out)
+        return out
+
+    def update(self, pr, pet, times) -> pd.DataFrame:
+        """
+        Agrega los meses de ``times`` que todavía no tienen índice.
+
+        ``pr``/``pet``/``times`` son la serie mensual completa y continua (como
+        la que sale del almacén); solo se usan los últimos ``max(windows) - 1``
+        meses anteriores a cada mes nuevo. La primera vez (sin calibración), o
+        si la calibración guardada tiene el SPEI con la gamma de 3 parámetros,
+        equivale a :meth:`recalibrate`. Devuelve todos los índices.
+        """
+        calib = self.calibration()
+        if calib is None or not calib.params["glo"].any():
+            return self.recalibrate(pr, pet, times)
+
+        times = pd.DatetimeIndex(times)
+        done = self.read()
+        new = np.flatnonzero(~times.isin(done.index))
+        if new.size == 0:
+            return done
+
+        # Contexto justo para las medias móviles del primer mes nuevo
+        start = max(new[0] - (max(calib.windows) - 1), 0)
+        pr = np.asarray(pr, dtype=float)[start:]
+        pet = np.asarray(pet, dtype=float)[start:]
+        added = calib.indices(pr, pet, times[start:]).iloc[new - start]
+
+        out = pd.concat([done, added]) if len(done) else added
+        self._write(out)
+        return out.sort_index()
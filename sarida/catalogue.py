@@ -0,0 +1,175 @@
+"""
+Catálogo de índices de sequía calculados en una sola pasada.
+
+Además de SPI/SPEI (con la ``pev`` de ERA5) el dataset trae ``swvl1``–``swvl4``,
+``t2m`` y ``ssrd``. Con ellos el catálogo arma:
+
+- ``SPEI_HAR_k``: SPEI con la ETP de Hargreaves por radiación (temperatura y
+  radiación solar).
+- ``SPEI_MAK_k``: SPEI con la ETP de Makkink, la forma radiativa de
+  Penman–Monteith (FAO-56 sin viento ni humedad, que ERA5-Land mensual no trae
+  en este dataset).
+- ``SSMI_swvlN``: índice estandarizado de humedad del suelo por capa.
+- ``PCT_*``: percentil (0–100) respecto del mismo mes calendario.
+
+:func:`catalogue_frame` reúne las series base que pide el catálogo, saca todas
+las medias móviles de una sola suma acumulada y hace un único ajuste por lote
+para los índices paramétricos (gamma para el SPI, log-logística para los SPEI)
+y un único cálculo de rangos para los empíricos. Agregar una entrada a :data:`CATALOGUE` agrega filas a esos lotes, no
+otra pasada sobre los datos.
+
+Las columnas de entrada están en las unidades de ``dataset_clima.parquet``
+(``t2m`` en °C, ``swvl*`` en %, ``tp``/``pev`` en mm/mes y ``ssrd`` en W/m²).
+"""
+import numpy as np
+import pandas as pd
+from scipy import special
+
+from sarida.calibration import DEFAULT_PERIOD, SPI_FLOC
+from sarida.era5 import TIME_DIM, VALUE_COLS
+from sarida.indices import DAYS, SI_BOUND, WINDOWS, fit_params, rolling_means, standardize
+
+# Constantes FAO-56
+LAMBDA = 2.45      # calor latente de vaporización (MJ/kg)
+GAMMA = 0.0665     # constante psicrométrica a nivel del mar (kPa/°C)
+
+# Posiciones de Gringorten para la probabilidad empírica
+_GRINGORTEN_A = 0.44
+
+
+def radiation_mj(ssrd_wm2):
+    """Radiación solar diaria (MJ/m²/día) desde el promedio en W/m²."""
+    return np.asarray(ssrd_wm2, dtype=float) * 86400.0 / 1e6
+
+
+def pet_hargreaves(t2m_c, ssrd_wm2):
+    """ETP de Hargreaves (1975) por radiación, en mm/mes (``DAYS`` días)."""
+    t = np.asarray(t2m_c, dtype=float)
+    rs_mm = radiation_mj(ssrd_wm2) / LAMBDA
+    return np.clip(0.0135 * (t + 17.8) * rs_mm, 0, None) * DAYS
+
+
+def pet_makkink(t2m_c, ssrd_wm2):
+    """ETP de Makkink (término radiativo de Penman–Monteith), en mm/mes."""
+    t = np.asarray(t2m_c, dtype=float)
+    es = 0.6108 * np.exp(17.27 * t / (t + 237.3))
+    delta = 4098.0 * es / (t + 237.3) ** 2
+    pet = 0.61 * delta / (delta + GAMMA) * radiation_mj(ssrd_wm2) / LAMBDA - 0.12
+    return np.clip(pet, 0, None) * DAYS
+
+
+# Series base: nombre -> función de las columnas (float64, unidades del dataset)
+BASES = {
+    "pr": lambda v: v["tp"],
+    "wb": lambda v: v["tp"] - v["pev"],
+    "wb_har": lambda v: v["tp"] - pet_hargreaves(v["t2m"], v["ssrd"]),
+    "wb_mak": lambda v: v["tp"] - pet_makkink(v["t2m"], v["ssrd"]),
+    **{f"swvl{i}": (lambda v, i=i: v[f"swvl{i}"]) for i in range(1, 5)},
+}
+
+# Entrada del catálogo -> serie base, ventanas (None = valor del mes, sin
+# sufijo) y método: "gamma" (con ``zero`` para inflación de ceros y ``floc``
+# para fijar el ``loc``), "glo" (log-logística por L-momentos, la del SPEI),
+# "empirical" (normal estándar) o "percentile" (0–100).
+CATALOGUE = {
+    "SPI": {"base": "pr", "windows": WINDOWS, "method": "gamma", "zero": True, "floc": SPI_FLOC},
+    "SPEI": {"base": "wb", "windows": WINDOWS, "method": "glo"},
+    "SPEI_HAR": {"base": "wb_har", "windows": WINDOWS, "method": "glo"},
+    "SPEI_MAK": {"base": "wb_mak", "windows": WINDOWS, "method": "glo"},
+    **{f"SSMI_swvl{i}": {"base": f"swvl{i}", "windows": None, "method": "empirical"}
+       for i in range(1, 5)},
+    "PCT_tp": {"base": "pr", "windows": (1, 3), "method": "percentile"},
+    "PCT_swvl1": {"base": "swvl1", "windows": None, "method": "percentile"},
+}
+
+
+def _expand(catalogue: dict) -> list:
+    """``(columna, base, ventana, método, ceros, loc fijo)`` por cada columna de salida."""
+    cols = []
+    for name, spec in catalogue.items():
+        windows = spec.get("windows")
+        for k in (windows or (1,)):
+            col = name if windows is None else f"{name}_{k}"
+            cols.append((col, spec["base"], int(k), spec["method"], bool(spec.get("zero", False)),
+                         spec.get("floc", np.nan)))
+    return cols
+
+
+def empirical_prob(series: np.ndarray, months, fit_mask=None) -> np.ndarray:
+    """
+    Probabilidad empírica (Gringorten) de cada valor frente a su mes calendario.
+
+    ``series`` es ``(series, tiempo)``; la muestra de referencia son los meses
+    con ``fit_mask``. Los empates cuentan a la mitad.
+    """
+    months = np.asarray(months)
+    fit_mask = np.ones(months.shape, dtype=bool) if fit_mask is None else np.asarray(fit_mask)
+    prob = np.full(series.shape, np.nan)
+    for m in range(1, 13):
+        sel = months == m
+        x = series[:, sel][:, :, None]                    # (S, años, 1)
+        ref = series[:, sel & fit_mask][:, None, :]       # (S, 1, años de referencia)
+        n = np.isfinite(ref).sum(axis=2)
+        rank = (ref < x).sum(axis=2) + ((ref == x).sum(axis=2) + 1) / 2
+        with np.errstate(invalid="ignore", divide="ignore"):
+            p = (rank - _GRINGORTEN_A) / (n + 1 - 2 * _GRINGORTEN_A)
+        prob[:, sel] = np.where(np.isfinite(x[:, :, 0]) & (n > 0), p, np.nan)
+    return prob
+
+
+def catalogue_frame(df: pd.DataFrame, catalogue=None, period=DEFAULT_PERIOD,
+                    time_col: str = TIME_DIM) -> pd.DataFrame:
+    """
+    Todas las columnas del catálogo indexadas por ``time_col``.
+
+    ``df`` es la serie mensual continua en unidades del dataset. Las
+    distribuciones se calibran en ``period`` (``None`` = toda la serie), igual
+    que :class:`sarida.calibration.IndexStore`.
+    """
+    catalogue = CATALOGUE if catalogue is None else catalogue
+    df = df.sort_values(time_col)
+    times = pd.DatetimeIndex(df[time_col])
+    cols = _expand(catalogue)
+
+    # Series base y ventanas únicas: una sola suma acumulada para todo
+    bases = list(dict.fromkeys(c[1] for c in cols))
+    windows = sorted({c[2] for c in cols})
+    values = {c: df[c].to_numpy(dtype=float) for c in VALUE_COLS if c in df.columns}
+    stack = np.stack([BASES[b](values) for b in bases])
+    rolled = rolling_means(stack, windows)                   # (W, B, T)
+
+    if period is None:
+        fit_mask = np.ones(len(times), dtype=bool)
+    else:
+        start, end = (pd.Period(p, freq="M") for p in period)
+        fit_mask = np.asarray((times.to_period("M") >= start) & (times.to_period("M") <= end))
+
+    def row(col):
+        return rolled[windows.index(col[2]), bases.index(col[1])]
+
+    out = {}
+    # Índices paramétricos: un ajuste por lote para todas las filas
+    parametric = [c for c in cols if c[3] in ("gamma", "glo")]
+    if parametric:
+        series = np.stack([row(c) for c in parametric])
+        zero = np.array([c[4] for c in parametric])
+        floc = np.array([c[5] for c in parametric], dtype=float)
+        glo = np.array([c[3] == "glo" for c in parametric])
+        params = fit_params(np.where(fit_mask, series, np.nan), times.month, zero, floc, glo)
+        si = standardize(series, times.month, params)
+        out.update({c[0]: si[i] for i, c in enumerate(parametric)})
+
+    # Índices empíricos: un cálculo de rangos por serie/ventana distinta
+    empirical = [c for c in cols if c[3] in ("empirical", "percentile")]
+    if empirical:
+        keys = list(dict.fromkeys((c[1], c[2]) for c in empirical))
+        series = np.stack([rolled[windows.index(k), bases.index(b)] for b, k in keys])
+        prob = empirical_prob(series, times.month, fit_mask)
+        for c in empirical:
+            p = prob[keys.index((c[1], c[2]))]
+            if c[3] == "percentile":
+                out[c[0]] = 100 * p
+            else:
+                out[c[0]] = np.clip(special.ndtri(p), -SI_BOUND, SI_BOUND)
+
+    return pd.DataFrame({c[0]: out[c[0]] for c in cols}, index=pd.Index(times, name=TIME_DIM))
@@ -0,0 +1,77 @@
+"""
+Sustituto local del cliente CDS para pruebas sin red.
+
+Sirve recortes de un NetCDF existente (por ejemplo ``Dashboard/data_stream-moda.nc``)
+con la misma interfaz que ``cdsapi.Client().retrieve(dataset, request).download(target)``
+y registra cada petición y los bytes entregados, para comprobar que una
+actualización mensual solo pide lo que falta.
+"""
+import threading
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from sarida.era5 import SHORT_NAMES
+
+
+class _LocalResult:
+    def __init__(self, client, ds):
+        self._client = client
+        self._ds = ds
+
+    def download(self, target=None):
+        target = Path(target or "download.nc")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # La librería netCDF no es segura entre hilos; el CDS real solo envía bytes
+        with self._client.lock:
+            self._ds.to_netcdf(target, engine="netcdf4")
+        self._client.bytes_served += target.stat().st_size
+        return str(target)
+
+
+class LocalCDSClient:
+    """
+    Cliente falso que responde peticiones CDS desde un NetCDF local.
+
+    ``failures`` hace fallar las primeras N peticiones, para simular cortes y
+    probar que las descargas se retoman.
+    """
+
+    def __init__(self, source, time_dim: str = "valid_time", failures: int = 0):
+        ds = source if isinstance(source, xr.Dataset) else xr.open_dataset(source)
+        self.ds = ds.load()
+        self.time_dim = time_dim
+        self.failures = failures
+        self.lock = threading.Lock()
+        self.requests = []
+        self.bytes_served = 0
+
+    def retrieve(self, dataset, request, target=None):
+        with self.lock:
+            self.requests.append((dataset, request))
+            if self.failures > 0:
+                self.failures -= 1
+                raise ConnectionError("Fallo simulado del CDS")
+        times = self.ds[self.time_dim].dt
+        years = [int(y) for y in request["year"]]
+        months = [int(m) for m in request["month"]]
+        sel = np.isin(times.year, years) & np.isin(times.month, months)
+        if not sel.any():
+            raise RuntimeError(f"Sin datos para {request['year']} / {request['month']}")
+
+        ds = self.ds.isel({self.time_dim: np.flatnonzero(sel)})
+        if "variable" in request:
+            names = [SHORT_NAMES.get(v, v) for v in request["variable"]]
+            ds = ds[[v for v in names if v in ds.data_vars]]
+        if "area" in request:
+            north, west, south, east = request["area"]
+            ds = ds.where(
+                (ds.latitude <= north) & (ds.latitude >= south)
+                & (ds.longitude >= west) & (ds.longitude <= east),
+                drop=True,
+            )
+        result = _LocalResult(self, ds)
+        if target is not None:
+            result.download(target)
+        return result
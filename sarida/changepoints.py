@@ -0,0 +1,250 @@
+"""
+Detección de cambios de régimen en los índices de sequía.
+
+- :func:`pettitt`: test de Pettitt (1979) para un cambio único de nivel. El
+  estadístico ``U_t`` sale de la suma acumulada de los rangos
+  (``U_t = 2·Σ r_i − t(n+1)``), sin comparar pares.
+- :func:`binary_segmentation`: varios cambios de media y varianza (normal)
+  con segmentación binaria. El costo de cualquier tramo sale de las sumas
+  acumuladas de ``x`` y ``x²``, así que cada ronda evalúa todos los cortes
+  posibles de todas las series a la vez.
+
+Los SPI/SPEI de 3 a 12 meses están muy autocorrelacionados (r1 ≈ 0.7–0.95) y
+un AR(1) sin ningún cambio deambula lo suficiente para parecer varios
+regímenes. Ambos métodos descuentan la autocorrelación de rezago 1 con el
+factor de inflación de la varianza de la media ``(1 + r1) / (1 − r1)``
+(:func:`ar1_inflation`): Pettitt divide ``K²`` por él (un ``n`` efectivo) y la
+segmentación multiplica por él la penalización. Si hay cambios reales, ``r1``
+sale algo inflado y los dos métodos quedan conservadores.
+
+Todas las series (índices × regiones, una por fila) se procesan en lote.
+:func:`cached_changepoints` guarda la tabla por versión del dataset.
+"""
+import os
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+
+from sarida.era5 import TIME_DIM
+from sarida.store import cache_key
+from sarida.trends import INDEX_PREFIXES, acf
+
+MIN_SIZE = 24          # meses mínimos por régimen
+MAX_CHANGES = 8
+VAR_FLOOR = 1e-8
+MAX_R1 = 0.99          # tope de r1 para que el factor de inflación sea finito
+
+
+def _compress(values: np.ndarray):
+    """Filas sin NaN alineadas a la izquierda, su largo y la posición original de cada dato."""
+    x = np.atleast_2d(np.asarray(values, dtype=float))
+    valid = np.isfinite(x)
+    n = valid.sum(axis=1)
+    order = np.argsort(~valid, axis=1, kind="stable")
+    out = np.take_along_axis(x, order, axis=1)
+    out[np.arange(x.shape[1])[None, :] >= n[:, None]] = np.nan
+    return out, n, order
+
+
+def ar1_inflation(x: np.ndarray, n: np.ndarray) -> np.ndarray:
+    """
+    ``(1 + r1) / (1 − r1)`` de filas comprimidas, con ``r1`` entre 0 y ``MAX_R1``.
+
+    Es el factor por el que la autocorrelación de un AR(1) infla la varianza de
+    una media; con autocorrelación nula o negativa vale 1 (serie independiente).
+    """
+    r1 = np.clip(np.nan_to_num(acf(x, n, 1)[:, 1]), 0.0, MAX_R1)
+    return (1 + r1) / (1 - r1)
+
+
+def pettitt(values: np.ndarray) -> dict:
+    """
+    Test de Pettitt por fila de ``values`` ``(series, tiempo)``.
+
+    Devuelve ``K`` (máximo de ``|U_t|``), ``p`` (aproximación de Pettitt con
+    ``K²`` dividido por :func:`ar1_inflation`), ``position`` (primer mes del
+    nuevo régimen, en la posición original de la fila) y las medias antes y
+    después.
+    """
+    x, n, order = _compress(values)
+    rows, width = x.shape
+    ranks = rankdata(x, axis=1, nan_policy="omit")
+    ranks = np.where(np.isfinite(x), ranks, 0.0)
+    t = np.arange(1, width + 1)[None, :]
+    u = 2 * np.cumsum(ranks, axis=1) - t * (n[:, None] + 1)
+    u = np.where(t < n[:, None], np.abs(u), -1.0)          # cortes válidos: 1..n-1
+    split = np.argmax(u, axis=1) + 1                        # tamaño del primer régimen
+    k = u[np.arange(rows), split - 1]
+    nf = n.astype(float)
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        p = np.minimum(1.0, 2 * np.exp(-6 * k ** 2 / ar1_inflation(x, n) / (nf ** 3 + nf ** 2)))
+    valid = n >= 2
+    csum = np.cumsum(np.where(np.isfinite(x), x, 0.0), axis=1)
+    total = csum[np.arange(rows), np.maximum(n - 1, 0)]
+    before = csum[np.arange(rows), split - 1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_before = before / split
+        mean_after = (total - before) / (n - split)
+    position = order[np.arange(rows), np.minimum(split, width - 1)]
+    return {
+        "K": np.where(valid, k, np.nan),
+        "p": np.where(valid, p, np.nan),
+        "position": np.where(valid, position, -1),
+        "mean_before": np.where(valid, mean_before, np.nan),
+        "mean_after": np.where(valid, mean_after, np.nan),
+    }
+
+
+def _segment_cost(s1, s2, m):
+    """``m·log(varianza)`` del tramo (−2·log-verosimilitud normal sin constantes)."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = (s2 - s1 ** 2 / m) / m
+    return m * np.log(np.maximum(var, VAR_FLOOR))
+
+
+def binary_segmentation(values: np.ndarray, max_changes: int = MAX_CHANGES,
+                        min_size: int = MIN_SIZE, penalty: float = None):
+    """
+    Cambios de media y varianza por segmentación binaria, por fila.
+
+    En cada ronda se evalúa, para todas las filas y todos los cortes ``t`` a la
+    vez, la ganancia ``costo(a, b) − costo(a, t) − costo(t, b)`` del tramo
+    ``[a, b)`` que contiene a ``t``, con las sumas acumuladas. Se acepta el mejor
+    corte de cada fila si supera ``penalty`` (por defecto BIC: ``3·log n`` por
+    cambio, por media, varianza y posición, multiplicado por
+    :func:`ar1_inflation` de la fila). Devuelve ``(filas, posiciones,
+    ganancias)``, con posiciones en el índice original de cada fila.
+    """
+    x, n, order = _compress(values)
+    rows, width = x.shape
+    xz = np.where(np.isfinite(x), x, 0.0)
+    c1 = np.concatenate([np.zeros((rows, 1)), np.cumsum(xz, axis=1)], axis=1)
+    c2 = np.concatenate([np.zeros((rows, 1)), np.cumsum(xz ** 2, axis=1)], axis=1)
+    if penalty is None:
+        pen = 3 * np.log(np.maximum(n, 2)) * ar1_inflation(x, n)
+    else:
+        pen = np.full(rows, float(penalty))
+
+    r = np.arange(rows)[:, None]
+    t = np.arange(1, width)[None, :]                        # corte: el nuevo tramo empieza en t
+    bounds = np.full((rows, max_changes + 2), width + 1)
+    bounds[:, 0] = 0
+    bounds[:, 1] = n
+    found_rows, found_pos, found_gain = [], [], []
+    open_rows = n >= 2 * min_size
+    for step in range(max_changes):
+        if not open_rows.any():
+            break
+        # Tramo [a, b) que contiene cada corte
+        seg = (bounds[:, :, None] <= t[:, None, :]).sum(axis=1) - 1
+        a = np.take_along_axis(bounds, seg, axis=1)
+        b = np.take_along_axis(bounds, seg + 1, axis=1)
+        b_safe = np.minimum(b, width)
+        whole = _segment_cost(c1[r, b_safe] - c1[r, a], c2[r, b_safe] - c2[r, a], b_safe - a)
+        left = _segment_cost(c1[r, t] - c1[r, a], c2[r, t] - c2[r, a], t - a)
+        right = _segment_cost(c1[r, b_safe] - c1[r, t], c2[r, b_safe] - c2[r, t], b_safe - t)
+        gain = whole - left - right
+        ok = (t - a >= min_size) & (b - t >= min_size) & (t < n[:, None]) & (b <= n[:, None])
+        gain = np.where(ok & open_rows[:, None], gain, -np.inf)
+        best = np.argmax(gain, axis=1)
+        best_gain = gain[np.arange(rows), best]
+        accept = best_gain > pen
+        if not accept.any():
+            break
+        cut = best + 1
+        bounds[accept, step + 2] = cut[accept]
+        bounds.sort(axis=1)
+        found_rows.append(np.flatnonzero(accept))
+        found_pos.append(order[accept, cut[accept]])
+        found_gain.append(best_gain[accept])
+        open_rows &= accept
+
+    if not found_rows:
+        return np.array([], dtype=int), np.array([], dtype=int), np.array([])
+    return np.concatenate(found_rows), np.concatenate(found_pos), np.concatenate(found_gain)
+
+
+def _segment_means(values: np.ndarray, row: int, positions) -> list:
+    """Medias de los regímenes de una fila separados por ``positions`` (posiciones originales)."""
+    x = values[row]
+    edges = [0] + sorted(int(p) for p in positions) + [x.size]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return [float(np.nanmean(x[a:b])) for a, b in zip(edges[:-1], edges[1:])]
+
+
+def changepoint_table(df: pd.DataFrame, columns=None, group_col: str = None,
+                      time_col: str = TIME_DIM, max_changes: int = MAX_CHANGES,
+                      min_size: int = MIN_SIZE, penalty: float = None) -> pd.DataFrame:
+    """
+    Cambios de régimen de ``columns`` (por defecto todos los SPI/SPEI) de todas
+    las series a la vez.
+
+    Si ``group_col`` está (por ejemplo ``"region"`` de
+    :func:`sarida.regions.regional_monthly_df`), cada región es una serie más.
+    Una fila por cambio: ``method`` (``pettitt`` o ``binseg``), ``time`` (primer
+    mes del nuevo régimen), ``stat`` (K o ganancia), ``p`` (solo Pettitt) y las
+    medias antes y después.
+    """
+    if columns is None:
+        columns = [c for c in df.columns if str(c).startswith(INDEX_PREFIXES)]
+    columns = list(columns)
+    if group_col is None:
+        wide = df.sort_values(time_col).set_index(time_col)[columns]
+        keys = [(None, c) for c in columns]
+        values = wide.to_numpy(dtype=float).T
+    else:
+        wide = df.pivot_table(index=time_col, columns=group_col, values=columns, dropna=False)
+        wide = wide.sort_index()
+        keys = [(g, c) for c, g in wide.columns]
+        values = wide.to_numpy(dtype=float).T
+    times = pd.DatetimeIndex(wide.index)
+
+    records = []
+    pt = pettitt(values)
+    for i, (group, col) in enumerate(keys):
+        if pt["position"][i] < 0:
+            continue
+        records.append({
+            "group": group, "index": col, "method": "pettitt", "time": times[pt["position"][i]],
+            "stat": pt["K"][i], "p": pt["p"][i],
+            "mean_before": pt["mean_before"][i], "mean_after": pt["mean_after"][i],
+        })
+
+    rows, pos, gain = binary_segmentation(values, max_changes, min_size, penalty)
+    for i in np.unique(rows):
+        mine = np.sort(pos[rows == i])
+        means = _segment_means(values, i, mine)
+        gains = dict(zip(pos[rows == i], gain[rows == i]))
+        for j, p in enumerate(mine):
+            records.append({
+                "group": keys[i][0], "index": keys[i][1], "method": "binseg", "time": times[p],
+                "stat": gains[p], "p": np.nan, "mean_before": means[j], "mean_after": means[j + 1],
+            })
+
+    out = pd.DataFrame(records, columns=["group", "index", "method", "time", "stat", "p",
+                                         "mean_before", "mean_after"])
+    if group_col is None:
+        out = out.drop(columns="group")
+    else:
+        out = out.rename(columns={"group": group_col})
+    return out.sort_values([c for c in (group_col, "index", "method", "time") if c]).reset_index(drop=True)
+
+
+def cached_changepoints(df: pd.DataFrame, cache_dir, version: str, columns=None,
+                        group_col: str = None, time_col: str = TIME_DIM, **kwargs) -> pd.DataFrame:
+    """:func:`changepoint_table` guardado en ``cache_dir/cambios_<version>.parquet``."""
+    key = cache_key(version)
+    params = "_".join(f"{k}{v}" for k, v in sorted(kwargs.items()))
+    path = Path(cache_dir) / f"cambios_{key}{'_' + params if params else ''}.parquet"
+    if path.exists():
+        return pd.read_parquet(path)
+    table = changepoint_table(df, columns, group_col, time_col, **kwargs)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".parquet.tmp")
+    table.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return table
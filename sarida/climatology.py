@@ -0,0 +1,123 @@
+"""
+Climatología por mes calendario: medias, desviaciones, cuantiles y percentiles.
+
+Se arma una vez por versión del dataset (:meth:`Climatology.build`) y después se
+consulta desde memoria:
+
+- ``mean``/``std`` y una tabla de cuantiles (cada 5 %) por mes y variable;
+- la muestra ordenada de cada mes y variable, para ubicar cualquier valor en su
+  percentil con una búsqueda binaria (:meth:`Climatology.percentile`);
+- anomalías y percentiles de toda la serie de una vez
+  (:meth:`Climatology.anomalies`).
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from sarida.era5 import TIME_DIM, VALUE_COLS
+
+QUANTILES = np.round(np.linspace(0, 1, 21), 2)
+INDEX_PREFIXES = ("SPI_", "SPEI_")
+
+
+class Climatology:
+    """Tablas por mes calendario (filas 1–12) para ``columns``."""
+
+    def __init__(self, columns, mean, std, quantiles, samples, counts, version=None):
+        self.columns = list(columns)
+        self.mean = mean              # (12, C)
+        self.std = std                # (12, C)
+        self.quantiles = quantiles    # (12, Q, C)
+        self.samples = samples        # (12, años, C), ordenado y con NaN al final
+        self.counts = counts          # (12, C)
+        self.version = version
+        self._col = {c: i for i, c in enumerate(self.columns)}
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, columns=None, time_col: str = TIME_DIM,
+              version=None) -> "Climatology":
+        """
+        Tablas de ``columns`` (por defecto las 9 variables y los SPI/SPEI
+        presentes). ``version`` identifica el dataset de origen.
+        """
+        if columns is None:
+            columns = [c for c in VALUE_COLS if c in df.columns]
+            columns += [c for c in df.columns if str(c).startswith(INDEX_PREFIXES)]
+        months = pd.DatetimeIndex(df[time_col]).month.to_numpy()
+        values = df[columns].to_numpy(dtype=float)
+
+        years = int(np.bincount(months, minlength=13).max())
+        samples = np.full((12, years, len(columns)), np.nan)
+        for m in range(1, 13):
+            block = values[months == m]
+            samples[m - 1, :len(block)] = np.sort(block, axis=0)   # NaN quedan al final
+        counts = np.isfinite(samples).sum(axis=1)
+        # Columnas sin datos en algún mes quedan en NaN sin avisos
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mean = np.nanmean(samples, axis=1)
+            std = np.nanstd(samples, axis=1, ddof=1)
+            quantiles = np.moveaxis(np.nanquantile(samples, QUANTILES, axis=1), 0, 1)
+        return cls(columns, mean, std, quantiles, samples, counts, version)
+
+    # ----- consultas -----
+    def percentile(self, col: str, month: int, value: float) -> float:
+        """Percentil (0–100) de ``value`` en la muestra de ``month``; O(log n)."""
+        c = self._col[col]
+        n = self.counts[month - 1, c]
+        if n == 0 or not np.isfinite(value):
+            return np.nan
+        sample = self.samples[month - 1, :n, c]
+        below = np.searchsorted(sample, value, side="left")
+        equal = np.searchsorted(sample, value, side="right") - below
+        return float(100.0 * (below + 0.5 * equal) / n)
+
+    def normal(self, col: str, month: int) -> dict:
+        """Media, desviación y mediana de ``col`` para ``month``."""
+        c = self._col[col]
+        return {
+            "mean": float(self.mean[month - 1, c]),
+            "std": float(self.std[month - 1, c]),
+            "median": float(np.interp(0.5, QUANTILES, self.quantiles[month - 1, :, c])),
+        }
+
+    def anomalies(self, df: pd.DataFrame, time_col: str = TIME_DIM) -> pd.DataFrame:
+        """
+        ``{col}_anom`` (valor − media del mes) y ``{col}_pct`` (percentil) para
+        cada fila de ``df``; un ``searchsorted`` por mes y variable.
+        """
+        months = pd.DatetimeIndex(df[time_col]).month.to_numpy()
+        cols = [c for c in self.columns if c in df.columns]
+        values = df[cols].to_numpy(dtype=float)
+        idx = [self._col[c] for c in cols]
+
+        anom = values - self.mean[months - 1][:, idx]
+        pct = np.full(values.shape, np.nan)
+        for m in np.unique(months):
+            rows = months == m
+            for j, c in enumerate(idx):
+                n = self.counts[m - 1, c]
+                if n == 0:
+                    continue
+                sample = self.samples[m - 1, :n, c]
+                x = values[rows, j]
+                below = np.searchsorted(sample, x, side="left")
+                equal = np.searchsorted(sample, x, side="right") - below
+                pct[rows, j] = np.where(np.isfinite(x), 100.0 * (below + 0.5 * equal) / n, np.nan)
+
+        out = pd.DataFrame(index=df.index)
+        out[time_col] = df[time_col].to_numpy()
+        for j, c in enumerate(cols):
+            out[f"{c}_anom"] = anom[:, j]
+            out[f"{c}_pct"] = pct[:, j]
+        return out
+
+    def table(self, stat: str = "mean") -> pd.DataFrame:
+        """Tabla mes × variable de ``mean``, ``std`` o un cuantil (``"q50"``, ``"q95"``...)."""
+        if stat in ("mean", "std"):
+            data = getattr(self, stat)
+        else:
+            q = int(stat[1:]) / 100
+            data = self.quantiles[:, int(np.argmin(np.abs(QUANTILES - q))), :]
+        return pd.DataFrame(data, index=pd.Index(range(1, 13), name="mes"), columns=self.columns)
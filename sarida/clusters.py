@@ -0,0 +1,181 @@
+"""
+Seguimiento espacio-temporal de sequías sobre los índices por píxel.
+
+Cada sequía es una componente conexa 3-D (tiempo × lat × lon) de celdas con el
+índice (por ejemplo ``SPEI_3`` de :mod:`sarida.gridded`) por debajo de
+``threshold``. Así un mismo objeto puede crecer, moverse y encogerse mes a mes.
+
+El etiquetado recorre el cubo por bloques de tiempo: cada bloque se etiqueta con
+``scipy.ndimage.label`` y las etiquetas que se tocan en la frontera entre
+bloques se unen con union-find. De cada bloque solo se guardan sumas por
+(etiqueta, mes), así que la memoria depende del bloque y el costo total es casi
+lineal en el tamaño del cubo.
+
+El resultado es una tabla compacta con una fila por cluster y mes
+(:func:`label_clusters`): celdas, área, centroide y déficit (suma de
+−índice × área). :func:`cluster_summary` la resume en una fila por cluster.
+"""
+import numpy as np
+import pandas as pd
+
+from sarida.era5 import TIME_DIM
+
+THRESHOLD = -1.0
+TIME_BLOCK = 60        # igual que los bloques de tiempo del cubo Zarr
+KM_PER_DEG = 111.32
+
+
+class _UnionFind:
+    """Union-find sobre etiquetas enteras, con compresión de caminos."""
+
+    def __init__(self):
+        self.parent = np.zeros(1, dtype=np.int64)
+
+    def grow(self, n: int):
+        if n > self.parent.size:
+            self.parent = np.concatenate([self.parent, np.arange(self.parent.size, n)])
+
+    def find(self, x: int) -> int:
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+    def roots(self) -> np.ndarray:
+        """Raíz de cada etiqueta (vectorizado: saltos hasta que no cambie)."""
+        parent = self.parent.copy()
+        while True:
+            nxt = parent[parent]
+            if np.array_equal(nxt, parent):
+                return parent
+            parent = nxt
+
+
+def cell_area_km2(lat, lon) -> np.ndarray:
+    """Área (km²) de cada celda de una grilla regular, ``(lat, lon)``."""
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    dlat = np.abs(np.diff(lat)).mean() if lat.size > 1 else 0.1
+    dlon = np.abs(np.diff(lon)).mean() if lon.size > 1 else 0.1
+    row = (KM_PER_DEG * dlat) * (KM_PER_DEG * dlon * np.cos(np.deg2rad(lat)))
+    return np.repeat(row[:, None], lon.size, axis=1)
+
+
+def _time_offsets(structure: np.ndarray) -> list:
+    """Desplazamientos espaciales ``(di, dj)`` que conectan un mes con el siguiente."""
+    return [(di - 1, dj - 1) for di, dj in zip(*np.nonzero(structure[2]))]
+
+
+def label_clusters(da, threshold: float = THRESHOLD, connectivity: int = 1,
+                   time_block: int = TIME_BLOCK) -> pd.DataFrame:
+    """
+    Etiqueta las sequías de ``da`` (``valid_time × latitude × longitude``).
+
+    ``connectivity`` es la de ``scipy.ndimage.generate_binary_structure`` en 3-D
+    (1 = solo caras; 3 = también diagonales). ``da`` puede ser perezoso: se lee
+    de a ``time_block`` meses. Devuelve una fila por (cluster, mes) con
+    ``cells``, ``area_km2``, ``lat``, ``lon`` (centroide por área) y ``deficit``.
+    """
+    from scipy import ndimage
+
+    da = da.transpose(TIME_DIM, "latitude", "longitude")
+    times = pd.DatetimeIndex(da[TIME_DIM].values)
+    lat, lon = da["latitude"].values, da["longitude"].values
+    area = cell_area_km2(lat, lon)
+    lat_grid = np.repeat(lat[:, None], lon.size, axis=1)
+    lon_grid = np.repeat(lon[None, :], lat.size, axis=0)
+    ny, nx = area.shape
+
+    structure = ndimage.generate_binary_structure(3, connectivity)
+    offsets = _time_offsets(structure)
+    uf = _UnionFind()
+    next_label = 1
+    prev_last = None      # etiquetas globales del último mes del bloque anterior
+    pieces = []
+
+    for t0 in range(0, len(times), time_block):
+        values = np.asarray(da.isel({TIME_DIM: slice(t0, t0 + time_block)}).values, dtype=float)
+        with np.errstate(invalid="ignore"):
+            mask = values < threshold
+        labels, n = ndimage.label(mask, structure=structure)
+        labels = np.where(mask, labels + (next_label - 1), 0)
+        uf.grow(next_label + n)
+        next_label += n
+
+        # Uniones con el bloque anterior a través de la frontera de tiempo
+        if prev_last is not None:
+            first = labels[0]
+            for di, dj in offsets:
+                a = prev_last[max(0, -di):ny - max(0, di), max(0, -dj):nx - max(0, dj)]
+                b = first[max(0, di):ny - max(0, -di), max(0, dj):nx - max(0, -dj)]
+                both = (a > 0) & (b > 0)
+                for la, lb in set(zip(a[both].tolist(), b[both].tolist())):
+                    uf.union(la, lb)
+        prev_last = labels[-1]
+
+        # Sumas por (etiqueta, mes) del bloque
+        t_idx, i_idx, j_idx = np.nonzero(mask)
+        if t_idx.size == 0:
+            continue
+        w = area[i_idx, j_idx]
+        deficit = -values[t_idx, i_idx, j_idx] * w
+        pieces.append(pd.DataFrame({
+            "cluster": labels[t_idx, i_idx, j_idx],
+            "t": t_idx + t0,
+            "cells": 1,
+            "area_km2": w,
+            "lat_w": lat_grid[i_idx, j_idx] * w,
+            "lon_w": lon_grid[i_idx, j_idx] * w,
+            "deficit": deficit,
+        }).groupby(["cluster", "t"], as_index=False).sum())
+
+    columns = ["cluster", TIME_DIM, "cells", "area_km2", "lat", "lon", "deficit"]
+    if not pieces:
+        return pd.DataFrame(columns=columns)
+
+    track = pd.concat(pieces, ignore_index=True)
+    roots = uf.roots()
+    track["cluster"] = roots[track["cluster"].to_numpy()]
+    track = track.groupby(["cluster", "t"], as_index=False).sum()
+    # Ids consecutivos en orden de aparición
+    first_seen = track.groupby("cluster")["t"].min().sort_values(kind="stable")
+    track["cluster"] = track["cluster"].map(pd.Series(np.arange(1, len(first_seen) + 1),
+                                                      index=first_seen.index))
+    track[TIME_DIM] = times[track["t"].to_numpy()]
+    track["lat"] = track["lat_w"] / track["area_km2"]
+    track["lon"] = track["lon_w"] / track["area_km2"]
+    return track.sort_values(["cluster", TIME_DIM])[columns].reset_index(drop=True)
+
+
+def cluster_summary(track: pd.DataFrame, min_cells: int = 1) -> pd.DataFrame:
+    """
+    Una fila por cluster: inicio, fin, duración, área máxima, déficit total y
+    centroides inicial y final. Se descartan los que nunca superan ``min_cells``.
+    """
+    g = track.groupby("cluster")
+    out = pd.DataFrame({
+        "start": g[TIME_DIM].min(),
+        "end": g[TIME_DIM].max(),
+        "duration": g[TIME_DIM].size(),
+        "max_cells": g["cells"].max(),
+        "max_area_km2": g["area_km2"].max(),
+        "deficit": g["deficit"].sum(),
+        "lat_start": g["lat"].first(),
+        "lon_start": g["lon"].first(),
+        "lat_end": g["lat"].last(),
+        "lon_end": g["lon"].last(),
+    })
+    return out[out["max_cells"] >= min_cells].reset_index()
+
+
+def save_track(track: pd.DataFrame, path):
+    """Guarda la tabla de seguimiento en Parquet (float32 para las medidas)."""
+    compact = track.astype({c: "float32" for c in ("area_km2", "lat", "lon", "deficit")})
+    compact.astype({"cluster": "int32", "cells": "int32"}).to_parquet(path, index=False)
@@ -0,0 +1,228 @@
+"""
+Almacén persistente del cubo ERA5 (tiempo × lat × lon) en Zarr.
+
+Reemplaza al ``data_stream-moda.nc`` que se sobrescribe en cada descarga:
+
+- Bloques orientados al tiempo (``CHUNKS``): una serie de 40 años en un píxel o
+  un mes en toda la grilla tocan solo unos pocos bloques.
+- Variables empaquetadas en ``int16`` con ``scale_factor``/``add_offset`` fijos
+  por variable (``PACKING``) y comprimidas con Blosc/zstd.
+- Los meses nuevos se agregan a lo largo de ``valid_time`` sin reescribir los
+  bloques históricos; los meses que ya estaban se ignoran.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from sarida.era5 import TIME_DIM
+
+# 60 meses × 32 × 32 celdas: ~8 bloques por píxel en 40 años y 1 bloque por mes
+# en una grilla del tamaño de La Guajira.
+CHUNKS = {TIME_DIM: 60, "latitude": 32, "longitude": 32}
+
+# Rango físico (mínimo, máximo) de cada variable para empaquetar en int16.
+# Las variables que no estén aquí se guardan en float32.
+PACKING = {
+    "t2m": (150.0, 350.0),
+    "swvl1": (0.0, 1.0),
+    "swvl2": (0.0, 1.0),
+    "swvl3": (0.0, 1.0),
+    "swvl4": (0.0, 1.0),
+    "ssrd": (0.0, 4.0e7),
+    "tp": (0.0, 0.1),
+    "pev": (-0.1, 0.1),
+    "e": (-0.05, 0.05),
+}
+
+_INT16_FILL = -32768
+
+
+def _compression() -> dict:
+    """Clave de encoding con Blosc/zstd según la versión de zarr instalada."""
+    import zarr
+
+    if int(zarr.__version__.split(".")[0]) >= 3:
+        from zarr.codecs import BloscCodec
+
+        return {"compressors": (BloscCodec(cname="zstd", clevel=5, shuffle="shuffle"),)}
+    from numcodecs import Blosc
+
+    return {"compressor": Blosc(cname="zstd", clevel=5, shuffle=Blosc.SHUFFLE)}
+
+
+def variable_encoding(da: xr.DataArray, chunks=None, packing=None) -> dict:
+    """Encoding Zarr (bloques, empaquetado y compresión) para una variable."""
+    chunks = CHUNKS if chunks is None else chunks
+    packing = PACKING if packing is None else packing
+    # El tiempo crece con cada mes agregado; las dimensiones espaciales no
+    shape = tuple(
+        chunks.get(d, n) if d == TIME_DIM else min(chunks.get(d, n), n)
+        for d, n in da.sizes.items()
+    )
+    enc = {"chunks": shape, **_compression()}
+    name = da.name
+    if name in packing:
+        lo, hi = packing[name]
+        # 65534 pasos útiles; el -32768 queda libre como valor faltante
+        scale = (hi - lo) / 65534.0
+        enc.update(
+            dtype="int16",
+            scale_factor=scale,
+            add_offset=lo + 32767.0 * scale,
+            _FillValue=_INT16_FILL,
+        )
+    else:
+        enc.update(dtype="float32")
+    return enc
+
+
+def _nan_like(var: xr.DataArray, ds: xr.Dataset) -> xr.DataArray:
+    """``var`` (del cubo) rellena con NaN sobre los tiempos de ``ds``."""
+    shape = tuple(ds.sizes[d] if d == TIME_DIM else n for d, n in var.sizes.items())
+    return xr.DataArray(np.full(shape, np.nan, dtype="float32"), dims=var.dims)
+
+
+class CubeStore:
+    """Cubo ERA5 persistente en un directorio Zarr."""
+
+    def __init__(self, root, chunks=None, packing=None):
+        self.root = Path(root)
+        self.chunks = CHUNKS if chunks is None else chunks
+        self.packing = PACKING if packing is None else packing
+
+    def exists(self) -> bool:
+        return self.root.exists() and any(self.root.iterdir())
+
+    def open(self, chunks="auto") -> xr.Dataset:
+        """Abre el cubo de forma perezosa (``chunks=None`` para numpy puro)."""
+        return xr.open_zarr(self.root, chunks=chunks)
+
+    def times(self) -> pd.DatetimeIndex:
+        if not self.exists():
+            return pd.DatetimeIndex([])
+        return pd.DatetimeIndex(self.open(chunks=None)[TIME_DIM].values)
+
+    def _prepare(self, ds: xr.Dataset) -> xr.Dataset:
+        ds = ds.drop_vars(["number", "expver"], errors="ignore").sortby(TIME_DIM)
+        for var in ds.data_vars:
+            ds[var].encoding = {}
+        # Bloques de dask alineados con los de zarr para escribir en paralelo
+        return ds.chunk({d: c for d, c in self.chunks.items() if d in ds.dims})
+
+    def append(self, ds: xr.Dataset) -> list:
+        """
+        Agrega al cubo los pasos de tiempo de ``ds`` que todavía no estén.
+
+        La primera escritura crea el almacén con el encoding de cada variable;
+        las siguientes solo añaden a lo largo de ``valid_time``. Las variables
+        del cubo que ``ds`` no trae (los índices por píxel de
+        :func:`sarida.gridded.grid_indices`) se extienden con NaN para que todas
+        sigan teniendo el mismo largo; hay que volver a calcularlas para llenar
+        los meses nuevos. Devuelve los tiempos agregados.
+        """
+        ds = self._prepare(ds)
+        existing = self.times()
+        new_times = pd.DatetimeIndex(ds[TIME_DIM].values).difference(existing)
+        if new_times.empty:
+            return []
+        ds = ds.sel({TIME_DIM: new_times})
+
+        if existing.empty:
+            encoding = {
+                v: variable_encoding(ds[v], self.chunks, self.packing)
+                for v in ds.data_vars
+            }
+            ds.to_zarr(self.root, mode="w", encoding=encoding)
+        else:
+            if new_times.min() <= existing.max():
+                raise ValueError(
+                    "Solo se pueden agregar meses posteriores al último almacenado "
+                    f"({existing.max():%Y-%m}); se recibió {new_times.min():%Y-%m}."
+                )
+            current = self.open(chunks=None)
+            derived = [v for v in current.data_vars
+                       if v not in ds.data_vars and TIME_DIM in current[v].dims]
+            if derived:
+                ds = ds.assign({v: _nan_like(current[v], ds) for v in derived})
+                ds = ds.chunk({d: c for d, c in self.chunks.items() if d in ds.dims})
+            ds.to_zarr(self.root, append_dim=TIME_DIM)
+        return list(new_times)
+
+    def add_variables(self, ds: xr.Dataset, packing=None) -> list:
+        """
+        Escribe variables nuevas (por ejemplo índices por píxel) en el cubo.
+
+        ``ds`` debe tener las mismas coordenadas que el cubo. Las variables que ya
+        existan se sobrescriben completas.
+        """
+        packing = self.packing if packing is None else packing
+        current = self.open(chunks=None)
+        ds = ds.drop_vars(["number", "expver"], errors="ignore")
+        ds = ds.reindex({d: current[d] for d in ds.dims if d in current.dims})
+        for var in ds.data_vars:
+            ds[var].encoding = {}
+        encoding = {
+            v: variable_encoding(ds[v], self.chunks, packing)
+            for v in ds.data_vars if v not in current.data_vars
+        }
+        ds = ds.chunk({d: c for d, c in self.chunks.items() if d in ds.dims})
+        ds.drop_vars(list(ds.coords)).to_zarr(self.root, mode="a", encoding=encoding)
+        return list(ds.data_vars)
+
+    def reserve_variables(self, template: xr.Dataset, packing=None) -> list:
+        """
+        Crea las variables de ``template`` sin escribir datos.
+
+        ``template`` debe ser perezoso (dask) y tener las coordenadas del cubo;
+        solo se escriben los metadatos y los bloques se llenan después con
+        :meth:`write_region`, por ejemplo desde varios procesos a la vez.
+        """
+        packing = self.packing if packing is None else packing
+        current = self.open(chunks=None)
+        for var in template.data_vars:
+            template[var].encoding = {}
+        encoding = {
+            v: variable_encoding(template[v], self.chunks, packing)
+            for v in template.data_vars if v not in current.data_vars
+        }
+        template = template.chunk({d: c for d, c in self.chunks.items() if d in template.dims})
+        template.drop_vars(list(template.coords)).to_zarr(
+            self.root, mode="a", encoding=encoding, compute=False,
+        )
+        return list(template.data_vars)
+
+    def write_region(self, ds: xr.Dataset, region: dict):
+        """
+        Escribe ``ds`` en la región ``{dim: slice}`` de variables ya reservadas.
+
+        La región debe estar alineada con los bloques del cubo para que dos
+        escrituras simultáneas nunca toquen el mismo bloque.
+        """
+        ds.drop_vars(list(ds.coords)).to_zarr(self.root, mode="r+", region=region)
+
+    def pixel_series(self, var: str, lat: float, lon: float) -> pd.Series:
+        """Serie completa de una variable en la celda más cercana a (lat, lon)."""
+        da = self.open()[var].sel(latitude=lat, longitude=lon, method="nearest")
+        return da.to_series()
+
+    def month_field(self, var: str, month) -> xr.DataArray:
+        """Campo de toda la grilla para un mes."""
+        month = pd.Timestamp(month).to_period("M").to_timestamp()
+        return self.open()[var].sel({TIME_DIM: month}).load()
+
+
+def chunk_count(store: CubeStore, var: str, time_slice=None, lat=None, lon=None) -> int:
+    """Cantidad de bloques de ``var`` que toca una selección (para diagnosticar)."""
+    ds = store.open(chunks=None)
+    sizes = {d: ds.sizes[d] for d in ds[var].dims}
+    chunks = dict(zip(ds[var].dims, ds[var].encoding["chunks"]))
+    count = 1
+    for dim, sel in ((TIME_DIM, time_slice), ("latitude", lat), ("longitude", lon)):
+        if sel is None:
+            count *= int(np.ceil(sizes[dim] / chunks[dim]))
+        else:
+            idx = np.atleast_1d(np.asarray(sel))
+            count *= len(np.unique(idx // chunks[dim]))
+    return count
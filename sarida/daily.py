@@ -0,0 +1,266 @@
+"""
+Modo de actualización diaria (casi en tiempo real).
+
+Los promedios mensuales del CDS llegan con hasta seis semanas de atraso. Este
+modo toma campos diarios ya promediados en la caja (una fila por día, en
+unidades ERA5: ``t2m`` en K, ``swvl*`` en m³/m³, ``ssrd`` en J/m² del día y
+``tp``, ``e``, ``pev`` en m del día) desde una carpeta local
+(``YYYY-MM-DD.parquet`` o ``.csv``) y mantiene:
+
+- un búfer circular con los últimos 90 días, convertidos a las unidades de
+  ``dataset_clima.parquet``;
+- sumas móviles de 30 y 90 días que se actualizan sumando el día que entra y
+  restando el que sale, así que cada día nuevo cuesta O(1) sin importar cuánta
+  historia haya.
+
+Con eso se publica un SPI/SPEI provisional del mes en curso (30 días ≈ ventana
+de 1 mes, 90 días ≈ 3 meses) con la misma calibración que los índices
+mensuales publicados (:class:`sarida.calibration.Calibration` y
+:func:`sarida.indices.standardize`), así que ambos quedan en la misma escala, y
+la probabilidad del modelo con las 9 variables de los últimos 30 días.
+"""
+import json
+import os
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from sarida.calibration import DEFAULT_PERIOD, Calibration
+from sarida.era5 import VALUE_COLS
+from sarida.indices import standardize
+
+WINDOWS = {30: 1, 90: 3}   # días de la ventana -> meses equivalentes
+BUFFER_DAYS = max(WINDOWS)
+DAYS_PER_MONTH = 30        # mismo ``days = 30`` de los notebooks
+MIN_COVERAGE = 0.9
+SUM_VARS = ("tp", "e", "pev")  # se suman en la ventana; el resto se promedia
+
+
+def to_dataset_units(row: dict) -> dict:
+    """Convierte un día en unidades ERA5 a las de ``dataset_clima.parquet``."""
+    out = {}
+    for var in VALUE_COLS:
+        v = row.get(var, np.nan)
+        v = np.nan if v is None else float(v)
+        if var == "t2m":
+            v -= 273.15
+        elif var.startswith("swvl"):
+            v *= 100
+        elif var == "tp":
+            v *= 1000
+        elif var in ("e", "pev"):
+            v *= -1000
+        elif var == "ssrd":
+            v /= 86400
+        out[var] = v
+    return out
+
+
+def monthly_calibration(monthly: pd.DataFrame, period=DEFAULT_PERIOD) -> Calibration:
+    """
+    Calibración para el modo diario cuando no hay una guardada.
+
+    ``monthly`` es la serie histórica con ``valid_time``, ``tp`` y ``pev`` en
+    unidades del dataset (mm en 30 días). Con ``dataset_clima.parquet`` da los
+    mismos parámetros que el SPI/SPEI publicado por los notebooks
+    (:func:`sarida.catalogue.catalogue_frame`, calibrado en el mismo periodo).
+    """
+    monthly = monthly.sort_values("valid_time")
+    return Calibration.fit(monthly["tp"].to_numpy(dtype=float), monthly["pev"].to_numpy(dtype=float),
+                           monthly["valid_time"], period=period)
+
+
+def provisional_index(calibration: Calibration, name: str, k: int, value: float, month: int) -> float:
+    """``SPI_k``/``SPEI_k`` de un valor mensual equivalente con los parámetros de ``calibration``."""
+    if k not in calibration.windows:
+        return np.nan
+    # Filas de los parámetros: ventana × (SPI, SPEI), como en ``spi_spei``
+    row = 2 * calibration.windows.index(k) + (name == "SPEI")
+    params = {key: v[[row]] for key, v in calibration.params.items()}
+    return float(standardize(np.array([[value]], dtype=float), np.array([month]), params)[0, 0])
+
+
+class DailyState:
+    """
+    Estado persistente del modo diario.
+
+    ``buffer`` guarda los últimos ``BUFFER_DAYS`` días (NaN en días sin dato);
+    ``sums``/``counts`` son, para cada ventana, la suma y la cantidad de días
+    válidos de cada variable.
+    """
+
+    def __init__(self, calibration: Calibration = None):
+        self.calibration = calibration
+        self.last_date = None
+        self.buffer = deque(maxlen=BUFFER_DAYS)
+        self.sums = {w: {v: 0.0 for v in VALUE_COLS} for w in WINDOWS}
+        self.counts = {w: {v: 0 for v in VALUE_COLS} for w in WINDOWS}
+
+    # ----- actualización O(1) -----
+    def _push(self, values: dict):
+        for w in WINDOWS:
+            # El día que sale de la ventana de ``w`` días
+            leaving = self.buffer[-w] if len(self.buffer) >= w else None
+            for var in VALUE_COLS:
+                v = values[var]
+                if np.isfinite(v):
+                    self.sums[w][var] += v
+                    self.counts[w][var] += 1
+                if leaving is not None and np.isfinite(leaving[var]):
+                    self.sums[w][var] -= leaving[var]
+                    self.counts[w][var] -= 1
+        self.buffer.append(values)
+
+    def update(self, date, row: dict):
+        """
+        Agrega el día ``date`` (fila en unidades ERA5).
+
+        Los días intermedios que falten entran como NaN para que las ventanas
+        sigan alineadas con el calendario. Días repetidos o anteriores al último
+        procesado se ignoran.
+        """
+        date = pd.Timestamp(date).normalize()
+        if self.last_date is not None:
+            gap = (date - self.last_date).days
+            if gap <= 0:
+                return False
+            empty = {v: np.nan for v in VALUE_COLS}
+            for _ in range(min(gap - 1, BUFFER_DAYS)):
+                self._push(empty)
+        self._push(to_dataset_units(row))
+        self.last_date = date
+        return True
+
+    # ----- valores provisionales -----
+    def window_values(self, days: int = 30) -> dict:
+        """Las 9 variables equivalentes a un mes sobre la ventana de ``days`` días."""
+        out = {}
+        for var in VALUE_COLS:
+            n = self.counts[days][var]
+            if n < MIN_COVERAGE * days:
+                out[var] = np.nan
+                continue
+            mean = self.sums[days][var] / n
+            out[var] = mean * DAYS_PER_MONTH if var in SUM_VARS else mean
+        return out
+
+    def provisional(self, model=None) -> dict:
+        """SPI/SPEI provisionales del mes en curso y probabilidad del modelo."""
+        row = {"valid_time": self.last_date}
+        month = self.last_date.month
+        for days, k in WINDOWS.items():
+            # El equivalente mensual de la ventana es la media móvil de k meses
+            vals = self.window_values(days)
+            pr = vals["tp"]
+            wb = vals["tp"] - vals["pev"]
+            for name, value in (("SPI", pr), ("SPEI", wb)):
+                row[f"{name}_{k}"] = (np.nan if self.calibration is None else
+                                      provisional_index(self.calibration, name, k, value, month))
+
+        features = self.window_values(30)
+        row.update(features)
+        row["proba"] = np.nan
+        if model is not None and hasattr(model, "predict_proba"):
+            X = np.array([[features[v] for v in VALUE_COLS]])
+            if np.isfinite(X).all():
+                row["proba"] = float(model.predict_proba(X)[0][1])
+        return row
+
+    # ----- persistencia -----
+    def to_dict(self) -> dict:
+        def clean(x):
+            return None if not np.isfinite(x) else x
+
+        return {
+            "last_date": None if self.last_date is None else f"{self.last_date:%Y-%m-%d}",
+            "buffer": [[clean(day[v]) for v in VALUE_COLS] for day in self.buffer],
+            "calibration": None if self.calibration is None else self.calibration.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DailyState":
+        # Los estados anteriores guardaban sus propias gammas ("params") o un SPEI
+        # con la gamma de 3 parámetros (sin "glo"): se descartan y se recalibra
+        calib = data.get("calibration")
+        state = cls(Calibration.from_dict(calib) if calib and "glo" in calib["params"] else None)
+        # Reconstruir las sumas desde el búfer deja el estado consistente
+        for day in data.get("buffer", []):
+            state._push({v: np.nan if x is None else x for v, x in zip(VALUE_COLS, day)})
+        if data.get("last_date"):
+            state.last_date = pd.Timestamp(data["last_date"])
+        return state
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self.to_dict()), encoding="utf-8")
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path) -> "DailyState":
+        return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+
+
+def read_daily_file(path) -> dict:
+    """Lee un archivo diario de la carpeta de entrada (una fila)."""
+    path = Path(path)
+    df = pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_csv(path)
+    return df.iloc[-1].to_dict()
+
+
+def pending_files(drop_dir, after=None) -> list:
+    """Archivos ``YYYY-MM-DD.*`` de la carpeta posteriores a ``after``, en orden."""
+    found = []
+    for p in Path(drop_dir).glob("*"):
+        if p.suffix not in (".parquet", ".csv"):
+            continue
+        try:
+            date = pd.Timestamp(p.stem)
+        except ValueError:
+            continue
+        if after is None or date > after:
+            found.append((date, p))
+    return sorted(found)
+
+
+def run_daily(drop_dir, state_path, monthly: pd.DataFrame = None, model=None,
+              out_path=None, calibration: Calibration = None) -> pd.DataFrame:
+    """
+    Procesa los días nuevos de ``drop_dir`` y publica los valores provisionales.
+
+    ``calibration`` es la de los índices mensuales publicados (por ejemplo
+    ``IndexStore(...).calibration()``); si no se da, la primera vez se ajusta
+    una con ``monthly`` (la serie histórica) en el periodo por defecto. Después
+    se reutiliza la guardada en el estado, salvo que se pase otra. Si se da
+    ``out_path``, la fila provisional reemplaza a la del mismo mes en ese
+    Parquet. Devuelve las filas provisionales de los días procesados.
+    """
+    state_path = Path(state_path)
+    state = DailyState.load(state_path) if state_path.exists() else DailyState()
+    if calibration is not None:
+        state.calibration = calibration
+    elif state.calibration is None:
+        if monthly is None:
+            raise ValueError("Se necesita la calibración o la serie mensual histórica para iniciar el modo diario.")
+        state.calibration = monthly_calibration(monthly)
+
+    rows = []
+    for date, path in pending_files(drop_dir, after=state.last_date):
+        if state.update(date, read_daily_file(path)):
+            rows.append(state.provisional(model))
+    state.save(state_path)
+
+    published = pd.DataFrame(rows)
+    if out_path is not None and not published.empty:
+        latest = published.iloc[[-1]].copy()
+        latest["valid_time"] = latest["valid_time"].dt.to_period("M").dt.to_timestamp()
+        out_path = Path(out_path)
+        if out_path.exists():
+            old = pd.read_parquet(out_path)
+            old = old[old["valid_time"] != latest["valid_time"].iloc[0]]
+            latest = pd.concat([old, latest], ignore_index=True).sort_values("valid_time")
+        latest.to_parquet(out_path, index=False)
+    return published
@@ -0,0 +1,140 @@
+"""
+Definiciones de la descarga ERA5-Land y conversión a DataFrame mensual.
+"""
+import zipfile
+from pathlib import Path
+
+import pandas as pd
+
+# Dataset y variables usadas por ambos notebooks
+DATASET = "reanalysis-era5-land-monthly-means"
+
+VARIABLES = [
+    "total_precipitation",
+    "2m_temperature",
+    "volumetric_soil_water_layer_1",
+    "volumetric_soil_water_layer_2",
+    "volumetric_soil_water_layer_3",
+    "volumetric_soil_water_layer_4",
+    "surface_solar_radiation_downwards",
+    "potential_evaporation",
+    "total_evaporation",
+]
+
+# Columnas de valor (nombres cortos de ERA5) en el orden que espera el modelo
+VALUE_COLS = ["t2m", "swvl1", "swvl2", "swvl3", "swvl4", "ssrd", "pev", "e", "tp"]
+
+# Nombre CDS -> nombre corto en el NetCDF
+SHORT_NAMES = dict(zip(VARIABLES, ["tp", "t2m", "swvl1", "swvl2", "swvl3", "swvl4", "ssrd", "pev", "e"]))
+
+# Dimensión temporal de los NetCDF que entrega el CDS
+TIME_DIM = "valid_time"
+
+# Bloques de 12 pasos de tiempo: la memoria pico depende de este tamaño, no de la grilla
+DEFAULT_CHUNKS = {TIME_DIM: 12}
+
+BBOX_RIOHACHA = {
+    "north": 11.80,
+    "south": 11.30,
+    "west": -73.20,
+    "east": -72.60,
+}
+
+
+def build_request(years, months, bbox=BBOX_RIOHACHA, variables=VARIABLES) -> dict:
+    """Arma el diccionario de petición CDS para los años y meses indicados."""
+    return {
+        "product_type": "monthly_averaged_reanalysis",
+        "variable": list(variables),
+        "year": [str(y) for y in years],
+        "month": [f"{int(m):02d}" for m in months],
+        "time": "00:00",
+        "area": [
+            bbox["north"],
+            bbox["west"],
+            bbox["south"],
+            bbox["east"],
+        ],
+        "format": "netcdf",
+    }
+
+
+def default_chunks():
+    """``DEFAULT_CHUNKS`` si dask está instalado; si no, ``None`` (lectura normal)."""
+    try:
+        import dask  # noqa: F401
+    except ImportError:
+        return None
+    return DEFAULT_CHUNKS
+
+
+def open_download(path, chunks=None):
+    """
+    Abre el archivo devuelto por el CDS.
+
+    El CDS entrega un .zip con ``data_stream-moda.nc`` adentro; se extrae en una
+    carpeta propia junto al zip para no pisar descargas anteriores. Con ``chunks``
+    el archivo se abre de forma perezosa (dask) en bloques de ese tamaño.
+    """
+    import xarray as xr
+
+    path = Path(path)
+    if zipfile.is_zipfile(path):
+        out_dir = path.with_suffix("")
+        out_dir.mkdir(parents=True, exist_ok=True)
+        with zipfile.ZipFile(path) as zf:
+            names = [n for n in zf.namelist() if n.endswith(".nc")]
+            zf.extractall(out_dir, members=names)
+        datasets = [xr.open_dataset(out_dir / n, chunks=chunks) for n in names]
+        return datasets[0] if len(datasets) == 1 else xr.merge(datasets)
+    return xr.open_dataset(path, chunks=chunks)
+
+
+def _is_monthly(times) -> bool:
+    times = pd.DatetimeIndex(times)
+    return bool((times.is_month_start & (times == times.normalize())).all())
+
+
+def spatial_mean(ds, time_dim: str = TIME_DIM):
+    """
+    Promedio espacial por variable directamente sobre el cubo (ignorando NaN).
+
+    Reduce todas las dimensiones distintas de ``time_dim`` (lat, lon, number...)
+    sin pasar por un DataFrame largo. Si los datos son horarios o diarios, se
+    agregan además a inicio de mes. Con un dataset abierto con ``chunks`` todo
+    queda perezoso hasta el ``compute()``.
+    """
+    cols = [c for c in VALUE_COLS if c in ds.data_vars]
+    cube = ds[cols].drop_vars(["number", "expver"], errors="ignore")
+    other_dims = [d for d in cube.dims if d != time_dim]
+    reduced = cube.mean(dim=other_dims, skipna=True)
+    if not _is_monthly(ds[time_dim].values):
+        reduced = reduced.resample({time_dim: "MS"}).mean(skipna=True)
+    return reduced
+
+
+def era5_to_monthly_df(ds, lazy: bool = False):
+    """
+    Convierte ERA5-Land a DataFrame mensual promedio.
+
+    ``lazy=True`` reduce el cubo por bloques con :func:`spatial_mean` y solo arma
+    el DataFrame de 9 columnas al final; la opción por defecto conserva el camino
+    original (``to_dataframe`` + ``dropna`` + ``groupby``).
+    """
+    if lazy:
+        df = spatial_mean(ds).compute().to_dataframe().reset_index()
+        df[TIME_DIM] = pd.to_datetime(df[TIME_DIM])
+        return df[[TIME_DIM] + [c for c in VALUE_COLS if c in df.columns]]
+
+    # Pasar a DataFrame y limpiar
+    df = ds.to_dataframe().dropna().reset_index()
+    df = df.drop(["number", "expver"], axis=1, errors="ignore")
+    df["valid_time"] = pd.to_datetime(df["valid_time"])
+
+    # Promedio por mes
+    df_monthly = (
+        df.groupby("valid_time", as_index=False)[VALUE_COLS]
+          .mean()
+    )
+
+    return df_monthly
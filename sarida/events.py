@@ -0,0 +1,139 @@
+"""
+Catálogo de eventos de sequía por teoría de rachas (run theory).
+
+Un evento es una racha de meses consecutivos con el índice por debajo de
+``threshold`` (−1, sequía moderada en la escala de McKee). De cada uno se
+guardan el inicio, el fin, la duración, la severidad (suma de −índice en la
+racha), la intensidad media y el pico (el valor mínimo y su mes).
+
+Todas las columnas ``SPI_k``/``SPEI_k`` se procesan juntas: las rachas salen de
+las diferencias de una sola matriz booleana (tiempo × índices) y las sumas y
+mínimos por evento de ``np.add.reduceat``/``np.minimum.reduceat``, sin bucles
+por índice ni por evento.
+
+:class:`EventCatalogue` indexa los eventos con un ``pd.IntervalIndex`` para
+responder "qué eventos se solapan con esta ventana" con búsquedas binarias.
+"""
+import numpy as np
+import pandas as pd
+
+from sarida.era5 import TIME_DIM
+
+THRESHOLD = -1.0
+INDEX_PREFIXES = ("SPI_", "SPEI_")
+
+
+def index_columns(df: pd.DataFrame) -> list:
+    """Columnas de índices estandarizados presentes en ``df``."""
+    return [c for c in df.columns if str(c).startswith(INDEX_PREFIXES)]
+
+
+def detect_events(df: pd.DataFrame, columns=None, threshold: float = THRESHOLD,
+                  min_duration: int = 1, time_col: str = TIME_DIM) -> pd.DataFrame:
+    """
+    Eventos de todas las ``columns`` (por defecto, todos los SPI/SPEI) a la vez.
+
+    ``df`` es la serie mensual ordenable por ``time_col``. Los NaN cortan las
+    rachas. Devuelve una fila por evento, ordenada por índice e inicio.
+    """
+    df = df.sort_values(time_col)
+    columns = index_columns(df) if columns is None else list(columns)
+    times = pd.DatetimeIndex(df[time_col])
+    values = df[columns].to_numpy(dtype=float)              # (T, C)
+    n_t, n_c = values.shape
+
+    # Una fila de relleno por columna separa las rachas de columnas vecinas
+    below = np.zeros((n_t + 1, n_c), dtype=bool)
+    with np.errstate(invalid="ignore"):
+        below[:n_t] = values < threshold
+    flat = below.T.ravel()
+    edges = np.diff(np.concatenate([[False], flat]).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)                      # exclusivo
+
+    keep = (ends - starts) >= min_duration
+    starts, ends = starts[keep], ends[keep]
+    if starts.size == 0:
+        return pd.DataFrame(columns=["index", "start", "end", "duration", "severity",
+                                     "intensity", "peak", "peak_time"])
+
+    vals = np.concatenate([values.T, np.full((n_c, 1), np.nan)], axis=1).ravel()
+    # reduceat con cortes intercalados [inicio, fin, inicio, fin, ...]: los
+    # tramos pares son los eventos (sin NaN); los impares se descartan
+    cuts = np.column_stack([starts, ends]).ravel()
+    with np.errstate(invalid="ignore"):
+        severity = -np.add.reduceat(vals, cuts)[::2]
+        peak = np.minimum.reduceat(vals, cuts)[::2]
+
+    # Primer mes en que se alcanza el pico de cada evento
+    members = _ranges(starts, ends)
+    event_id = np.repeat(np.arange(starts.size), ends - starts)
+    hits = np.flatnonzero(vals[members] == peak[event_id])
+    first = hits[np.unique(event_id[hits], return_index=True)[1]]
+
+    # Posición plana -> (columna, fila)
+    stride = n_t + 1
+    duration = ends - starts
+    return pd.DataFrame({
+        "index": np.asarray(columns, dtype=object)[starts // stride],
+        "start": times[starts % stride],
+        "end": times[(ends - 1) % stride],
+        "duration": duration,
+        "severity": severity,
+        "intensity": severity / duration,
+        "peak": peak,
+        "peak_time": times[members[first] % stride],
+    })
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Concatenación vectorizada de ``arange(s, e)`` para cada par."""
+    lengths = ends - starts
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(lengths.sum()) + offsets
+
+
+class EventCatalogue:
+    """
+    Eventos indexados por intervalo ``[inicio, fin del último mes)``.
+
+    ``events`` es el resultado de :func:`detect_events` con un
+    ``pd.IntervalIndex``; :meth:`overlapping` filtra por ventana e índice.
+    """
+
+    def __init__(self, events: pd.DataFrame):
+        end = pd.DatetimeIndex(events["end"]) + pd.offsets.MonthBegin(1)
+        self.events = events.set_index(
+            pd.IntervalIndex.from_arrays(pd.DatetimeIndex(events["start"]), end, closed="left")
+        )
+        # En ns, igual que ``Timestamp.value`` en :meth:`overlapping`, sea cual
+        # sea la unidad de las fechas de ``events``
+        self._left = self.events.index.left.as_unit("ns").asi8
+        self._right = self.events.index.right.as_unit("ns").asi8
+        # Los eventos de un mismo índice no se solapan y están ordenados, así que
+        # los que tocan una ventana son un tramo contiguo de su grupo
+        self._groups = {}
+        for name, pos in self.events.groupby("index", sort=False).indices.items():
+            self._groups[name] = (pos, self._left[pos], self._right[pos])
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, columns=None, threshold: float = THRESHOLD,
+                   min_duration: int = 1, time_col: str = TIME_DIM) -> "EventCatalogue":
+        return cls(detect_events(df, columns, threshold, min_duration, time_col))
+
+    def overlapping(self, start, end, index: str = None) -> pd.DataFrame:
+        """Eventos (de ``index`` o de todos) que se solapan con ``[start, end]``."""
+        lo_t = pd.Timestamp(start).as_unit("ns").value
+        hi_t = pd.Timestamp(end).as_unit("ns").value
+        if index is None:
+            mask = (self._left <= hi_t) & (self._right > lo_t)
+            return self.events.iloc[np.flatnonzero(mask)]
+        if index not in self._groups:
+            return self.events.iloc[:0]
+        pos, left, right = self._groups[index]
+        lo = np.searchsorted(right, lo_t, side="right")
+        hi = np.searchsorted(left, hi_t, side="right")
+        return self.events.iloc[pos[lo:hi]]
+
+    def __len__(self) -> int:
+        return len(self.events)
@@ -0,0 +1,176 @@
+"""
+Peligro de incendio: Código de Sequía (DC) del sistema canadiense FWI.
+
+El FWI completo necesita humedad relativa y viento al mediodía, que no están en
+el dataset. El DC solo usa temperatura y lluvia, y es el código del sistema que
+sigue la sequía de los combustibles gruesos y el suelo orgánico profundo, así
+que se puede calcular con las variables ERA5 que ya tenemos:
+
+- :func:`drought_code_daily`: ecuaciones diarias de Van Wagner (1987).
+- :func:`drought_code_monthly`: versión mensual de Girardin y Wotton (2009)
+  para series mensuales como ``data_stream-moda.nc``.
+
+Ambas son recurrencias en el tiempo. El bucle es sobre los pasos de tiempo y
+cada paso actualiza toda la grilla a la vez con operaciones de numpy, nunca
+celda por celda. :func:`cached_fire` guarda la serie de la caja y la grilla en
+un NetCDF por huella del archivo de entrada para que el dashboard no recalcule.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from sarida.era5 import TIME_DIM
+
+DC_START = 15.0   # valor inicial estándar (suelo saturado)
+
+# Factor de duración del día por mes (Van Wagner 1987); entre 20°S y 20°N se
+# usa 1.4 todo el año, como en cffdrs.
+LF_NORTH = np.array([-1.6, -1.6, -1.6, 0.9, 3.8, 5.8, 6.4, 5.0, 2.4, 0.4, -1.6, -1.6])
+LF_SOUTH = np.array([6.4, 5.0, 2.4, 0.4, -1.6, -1.6, -1.6, -1.6, -1.6, 0.9, 3.8, 5.8])
+LF_TROPICS = 1.4
+
+# Clases de peligro del DC (límite superior, etiqueta)
+DC_CLASSES = [(80, "Bajo"), (190, "Moderado"), (300, "Alto"), (425, "Muy alto"), (np.inf, "Extremo")]
+
+
+def day_length_factor(months, lat) -> np.ndarray:
+    """``Lf`` para cada mes (``(T,)``) y latitud (cualquier forma): ``(T, *lat.shape)``."""
+    idx = np.asarray(months) - 1
+    lat = np.asarray(lat, dtype=float)
+    north = LF_NORTH[idx].reshape((-1,) + (1,) * lat.ndim)
+    south = LF_SOUTH[idx].reshape((-1,) + (1,) * lat.ndim)
+    return np.where(lat > 20, north, np.where(lat < -20, south, LF_TROPICS))
+
+
+def _recurrence(step, temp, rain, lf, dc0):
+    """Aplica ``step`` paso a paso sobre toda la grilla; los pasos sin dato dan NaN."""
+    dc = np.full(temp.shape[1:], dc0, dtype=float)
+    out = np.full(temp.shape, np.nan)
+    with np.errstate(invalid="ignore"):
+        for t in range(temp.shape[0]):
+            ok = np.isfinite(temp[t]) & np.isfinite(rain[t])
+            # Sin dato se conserva el estado anterior
+            dc = np.where(ok, step(dc, temp[t], rain[t], lf[t], t), dc)
+            out[t] = np.where(ok, dc, np.nan)
+    return out
+
+
+def drought_code_daily(temp_c, rain_mm, months, lat, dc0: float = DC_START) -> np.ndarray:
+    """
+    DC diario. ``temp_c`` (°C al mediodía o máxima) y ``rain_mm`` (mm en 24 h)
+    son ``(tiempo, ...)``; ``months`` es el mes de cada día y ``lat`` se
+    difunde contra las dimensiones espaciales.
+    """
+    temp = np.asarray(temp_c, dtype=float)
+    rain = np.asarray(rain_mm, dtype=float)
+    lf = day_length_factor(months, np.broadcast_to(lat, temp.shape[1:]))
+
+    def step(dc, t, p, lf, _):
+        # Lluvia efectiva por encima de 2.8 mm
+        rd = 0.83 * p - 1.27
+        qr = 800.0 * np.exp(-dc / 400.0) + 3.937 * rd
+        wet = np.maximum(400.0 * np.log(800.0 / np.where(p > 2.8, qr, 800.0)), 0.0)
+        dc = np.where(p > 2.8, wet, dc)
+        v = np.maximum(0.36 * (np.maximum(t, -2.8) + 2.8) + lf, 0.0)
+        return dc + 0.5 * v
+
+    return _recurrence(step, temp, rain, lf, dc0)
+
+
+def drought_code_monthly(tmax_c, rain_mm, times, lat, dc0: float = DC_START) -> np.ndarray:
+    """
+    DC mensual (Girardin y Wotton 2009). ``tmax_c`` es la media de máximas
+    diarias del mes (°C) y ``rain_mm`` la lluvia total del mes; ambos
+    ``(tiempo, ...)``.
+    """
+    times = pd.DatetimeIndex(times)
+    temp = np.asarray(tmax_c, dtype=float)
+    rain = np.asarray(rain_mm, dtype=float)
+    lf = day_length_factor(times.month, np.broadcast_to(lat, temp.shape[1:]))
+    n_days = np.asarray(times.days_in_month, dtype=float)
+
+    def step(dc, t, p, lf, i):
+        em = np.maximum(n_days[i] * (0.36 * t + lf), 0.0)
+        half = dc + 0.25 * em
+        qmr = 800.0 * np.exp(-half / 400.0) + 3.937 * 0.83 * p
+        return np.maximum(400.0 * np.log(800.0 / qmr), 0.0) + 0.25 * em
+
+    return _recurrence(step, temp, rain, lf, dc0)
+
+
+def dc_class(dc) -> np.ndarray:
+    """Etiqueta de peligro para cada valor de DC (cadena vacía si es NaN)."""
+    dc = np.asarray(dc, dtype=float)
+    bounds = [b for b, _ in DC_CLASSES]
+    labels = np.array([name for _, name in DC_CLASSES] + [""])
+    idx = np.where(np.isfinite(dc), np.searchsorted(bounds, dc, side="right"), len(DC_CLASSES))
+    return labels[np.minimum(idx, len(labels) - 1)]
+
+
+def fire_dataset(ds):
+    """
+    DC mensual de la grilla y de la caja para un dataset ERA5 mensual.
+
+    Usa ``t2m_max`` si existe (salida de :mod:`sarida.hourly`) y si no ``t2m``,
+    que subestima la máxima y por lo tanto el DC. Devuelve un ``xr.Dataset``
+    con ``DC`` (tiempo × lat × lon) y ``DC_caja`` (serie de la caja).
+    """
+    import xarray as xr
+
+    ds = ds.drop_vars(["number", "expver"], errors="ignore").sortby(TIME_DIM)
+    times = pd.DatetimeIndex(ds[TIME_DIM].values)
+    temp_var = "t2m_max" if "t2m_max" in ds else "t2m"
+    cube = ds[[temp_var, "tp"]].transpose(TIME_DIM, "latitude", "longitude")
+    lat = cube["latitude"].values[:, None]
+
+    days = np.asarray(times.days_in_month, dtype=float)[:, None, None]
+    tmax = cube[temp_var].values.astype(float) - 273.15
+    rain = cube["tp"].values.astype(float) * days * 1000.0
+    grid = drought_code_monthly(tmax, rain, times, lat)
+
+    # La caja: DC de las variables promediadas, igual que el SPEI de la serie
+    box = drought_code_monthly(
+        np.nanmean(tmax, axis=(1, 2))[:, None], np.nanmean(rain, axis=(1, 2))[:, None],
+        times, float(np.mean(lat)),
+    )[:, 0]
+    return xr.Dataset(
+        {
+            "DC": ((TIME_DIM, "latitude", "longitude"), grid.astype("float32")),
+            "DC_caja": ((TIME_DIM,), box),
+        },
+        coords={TIME_DIM: times, "latitude": cube["latitude"], "longitude": cube["longitude"]},
+        attrs={"temperatura": temp_var},
+    )
+
+
+def cached_fire(path, cache_dir):
+    """
+    :func:`fire_dataset` de un NetCDF mensual, guardado por huella del archivo.
+
+    El resultado vive en ``cache_dir/fuego_<sha256>.nc`` y se reutiliza
+    mientras el archivo de entrada no cambie.
+    """
+    import xarray as xr
+
+    from sarida.assets import sha256_file
+
+    cache = Path(cache_dir) / f"fuego_{sha256_file(path)[:16]}.nc"
+    if cache.exists():
+        return xr.load_dataset(cache)
+
+    with xr.open_dataset(path) as ds:
+        out = fire_dataset(ds)
+    cache.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cache.with_suffix(".nc.tmp")
+    out.to_netcdf(tmp)
+    tmp.replace(cache)
+    return out
+
+
+def fire_series(fire) -> pd.DataFrame:
+    """Serie de la caja (``valid_time``, ``DC``, ``DC_clase``) para graficar."""
+    df = pd.DataFrame({TIME_DIM: pd.DatetimeIndex(fire[TIME_DIM].values),
+                       "DC": fire["DC_caja"].values})
+    df["DC_clase"] = dc_class(df["DC"])
+    return df
@@ -0,0 +1,211 @@
+"""
+SPI/SPEI por píxel sobre el cubo ERA5.
+
+Los índices de los notebooks salen de la serie promediada en la caja, así que no
+dicen en qué parte de Riohacha la sequía es peor. Aquí se calculan en cada celda
+del cubo Zarr (:class:`~sarida.cube.CubeStore`):
+
+- La grilla se recorre en bloques espaciales alineados con los bloques del cubo
+  (32 × 32 celdas, toda la serie de tiempo). Cada bloque es independiente: lee
+  ``tp`` y ``pev``, ajusta todas sus distribuciones de una vez con
+  :func:`sarida.indices.spi_spei` y escribe su región del resultado.
+- Los bloques se reparten entre procesos; como ninguno toca los bloques Zarr de
+  otro, escriben directo al cubo sin pasar por el proceso principal. La memoria
+  por proceso depende del tamaño del bloque, no del dominio.
+- Los índices quedan en el cubo como variables ``SPI_k``/``SPEI_k``
+  (empaquetadas en int16 entre ±8.21).
+
+Igual que la serie de la caja, las distribuciones se calibran en
+:data:`sarida.calibration.DEFAULT_PERIOD` (SPI con gamma de 2 parámetros, SPEI
+con la log-logística por L-momentos) y ``pr``/``pet`` salen de
+:func:`sarida.indices.era5_pr_pet`. Los índices guardados coinciden con el
+cálculo en float64 de cada celda hasta medio paso del empaquetado int16.
+
+:func:`grid_trends` hace lo mismo con las tendencias: Mann-Kendall y pendiente
+de Sen (:func:`sarida.trends.mk_batch`) de cada píxel e índice, por bloques en
+paralelo, con corrección de Benjamini–Hochberg entre píxeles. Los mapas quedan
+en un NetCDF pequeño (índice × lat × lon) que el dashboard lee sin recalcular
+(``Dashboard/tendencias_pixel.nc``).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from sarida.calibration import DEFAULT_PERIOD, SPI_FLOC
+from sarida.cube import CubeStore
+from sarida.era5 import TIME_DIM
+from sarida.indices import SI_BOUND, WINDOWS, era5_pr_pet, spi_spei
+
+SPATIAL_DIMS = ("latitude", "longitude")
+
+
+def index_names(windows=WINDOWS) -> list:
+    return [f"SPI_{k}" for k in windows] + [f"SPEI_{k}" for k in windows]
+
+
+def spatial_blocks(store: CubeStore, var: str = "tp") -> list:
+    """Regiones ``{dim: slice}`` que cubren la grilla, una por bloque Zarr."""
+    ds = store.open(chunks=None)
+    chunks = dict(zip(ds[var].dims, ds[var].encoding["chunks"]))
+    ranges = [
+        [slice(i, min(i + chunks[d], ds.sizes[d])) for i in range(0, ds.sizes[d], chunks[d])]
+        for d in SPATIAL_DIMS
+    ]
+    return [dict(zip(SPATIAL_DIMS, (a, b))) for a in ranges[0] for b in ranges[1]]
+
+
+def _calibration_mask(times: pd.DatetimeIndex, period) -> np.ndarray:
+    if period is None:
+        return np.ones(len(times), dtype=bool)
+    start, end = (pd.Period(p, freq="M") for p in period)
+    months = times.to_period("M")
+    return np.asarray((months >= start) & (months <= end))
+
+
+def block_indices(root, region: dict, windows=WINDOWS, period=DEFAULT_PERIOD) -> dict:
+    """
+    Calcula y escribe los índices de una región del cubo.
+
+    Corre en un proceso aparte: abre el cubo por su cuenta y solo devuelve la
+    región procesada.
+    """
+    store = CubeStore(root)
+    ds = store.open(chunks=None)[["tp", "pev"]].isel(region)
+    ds = ds.transpose(*SPATIAL_DIMS, TIME_DIM)
+    times = pd.DatetimeIndex(ds[TIME_DIM].values)
+
+    pr, pet = era5_pr_pet(ds["tp"].values, ds["pev"].values)
+    spi, spei, _ = spi_spei(pr, pet, times.month, windows,
+                            fit_mask=_calibration_mask(times, period), spi_floc=SPI_FLOC)
+
+    dims = (TIME_DIM,) + SPATIAL_DIMS
+    out = xr.Dataset({
+        name: (dims, np.moveaxis(values, -1, 0).astype("float32"))
+        for name, values in zip(index_names(windows), list(spi) + list(spei))
+    })
+    store.write_region(out, {TIME_DIM: slice(None), **region})
+    return region
+
+
+def grid_indices(store: CubeStore, windows=WINDOWS, period=DEFAULT_PERIOD,
+                 workers: int = None) -> list:
+    """
+    SPI/SPEI de todas las celdas del cubo, escritos como variables nuevas.
+
+    ``workers`` es la cantidad de procesos (por defecto, uno por núcleo; con 1
+    se corre en el proceso actual). Si las variables ya existían se
+    sobrescriben. Devuelve los nombres escritos.
+    """
+    names = index_names(windows)
+    base = store.open()["tp"].drop_vars(["number", "expver"], errors="ignore")
+    template = xr.Dataset({
+        name: xr.full_like(base, np.nan, dtype="float32").assign_attrs({}) for name in names
+    })
+    packing = {**store.packing, **{name: (-SI_BOUND, SI_BOUND) for name in names}}
+    store.reserve_variables(template, packing=packing)
+
+    regions = spatial_blocks(store)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(regions) == 1:
+        for region in regions:
+            block_indices(store.root, region, windows, period)
+        return names
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(regions))) as pool:
+        futures = [
+            pool.submit(block_indices, store.root, region, windows, period)
+            for region in regions
+        ]
+        for fut in futures:
+            fut.result()
+    return names
+
+
+TREND_FIELDS = ("slope", "p", "z", "tau", "s")
+
+
+def _split_rows(regions: list, parts: int) -> list:
+    """Parte las regiones por latitud hasta tener al menos ``parts`` (sin escribir, no hace falta alinear)."""
+    out = list(regions)
+    while len(out) < parts:
+        widest = max(range(len(out)), key=lambda i: out[i]["latitude"].stop - out[i]["latitude"].start)
+        lat = out[widest]["latitude"]
+        if lat.stop - lat.start < 2:
+            break
+        mid = (lat.start + lat.stop) // 2
+        region = out.pop(widest)
+        out += [{**region, "latitude": slice(lat.start, mid)}, {**region, "latitude": slice(mid, lat.stop)}]
+    return out
+
+
+def block_trends(root, region: dict, names: list, alpha: float) -> tuple:
+    """Mann-Kendall de todos los píxeles e índices de una región; devuelve ``(región, campos)``."""
+    from sarida.trends import mk_batch
+
+    ds = CubeStore(root).open(chunks=None)[names].isel(region)
+    values = np.stack([ds[n].transpose(*SPATIAL_DIMS, TIME_DIM).values for n in names])
+    shape = values.shape[:-1]                                   # (índice, lat, lon)
+    result = mk_batch(values.reshape(-1, values.shape[-1]).astype(float), alpha)
+    return region, {f: np.asarray(result[f], dtype=float).reshape(shape) for f in TREND_FIELDS}
+
+
+def grid_trends(store: CubeStore, path, names=None, alpha: float = 0.05,
+                workers: int = None) -> xr.Dataset:
+    """
+    Mapas de tendencia de los índices por píxel del cubo, guardados en ``path``.
+
+    ``names`` son las variables del cubo (por defecto los SPI/SPEI que tenga).
+    Los bloques se reparten entre ``workers`` procesos y solo devuelven sus
+    resultados; la corrección FDR se hace al final, por índice, sobre todos los
+    píxeles. ``slope`` es la pendiente de Sen por mes.
+    """
+    ds = store.open(chunks=None)
+    names = [n for n in (names or index_names()) if n in ds.data_vars]
+    ny, nx = ds.sizes["latitude"], ds.sizes["longitude"]
+    fields = {f: np.full((len(names), ny, nx), np.nan) for f in TREND_FIELDS}
+
+    workers = workers or os.cpu_count() or 1
+    regions = _split_rows(spatial_blocks(store), workers)
+    if workers == 1 or len(regions) == 1:
+        results = [block_trends(store.root, r, names, alpha) for r in regions]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(regions))) as pool:
+            futures = [pool.submit(block_trends, store.root, r, names, alpha) for r in regions]
+            results = [fut.result() for fut in futures]
+    for region, block in results:
+        for f, values in block.items():
+            fields[f][:, region["latitude"], region["longitude"]] = values
+
+    from sarida.trends import fdr_qvalues
+
+    q = fdr_qvalues(fields["p"].reshape(len(names), -1)).reshape(fields["p"].shape)
+    dims = ("index",) + SPATIAL_DIMS
+    out = xr.Dataset(
+        {**{f: (dims, v.astype("float32")) for f, v in fields.items()},
+         "q": (dims, q.astype("float32")),
+         "significant": (dims, q <= alpha)},
+        coords={"index": names, "latitude": ds["latitude"].values, "longitude": ds["longitude"].values},
+        attrs={"alpha": alpha, "last_month": f"{pd.Timestamp(ds[TIME_DIM].values[-1]):%Y-%m}"},
+    )
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".nc.tmp")
+    out.to_netcdf(tmp)
+    tmp.replace(path)
+    return out
+
+
+def cached_grid_trends(store: CubeStore, path, names=None, alpha: float = 0.05,
+                       workers: int = None) -> xr.Dataset:
+    """Los mapas de ``path`` si están al día con el último mes del cubo; si no, :func:`grid_trends`."""
+    path = Path(path)
+    if path.exists():
+        maps = xr.load_dataset(path)
+        last = f"{store.times()[-1]:%Y-%m}"
+        if maps.attrs.get("last_month") == last and maps.attrs.get("alpha") == alpha:
+            return maps
+    return grid_trends(store, path, names, alpha, workers)
@@ -0,0 +1,170 @@
+"""
+Reductor en streaming de ERA5-Land horario (GRIB) a la serie mensual.
+
+Los archivos horarios se leen mensaje por mensaje con ecCodes (la librería que
+ya usa ``cfgrib``): cada campo se promedia en la caja de estudio apenas se lee y
+solo se guardan acumuladores diarios/mensuales, así que la memoria no depende
+del tamaño del archivo ni de la grilla.
+
+A diferencia de ``days = 30`` en los notebooks, aquí salen totales mensuales
+reales y extremos diarios:
+
+- ``tp``, ``e``, ``pev``, ``ssrd`` en ERA5-Land horario se acumulan desde las
+  00 UTC; el campo de las 00 UTC trae el total del día anterior.
+- ``t2m`` y ``swvl1``–``swvl4`` son instantáneos y se promedian.
+
+La salida tiene las 9 columnas de siempre en las unidades de
+``reanalysis-era5-land-monthly-means`` (acumulados como promedio diario), más
+``tp_total`` (m/mes), ``t2m_max`` (media de máximas diarias, K),
+``t2m_max_abs`` (K), ``dry_days`` (días con lluvia < 1 mm) y ``days``.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from sarida.era5 import BBOX_RIOHACHA, TIME_DIM, VALUE_COLS
+
+ACCUMULATED = ("tp", "e", "pev", "ssrd")
+INSTANT = ("t2m", "swvl1", "swvl2", "swvl3", "swvl4")
+
+# Umbral de día seco (m de lluvia en el día)
+DRY_DAY_M = 0.001
+
+
+class MonthlyAccumulator:
+    """
+    Acumula valores horarios ya promediados en la caja.
+
+    Guarda sumas por mes para las variables instantáneas y un valor por día para
+    los acumulados y la máxima de ``t2m``; :meth:`to_frame` arma el resultado.
+    """
+
+    def __init__(self, min_coverage: float = 0.9):
+        self.min_coverage = min_coverage
+        self.sums = defaultdict(float)          # (var, mes) -> suma horaria
+        self.counts = defaultdict(int)          # (var, mes) -> horas con dato
+        self.daily_totals = defaultdict(dict)   # (var, mes) -> {día: total del día}
+        self.daily_tmax = defaultdict(dict)     # mes -> {día: máxima horaria de t2m}
+
+    def add(self, var: str, valid_time: datetime, value: float):
+        if np.isnan(value):
+            return
+        if var in ACCUMULATED:
+            # El campo de las 00 UTC cierra el día anterior
+            if valid_time.hour == 0:
+                day = (valid_time - timedelta(days=1)).date()
+                self.daily_totals[(var, (day.year, day.month))][day] = value
+            return
+        month = (valid_time.year, valid_time.month)
+        self.sums[(var, month)] += value
+        self.counts[(var, month)] += 1
+        if var == "t2m":
+            days = self.daily_tmax[month]
+            day = valid_time.date()
+            days[day] = max(days.get(day, -np.inf), value)
+
+    def to_frame(self) -> pd.DataFrame:
+        months = {m for _, m in self.counts} | {m for _, m in self.daily_totals}
+        rows = []
+        for month in sorted(months):
+            start = pd.Timestamp(year=month[0], month=month[1], day=1)
+            n_days = start.days_in_month
+            row = {TIME_DIM: start}
+
+            for var in INSTANT:
+                n = self.counts.get((var, month), 0)
+                # Cobertura: horas con dato / horas del mes
+                row[var] = self.sums[(var, month)] / n if n >= self.min_coverage * 24 * n_days else np.nan
+
+            days_with_data = 0
+            for var in ACCUMULATED:
+                vals = list(self.daily_totals.get((var, month), {}).values())
+                days_with_data = max(days_with_data, len(vals))
+                row[var] = np.mean(vals) if len(vals) >= self.min_coverage * n_days else np.nan
+
+            tp_days = np.array(list(self.daily_totals.get(("tp", month), {}).values()))
+            tmax = list(self.daily_tmax.get(month, {}).values())
+            row["tp_total"] = row["tp"] * n_days
+            row["t2m_max"] = np.mean(tmax) if len(tmax) >= self.min_coverage * n_days else np.nan
+            row["t2m_max_abs"] = max(tmax) if tmax else np.nan
+            row["dry_days"] = int((tp_days < DRY_DAY_M).sum()) if tp_days.size else np.nan
+            row["days"] = days_with_data
+            rows.append(row)
+
+        df = pd.DataFrame(rows)
+        if df.empty:
+            return df
+        # Meses sin ninguna variable completa (bordes del archivo) se descartan
+        df = df.dropna(subset=VALUE_COLS, how="all")
+        extra = ["tp_total", "t2m_max", "t2m_max_abs", "dry_days", "days"]
+        return df[[TIME_DIM] + VALUE_COLS + extra].reset_index(drop=True)
+
+
+def iter_grib_fields(path):
+    """
+    Recorre un GRIB mensaje por mensaje.
+
+    Produce ``(shortName, valid_time, latitudes, longitudes, values)`` con los
+    valores faltantes como NaN; solo hay un campo en memoria a la vez.
+    """
+    from eccodes import (
+        codes_get, codes_get_array, codes_get_values, codes_grib_new_from_file, codes_release,
+    )
+
+    grid_cache = {}
+    with open(path, "rb") as f:
+        while True:
+            gid = codes_grib_new_from_file(f)
+            if gid is None:
+                break
+            try:
+                name = codes_get(gid, "shortName")
+                date = codes_get(gid, "validityDate")
+                hhmm = codes_get(gid, "validityTime")
+                valid_time = datetime.strptime(f"{date}{hhmm:04d}", "%Y%m%d%H%M")
+
+                grid_id = codes_get(gid, "md5GridSection")
+                if grid_id not in grid_cache:
+                    grid_cache[grid_id] = (
+                        codes_get_array(gid, "latitudes"),
+                        codes_get_array(gid, "longitudes"),
+                    )
+                lats, lons = grid_cache[grid_id]
+
+                values = codes_get_values(gid).astype(float)
+                if codes_get(gid, "bitmapPresent"):
+                    values[values == codes_get(gid, "missingValue")] = np.nan
+            finally:
+                codes_release(gid)
+            yield name, valid_time, lats, lons, values
+
+
+def reduce_hourly_grib(paths, bbox=BBOX_RIOHACHA, min_coverage: float = 0.9) -> pd.DataFrame:
+    """
+    Reduce uno o varios GRIB horarios de ERA5-Land a la serie mensual.
+
+    Cada campo se promedia dentro de ``bbox`` (ignorando NaN) en cuanto se lee.
+    """
+    if isinstance(paths, (str, bytes)) or hasattr(paths, "__fspath__"):
+        paths = [paths]
+
+    acc = MonthlyAccumulator(min_coverage=min_coverage)
+    masks = {}
+    for path in paths:
+        for name, valid_time, lats, lons, values in iter_grib_fields(path):
+            if name == "2t":
+                name = "t2m"
+            if name not in VALUE_COLS:
+                continue
+            key = (lats.size, lats[0], lats[-1], lons[0], lons[-1])
+            if key not in masks:
+                lon180 = np.where(lons > 180, lons - 360, lons)
+                masks[key] = (
+                    (lats <= bbox["north"]) & (lats >= bbox["south"])
+                    & (lon180 >= bbox["west"]) & (lon180 <= bbox["east"])
+                )
+            box = values[masks[key]]
+            acc.add(name, valid_time, np.nanmean(box) if np.isfinite(box).any() else np.nan)
+    return acc.to_frame()
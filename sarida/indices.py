@@ -0,0 +1,415 @@
+"""
+Motor vectorizado de SPI/SPEI para todas las ventanas de acumulación.
+
+Los notebooks llamaban ``xc.indices.spi``/``spei`` una vez por ventana
+(8 pasadas de media móvil + ajuste, cada una armando un objeto xarray). Aquí:
+
+1. Todas las medias móviles salen de una sola suma acumulada
+   (:func:`rolling_means`).
+2. Las series (ventanas × SPI/SPEI × celdas) se reparten por mes calendario en
+   una matriz ``(grupos, años)`` y todas las distribuciones se ajustan a la vez
+   (:func:`fit_gamma`, :func:`fit_glo`).
+3. La transformación a la normal estándar usa ``gammainc``/``expit``/``ndtri``
+   sobre todo el arreglo.
+
+El SPI replica la configuración por defecto de xclim: gamma de 3 parámetros por
+máxima verosimilitud con inflación de ceros (posición ``ecdf``, ``upper``). Con
+``spi_floc`` usa en cambio la gamma de 2 parámetros (``loc`` fijo), que es lo
+que se usa con un periodo de calibración fijo (:mod:`sarida.calibration`).
+
+El SPEI usa la log-logística de 3 parámetros ajustada por L-momentos, la
+distribución del SPEI original (Vicente-Serrano et al. 2010; la ``parglo`` del
+paquete ``SPEI`` de R). La gamma de 3 parámetros por máxima verosimilitud
+ponía ``loc`` sobre el mínimo de la muestra: el mes más seco del ajuste
+quedaba en SPEI ≈ −7 y diferencias de ~1e-8 en la entrada movían el índice
+hasta ~1. Los L-momentos son combinaciones lineales de la muestra ordenada, así
+que el ajuste es estable y su cota queda lejos de los datos.
+
+Medias móviles sin saltar NaN y resultado acotado a ±8.21, como en xclim. Todo
+se calcula en float64.
+"""
+import numpy as np
+import pandas as pd
+from scipy import special
+
+from sarida.era5 import TIME_DIM
+from sarida.extremes import lmoments
+
+WINDOWS = (1, 3, 6, 12)
+DAYS = 30          # mismo ``days = 30`` de los notebooks
+SI_BOUND = 8.21    # cota de xclim para el índice estandarizado
+
+# Nelder–Mead de ``scipy.optimize.fmin`` (el que usa ``rv_continuous.fit``)
+_NM_MAXFUN = 600   # 200 × 3 parámetros
+_NM_XTOL = 1e-4
+_NM_FTOL = 1e-4
+_PENALTY = np.log(np.finfo(float).max) * 100
+# Newton para la forma de la gamma con ``loc`` fijo
+_ML_NEWTON = 50
+_ML_TOL = 1e-12
+# |k| por debajo del cual la log-logística se toma como logística (límite k → 0)
+_GLO_SMALL = 1e-6
+
+
+def rolling_means(x: np.ndarray, windows=WINDOWS) -> np.ndarray:
+    """
+    Medias móviles de ``x`` (``(..., tiempo)``) para todas las ventanas.
+
+    Una sola suma acumulada sirve para todas; una ventana con algún NaN da NaN
+    (igual que ``rolling(...).mean(skipna=False)``). Devuelve
+    ``(len(windows), ..., tiempo)``.
+    """
+    x = np.asarray(x, dtype=float)
+    valid = np.isfinite(x)
+    pad = [(0, 0)] * (x.ndim - 1) + [(1, 0)]
+    csum = np.pad(np.cumsum(np.where(valid, x, 0.0), axis=-1), pad)
+    ccount = np.pad(np.cumsum(valid, axis=-1), pad)
+
+    out = np.full((len(windows),) + x.shape, np.nan)
+    for i, k in enumerate(windows):
+        s = csum[..., k:] - csum[..., :-k]
+        n = ccount[..., k:] - ccount[..., :-k]
+        out[i, ..., k - 1:] = np.where(n == k, s / k, np.nan)
+    return out
+
+
+def _by_month(x: np.ndarray, months: np.ndarray):
+    """
+    Reparte ``x`` (``(series, tiempo)``) por mes calendario.
+
+    Devuelve la matriz ``(series, 12, años)`` rellena con NaN.
+    """
+    counts = np.bincount(months, minlength=13)[1:]
+    out = np.full(x.shape[:1] + (12, counts.max()), np.nan)
+    for m in range(1, 13):
+        sel = months == m
+        out[:, m - 1, :sel.sum()] = x[:, sel]
+    return out
+
+
+def _fit_start(x: np.ndarray, valid: np.ndarray, n: np.ndarray) -> np.ndarray:
+    """
+    Punto de partida ``(a, loc, scale)`` por fila, como ``xclim.indices.stats._fit_start``.
+
+    ``loc`` inicial por el estimador de Cooke (mínimo, segundo mínimo y máximo)
+    y forma por la aproximación de Thom sobre los datos desplazados.
+    """
+    xs = np.sort(np.where(valid, x, np.inf), axis=1)
+    rows = np.arange(len(x))
+    x1, x2 = xs[:, 0], xs[:, np.minimum(1, xs.shape[1] - 1)]
+    xn = xs[rows, np.maximum(n - 1, 0)]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        loc0 = (x1 * xn - x2 ** 2) / (x1 + xn - 2 * x2)
+        loc0 = np.where(loc0 < x1, loc0, x1 - 0.0001 * np.abs(x1))
+        y = x - loc0[:, None]
+        pos = valid & (y > 0)
+        npos = pos.sum(axis=1)
+        m = np.where(pos, y, 0.0).sum(axis=1) / npos
+        mean_log = np.where(pos, np.log(np.where(pos, y, 1.0)), 0.0).sum(axis=1) / npos
+        A = np.log(m) - mean_log
+        a0 = (1 + np.sqrt(1 + 4 * A / 3)) / (4 * A)
+    return np.stack([a0, loc0, m / a0], axis=-1)
+
+
+def _nnlf(theta: np.ndarray, x: np.ndarray, n: np.ndarray) -> np.ndarray:
+    """
+    Log-verosimilitud negativa penalizada de scipy (``_penalized_nnlf``) por fila.
+
+    Los datos fuera del soporte o con densidad no finita suman una penalización
+    fija en vez de devolver infinito, igual que en ``rv_continuous.fit``.
+    """
+    a, loc, scale = theta[:, 0:1], theta[:, 1:2], theta[:, 2:3]
+    z = (x - loc) / scale
+    inside = z >= 0                      # los NaN de relleno quedan fuera
+    logpdf = special.xlogy(a - 1.0, z) - z - special.gammaln(a)
+    finite = inside & np.isfinite(logpdf)
+    total = np.where(finite, logpdf, 0.0).sum(axis=1)
+    out = -total + (n - finite.sum(axis=1)) * _PENALTY + n * np.log(scale[:, 0])
+    bad = ~((a[:, 0] > 0) & (scale[:, 0] > 0))
+    return np.where(bad, np.inf, out)
+
+
+def fit_gamma(samples: np.ndarray):
+    """
+    Gamma de 3 parámetros por máxima verosimilitud para cada fila de ``samples``.
+
+    ``samples`` es ``(grupos, n)`` con NaN de relleno. Reproduce el ajuste de
+    xclim (``_fit_start`` + ``scipy.stats.gamma.fit``, que minimiza con
+    Nelder–Mead) pero con los símplex de todos los grupos avanzando a la vez:
+    cada paso evalúa la verosimilitud de todos los grupos en una sola operación.
+    La verosimilitud de 3 parámetros es muy plana cuando los datos son casi
+    normales, así que seguir el mismo camino del optimizador es lo que permite
+    obtener los mismos parámetros que xclim. Devuelve ``(a, loc, scale)``; los
+    grupos con menos de 2 datos quedan en NaN.
+    """
+    x = np.asarray(samples, dtype=float)
+    valid = np.isfinite(x)
+    n = valid.sum(axis=1)
+    g = len(x)
+
+    x0 = _fit_start(x, valid, n)
+    fitted = (n >= 2) & np.isfinite(x0).all(axis=1)
+    sim = np.repeat(x0[:, None, :], 4, axis=1)
+    for k in range(3):
+        sim[:, k + 1, k] = np.where(sim[:, k + 1, k] != 0, 1.05 * sim[:, k + 1, k], 0.00025)
+    fsim = np.full((g, 4), np.inf)
+    if fitted.any():
+        with np.errstate(all="ignore"):
+            fsim[fitted] = np.stack(
+                [_nnlf(sim[fitted, k], x[fitted], n[fitted]) for k in range(4)], axis=1
+            )
+    calls = np.where(fitted, 4, 0)
+    iterations = np.ones(g, dtype=int)
+    order = np.argsort(fsim, axis=1, kind="stable")
+    sim = np.take_along_axis(sim, order[:, :, None], axis=1)
+    fsim = np.take_along_axis(fsim, order, axis=1)
+
+    active = fitted.copy()
+    err = np.seterr(all="ignore")
+    while True:
+        done = (
+            (np.abs(sim[:, 1:] - sim[:, :1]).max(axis=(1, 2)) <= _NM_XTOL)
+            & (np.abs(fsim[:, :1] - fsim[:, 1:]).max(axis=1) <= _NM_FTOL)
+        )
+        active &= ~done & (calls < _NM_MAXFUN) & (iterations < _NM_MAXFUN)
+        idx = np.flatnonzero(active)
+        if idx.size == 0:
+            break
+        # Solo se trabaja con los grupos que siguen activos
+        S, F, C = sim[idx], fsim[idx], calls[idx]
+        X, N = x[idx], n[idx]
+
+        xbar = S[:, :3].sum(axis=1) / 3
+        worst = S[:, 3]
+        xr = 2 * xbar - worst
+        fxr = _nnlf(xr, X, N)
+        C += 1
+
+        expand = fxr < F[:, 0]
+        take_r = ~expand & (fxr < F[:, 2])
+        outside = ~expand & ~take_r & (fxr < F[:, 3])
+        inside = ~expand & ~take_r & ~outside
+
+        # Segundo punto de la iteración: expansión o contracción (una sola evaluación)
+        coef = np.where(expand, 3.0, np.where(outside, 1.5, 0.5))[:, None]
+        x2 = coef * xbar + (1 - coef) * worst
+        second = ~take_r & (C < _NM_MAXFUN)
+        f2 = np.where(second, _nnlf(x2, X, N), np.inf)
+        C += second
+
+        use_2 = second & np.where(expand, f2 < fxr, np.where(outside, f2 <= fxr, f2 < F[:, 3]))
+        use_r = take_r | (second & expand & ~use_2)
+        S[use_2, 3], F[use_2, 3] = x2[use_2], f2[use_2]
+        S[use_r, 3], F[use_r, 3] = xr[use_r], fxr[use_r]
+
+        # Las iteraciones que se cortan por falta de llamadas no cuentan
+        finished = take_r | (second & (expand | use_2))
+        shrink = second & ~expand & ~use_2
+        for j in (1, 2, 3):
+            live = shrink & (C < _NM_MAXFUN)
+            S[shrink, j] = S[shrink, 0] + 0.5 * (S[shrink, j] - S[shrink, 0])
+            if live.any():
+                F[live, j] = _nnlf(S[live, j], X[live], N[live])
+            C += live
+            shrink = live
+        finished |= shrink
+
+        order = np.argsort(F, axis=1, kind="stable")
+        rows = np.arange(idx.size)[:, None]
+        sim[idx], fsim[idx] = S[rows, order], F[rows, order]
+        calls[idx] = C
+        iterations[idx] += finished
+    np.seterr(**err)
+
+    nan = np.full(g, np.nan)
+    return tuple(np.where(fitted, sim[:, 0, i], nan) for i in range(3))
+
+
+def fit_gamma_floc(samples: np.ndarray, loc=0.0):
+    """
+    Gamma de 2 parámetros (``loc`` fijo) por máxima verosimilitud para cada fila.
+
+    Con ``loc`` fijo la forma ``a`` resuelve ``log(a) − ψ(a) = log(media) −
+    media(log x)`` (lo mismo que ``scipy.stats.gamma.fit(x, floc=loc)``); se
+    parte de la aproximación de Thom y se refina con Newton en todas las filas a
+    la vez. Los datos ``<= loc`` no entran. Devuelve ``(a, loc, scale)``.
+    """
+    x = np.asarray(samples, dtype=float)
+    loc = np.broadcast_to(np.asarray(loc, dtype=float), (len(x),))
+    y = x - loc[:, None]
+    valid = np.isfinite(y) & (y > 0)
+    n = valid.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, y, 0.0).sum(axis=1) / n
+        s = np.log(mean) - np.where(valid, np.log(np.where(valid, y, 1.0)), 0.0).sum(axis=1) / n
+        a = (3 - s + np.sqrt((s - 3) ** 2 + 24 * s)) / (12 * s)
+        for _ in range(_ML_NEWTON):
+            step = (np.log(a) - special.digamma(a) - s) / (1 / a - special.polygamma(1, a))
+            a = a - step
+            if not (np.abs(step) > _ML_TOL * a).any():
+                break
+        scale = mean / a
+    fitted = (n >= 2) & (s > 0) & np.isfinite(a) & (a > 0)
+    nan = np.full(len(x), np.nan)
+    return np.where(fitted, a, nan), np.where(fitted, loc, nan), np.where(fitted, scale, nan)
+
+
+def fit_glo(samples: np.ndarray):
+    """
+    Log-logística de 3 parámetros por L-momentos para cada fila de ``samples``.
+
+    Es la logística generalizada de Hosking: ``k = −t3``, ``scale = l2·sin(kπ)/(kπ)``
+    y ``loc = l1 − scale·(1/k − π/sin(kπ))``, con cota inferior ``loc + scale/k``.
+    Las muestras con asimetría negativa darían ``k > 0``, una cota superior en
+    la que los meses más húmedos que la calibración se irían a +8.21; ahí se usa
+    el límite ``k = 0`` (logística, sin cotas). Devuelve ``(k, loc, scale)``;
+    los grupos con menos de 3 datos quedan en NaN.
+    """
+    l1, l2, t3, _ = lmoments(samples)
+    k = np.minimum(-t3, 0.0)
+    small = np.abs(k) < _GLO_SMALL
+    ks = np.where(small, 1.0, k)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scale = l2 * np.where(small, 1.0, np.sin(ks * np.pi) / (ks * np.pi))
+        loc = l1 - np.where(small, 0.0, scale * (1 / ks - np.pi / np.sin(ks * np.pi)))
+    fitted = np.isfinite(k) & (scale > 0)
+    nan = np.full(k.shape, np.nan)
+    return np.where(fitted, k, nan), np.where(fitted, loc, nan), np.where(fitted, scale, nan)
+
+
+def _glo_cdf(x, k, loc, scale):
+    """Función de distribución de :func:`fit_glo`; debajo de la cota vale 0."""
+    small = np.abs(k) < _GLO_SMALL
+    ks = np.where(small, 1.0, k)
+    z = (x - loc) / scale
+    arg = 1 - ks * z
+    with np.errstate(invalid="ignore", divide="ignore"):
+        y = np.where(arg > 0, -np.log(np.where(arg > 0, arg, 1.0)) / ks, np.where(ks < 0, -np.inf, np.inf))
+    return special.expit(np.where(small, z, y))
+
+
+def fit_params(series: np.ndarray, months: np.ndarray, zero_inflated, floc=None, glo=None) -> dict:
+    """
+    Parámetros por serie y mes calendario.
+
+    ``series`` es ``(series, tiempo)``; ``zero_inflated`` es un booleano por
+    serie. ``glo`` (booleano por serie) elige la log-logística de
+    :func:`fit_glo`; el resto usa la gamma. ``floc`` (por serie, NaN = libre)
+    fija el ``loc`` de la gamma; las series sin ``loc`` fijo usan la gamma de 3
+    parámetros de xclim. Devuelve arreglos ``(series, 12)``: ``a`` (forma; ``k``
+    en la log-logística), ``loc``, ``scale``, ``p0`` (probabilidad de cero) y
+    ``glo`` (1 en las filas log-logísticas).
+    """
+    grouped = _by_month(series, months)
+    s, _, years = grouped.shape
+    zero_inflated = np.broadcast_to(np.asarray(zero_inflated), (s,))
+    is_zero = (grouped == 0) & zero_inflated[:, None, None]
+    notnull = np.isfinite(grouped).sum(axis=2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p0 = np.where(zero_inflated[:, None], is_zero.sum(axis=2) / notnull, 0.0)
+    samples = np.where(is_zero, np.nan, grouped).reshape(s * 12, years)
+    floc = np.full(s, np.nan) if floc is None else np.broadcast_to(np.asarray(floc, dtype=float), (s,))
+    glo = np.zeros(s, dtype=bool) if glo is None else np.broadcast_to(np.asarray(glo, dtype=bool), (s,))
+    logistic = np.repeat(glo, 12)
+    fixed = np.repeat(np.isfinite(floc), 12) & ~logistic
+    free = ~fixed & ~logistic
+    a, loc, scale = (np.full(s * 12, np.nan) for _ in range(3))
+    if free.any():
+        a[free], loc[free], scale[free] = fit_gamma(samples[free])
+    if fixed.any():
+        a[fixed], loc[fixed], scale[fixed] = fit_gamma_floc(samples[fixed], np.repeat(floc, 12)[fixed])
+    if logistic.any():
+        a[logistic], loc[logistic], scale[logistic] = fit_glo(samples[logistic])
+    return {
+        "a": a.reshape(s, 12), "loc": loc.reshape(s, 12),
+        "scale": scale.reshape(s, 12), "p0": p0,
+        "glo": logistic.reshape(s, 12).astype(float),
+    }
+
+
+def standardize(series: np.ndarray, months: np.ndarray, params: dict) -> np.ndarray:
+    """
+    Transforma ``series`` (``(series, tiempo)``) a la normal estándar.
+
+    Los ``params`` sin ``glo`` (calibraciones guardadas antes de la
+    log-logística) son todos gamma.
+    """
+    idx = np.asarray(months) - 1
+    a, loc, scale, p0 = (params[k][:, idx] for k in ("a", "loc", "scale", "p0"))
+    glo = params["glo"][:, idx] > 0 if "glo" in params else np.zeros(a.shape, dtype=bool)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = np.clip((series - loc) / scale, 0, None)
+        cdf = np.where(glo, _glo_cdf(series, a, loc, scale), special.gammainc(a, z))
+        prob = np.where((series == 0) & (p0 > 0), p0, p0 + (1 - p0) * cdf)
+        si = special.ndtri(prob)
+    return np.where(np.isfinite(series), np.clip(si, -SI_BOUND, SI_BOUND), np.nan)
+
+
+def spi_spei(pr: np.ndarray, pet: np.ndarray, months, windows=WINDOWS, params=None,
+             fit_mask=None, spi_floc=None):
+    """
+    SPI y SPEI de todas las ventanas en un solo ajuste.
+
+    ``pr`` y ``pet`` son ``(..., tiempo)`` en la misma escala (mm/mes en los
+    notebooks). Devuelve ``(spi, spei, params)`` con ``spi``/``spei`` de forma
+    ``(len(windows), ..., tiempo)``. Si se pasan ``params`` (de una corrida
+    anterior) no se vuelve a ajustar. ``fit_mask`` (booleano por paso de tiempo)
+    limita el ajuste a un periodo de calibración; las medias móviles se siguen
+    calculando con toda la serie. ``spi_floc`` fija el ``loc`` de la gamma del
+    SPI (gamma de 2 parámetros, ver :mod:`sarida.calibration`). El SPEI siempre
+    usa la log-logística (:func:`fit_glo`).
+    """
+    pr = np.asarray(pr, dtype=float)
+    wb = pr - np.asarray(pet, dtype=float)
+    lead = pr.shape[:-1]
+    rolled = rolling_means(np.stack([pr, wb]), windows)      # (W, 2, ..., T)
+    flat = rolled.reshape(-1, pr.shape[-1])
+    months = np.asarray(months)
+    if params is None:
+        zero = np.zeros(rolled.shape[:-1], dtype=bool)
+        zero[:, 0] = True                                      # solo la lluvia
+        glo = np.zeros(rolled.shape[:-1], dtype=bool)
+        glo[:, 1] = True                                       # solo el balance
+        floc = np.full(rolled.shape[:-1], np.nan)
+        if spi_floc is not None:
+            floc[:, 0] = spi_floc
+        sample = flat if fit_mask is None else np.where(np.asarray(fit_mask), flat, np.nan)
+        params = fit_params(sample, months, zero.ravel(), floc.ravel(), glo.ravel())
+    si = standardize(flat, months, params).reshape(rolled.shape)
+    return si[:, 0].reshape((len(windows),) + lead + pr.shape[-1:]), \
+        si[:, 1].reshape((len(windows),) + lead + pr.shape[-1:]), params
+
+
+def indices_frame(pr, pet, times, windows=WINDOWS, params=None) -> pd.DataFrame:
+    """
+    Las columnas ``SPI_k``/``SPEI_k`` (en ese orden) indexadas por ``times``.
+
+    ``pr`` y ``pet`` son las series mensuales en la escala de los notebooks
+    (``tp × 30 × 1000`` y ``-pev × 30 × 1000``); el resultado queda listo para
+    ``df.set_index("valid_time").join(...)``. Con ``params`` se usan
+    distribuciones ya ajustadas (ver :mod:`sarida.calibration`).
+    """
+    times = pd.DatetimeIndex(times)
+    spi, spei, _ = spi_spei(pr, pet, times.month, windows, params=params)
+    cols = {f"SPI_{k}": spi[i] for i, k in enumerate(windows)}
+    cols.update({f"SPEI_{k}": spei[i] for i, k in enumerate(windows)})
+    return pd.DataFrame(cols, index=pd.Index(times, name=TIME_DIM))
+
+
+def era5_pr_pet(tp, pev):
+    """
+    ``pr`` y ``pet`` en mm/mes desde ``tp`` y ``pev`` de ERA5 (m/día).
+
+    Es la única conversión que usan la serie de la caja, los notebooks y los
+    índices por píxel: primero a float64 y después ``× DAYS × 1000``.
+    """
+    pr = np.asarray(tp, dtype=float) * DAYS * 1000.0
+    pet = -np.asarray(pev, dtype=float) * DAYS * 1000.0
+    return pr, pet
+
+
+def era5_indices(df: pd.DataFrame, windows=WINDOWS, time_col: str = TIME_DIM) -> pd.DataFrame:
+    """:func:`indices_frame` para un DataFrame en unidades ERA5 (como sale del almacén)."""
+    df = df.sort_values(time_col)
+    pr, pet = era5_pr_pet(df["tp"], df["pev"])
+    return indices_frame(pr, pet, df[time_col], windows)
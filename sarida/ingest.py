@@ -0,0 +1,81 @@
+"""
+Ingesta incremental de ERA5-Land hacia el almacén mensual.
+
+En lugar de volver a pedir 1985–hoy en cada corrida, se listan los meses que ya
+están en el :class:`~sarida.store.MonthlyStore`, se piden al CDS solo los que
+faltan (agrupados por año, porque una petición CDS es año × mes) y se agregan
+como particiones nuevas.
+
+El ``client`` solo necesita el método ``retrieve(dataset, request)`` que devuelve
+un objeto con ``download(target)``, igual que ``cdsapi.Client``. Para pruebas
+sin red está :class:`sarida.cds_local.LocalCDSClient`.
+"""
+from pathlib import Path
+
+import pandas as pd
+
+from sarida.era5 import (
+    BBOX_RIOHACHA, DATASET, build_request, default_chunks, era5_to_monthly_df, open_download,
+)
+from sarida.store import TIME_COL
+
+
+def latest_available_month(today=None, lag_months: int = 1) -> pd.Timestamp:
+    """Último mes que el CDS suele tener publicado (por defecto, el mes anterior)."""
+    today = pd.Timestamp.today() if today is None else pd.Timestamp(today)
+    return (today.to_period("M") - lag_months).to_timestamp()
+
+
+def expected_months(start, end) -> list:
+    """Lista de inicios de mes entre ``start`` y ``end`` (incluidos)."""
+    return list(pd.period_range(start, end, freq="M").to_timestamp())
+
+
+def missing_months(store, start="1985-01", end=None) -> list:
+    """Meses del rango que todavía no están en el almacén."""
+    end = latest_available_month() if end is None else end
+    present = store.months()
+    return [m for m in expected_months(start, end) if m not in present]
+
+
+def plan_requests(months) -> list:
+    """Agrupa los meses faltantes en peticiones ``(año, [meses])``."""
+    by_year = {}
+    for m in sorted(months):
+        by_year.setdefault(m.year, []).append(m.month)
+    return sorted(by_year.items())
+
+
+def ingest_missing(client, store, start="1985-01", end=None, bbox=BBOX_RIOHACHA,
+                   workdir="descargas_era5", dataset=DATASET, cube=None) -> list:
+    """
+    Descarga solo los meses faltantes y los agrega al almacén.
+
+    Cada año se guarda apenas llega, así que si una petición falla se conservan
+    los años anteriores y la siguiente corrida retoma desde el primer mes faltante.
+    Si se pasa ``cube`` (:class:`sarida.cube.CubeStore`), la grilla descargada
+    también se agrega al cubo Zarr. Devuelve la lista de meses escritos.
+    """
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    written = []
+    for year, months in plan_requests(missing_months(store, start, end)):
+        request = build_request([year], months, bbox=bbox)
+        target = workdir / f"era5_{year}_{months[0]:02d}-{months[-1]:02d}.nc"
+        client.retrieve(dataset, request).download(str(target))
+
+        ds = open_download(target, chunks=default_chunks())
+        try:
+            df = era5_to_monthly_df(ds, lazy=True)
+            if cube is not None:
+                cube.append(ds)
+        finally:
+            ds.close()
+
+        # Solo se guardan los meses pedidos (el CDS puede devolver de más)
+        wanted = df[TIME_COL].dt.year.eq(year) & df[TIME_COL].dt.month.isin(months)
+        written += store.append(df[wanted])
+        target.unlink(missing_ok=True)
+
+    return written
@@ -0,0 +1,190 @@
+"""
+Agregación mensual para varias regiones (municipios) en una sola pasada.
+
+Un catálogo de regiones es un diccionario ``nombre -> geometría`` donde la
+geometría puede ser una caja (``{"north", "south", "west", "east"}``, como
+``BBOX_RIOHACHA``) o un polígono/multipolígono GeoJSON. Para cada grilla se
+calcula una vez la matriz dispersa de pesos celda→región (fracción de la celda
+dentro de la región × área de la celda) y se guarda en caché; luego todas las
+regiones salen de un único producto matriz × cubo por bloque de tiempo.
+"""
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from sarida.era5 import TIME_DIM, VALUE_COLS
+
+# Caché en memoria de matrices de pesos: clave (grilla, catálogo) -> (nombres, W)
+_WEIGHTS_CACHE = {}
+
+
+def load_catalogue(path, name_field: str = "MPIO_CNMBR") -> dict:
+    """
+    Lee un GeoJSON (FeatureCollection) de municipios como catálogo de regiones.
+
+    ``name_field`` es la propiedad con el nombre de cada región (por defecto el
+    campo de nombre de municipio del marco geoestadístico del DANE).
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {
+        feat["properties"][name_field]: feat["geometry"]
+        for feat in data["features"]
+    }
+
+
+def catalogue_bbox(catalogue: dict, margin: float = 0.1) -> dict:
+    """Caja que cubre todo el catálogo, para hacer una sola petición CDS."""
+    lons, lats = [], []
+    for geom in catalogue.values():
+        west, south, east, north = _bounds(geom)
+        lons += [west, east]
+        lats += [south, north]
+    return {
+        "north": float(max(lats)) + margin,
+        "south": float(min(lats)) - margin,
+        "west": float(min(lons)) - margin,
+        "east": float(max(lons)) + margin,
+    }
+
+
+def _rings(geom) -> list:
+    """Anillos (arrays N×2 de lon, lat) de una caja o geometría GeoJSON."""
+    if "north" in geom:
+        w, s, e, n = geom["west"], geom["south"], geom["east"], geom["north"]
+        return [np.array([[w, s], [e, s], [e, n], [w, n]], dtype=float)]
+    if geom["type"] == "Polygon":
+        return [np.asarray(r, dtype=float)[:, :2] for r in geom["coordinates"]]
+    if geom["type"] == "MultiPolygon":
+        return [np.asarray(r, dtype=float)[:, :2] for poly in geom["coordinates"] for r in poly]
+    raise ValueError(f"Geometría no soportada: {geom.get('type')}")
+
+
+def _bounds(geom) -> tuple:
+    pts = np.concatenate(_rings(geom))
+    return pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max()
+
+
+def _inside(lon, lat, rings) -> np.ndarray:
+    """Punto en polígono (regla par-impar) vectorizado sobre todos los puntos."""
+    inside = np.zeros(lon.shape, dtype=bool)
+    for ring in rings:
+        x0, y0 = ring[:, 0], ring[:, 1]
+        x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+        for xa, ya, xb, yb in zip(x0, y0, x1, y1):
+            if ya == yb:
+                continue
+            crosses = (ya > lat) != (yb > lat)
+            x_cross = xa + (lat - ya) * (xb - xa) / (yb - ya)
+            inside ^= crosses & (lon < x_cross)
+    return inside
+
+
+def _grid_key(lat, lon, catalogue, supersample) -> str:
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(lat, dtype=float).tobytes())
+    h.update(np.ascontiguousarray(lon, dtype=float).tobytes())
+    h.update(json.dumps(catalogue, sort_keys=True, default=str).encode())
+    h.update(str(supersample).encode())
+    return h.hexdigest()
+
+
+def region_weights(lat, lon, catalogue: dict, supersample: int = 4, cache_dir=None):
+    """
+    Matriz dispersa de pesos (regiones × celdas) para la grilla ``lat`` × ``lon``.
+
+    Cada celda se subdivide en ``supersample``² puntos para estimar qué fracción
+    cae dentro de cada región; el peso es esa fracción × cos(lat). Las celdas se
+    ordenan como ``lat`` × ``lon`` aplanado (orden C). Se cachea en memoria y,
+    si se da ``cache_dir``, también en disco (``.npz``).
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    key = _grid_key(lat, lon, catalogue, supersample)
+    if key in _WEIGHTS_CACHE:
+        return _WEIGHTS_CACHE[key]
+
+    names = list(catalogue)
+    cache_file = Path(cache_dir) / f"pesos_{key[:16]}.npz" if cache_dir else None
+    if cache_file is not None and cache_file.exists():
+        W = sparse.load_npz(cache_file)
+        _WEIGHTS_CACHE[key] = (names, W)
+        return names, W
+
+    dlat = np.abs(np.diff(lat)).mean() if lat.size > 1 else 0.1
+    dlon = np.abs(np.diff(lon)).mean() if lon.size > 1 else 0.1
+    offsets = (np.arange(supersample) + 0.5) / supersample - 0.5
+    lat2d, lon2d = np.meshgrid(lat, lon, indexing="ij")
+    # Subpuntos: (celdas, supersample²)
+    sub_lat = (lat2d.ravel()[:, None, None] + offsets[None, :, None] * dlat)
+    sub_lon = (lon2d.ravel()[:, None, None] + offsets[None, None, :] * dlon)
+    sub_lat, sub_lon = np.broadcast_arrays(sub_lat, sub_lon)
+    sub_lat = sub_lat.reshape(lat2d.size, -1)
+    sub_lon = sub_lon.reshape(lat2d.size, -1)
+    area = np.cos(np.deg2rad(lat2d.ravel()))
+
+    rows, cols, vals = [], [], []
+    for r, name in enumerate(names):
+        frac = _inside(sub_lon, sub_lat, _rings(catalogue[name])).mean(axis=1)
+        cells = np.flatnonzero(frac > 0)
+        rows.append(np.full(cells.size, r))
+        cols.append(cells)
+        vals.append(frac[cells] * area[cells])
+    W = sparse.csr_matrix(
+        (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(len(names), lat2d.size),
+    )
+
+    if cache_file is not None:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        sparse.save_npz(cache_file, W)
+    _WEIGHTS_CACHE[key] = (names, W)
+    return names, W
+
+
+def regional_monthly_df(ds, catalogue: dict, time_block: int = 120, supersample: int = 4,
+                        cache_dir=None, lat_dim: str = "latitude", lon_dim: str = "longitude"):
+    """
+    Series mensuales de las 9 variables para todas las regiones del catálogo.
+
+    Recorre el cubo en bloques de ``time_block`` pasos; en cada bloque todas las
+    variables y todas las regiones salen de dos productos dispersos (suma
+    ponderada y peso válido), así que el promedio ignora las celdas con NaN
+    (mar). Devuelve un DataFrame largo con columnas ``region``, ``valid_time`` y
+    las variables.
+    """
+    cols = [c for c in VALUE_COLS if c in ds.data_vars]
+    cube = ds[cols].drop_vars(["number", "expver"], errors="ignore")
+    cube = cube.transpose(TIME_DIM, lat_dim, lon_dim, ...)
+    names, W = region_weights(
+        cube[lat_dim].values, cube[lon_dim].values, catalogue,
+        supersample=supersample, cache_dir=cache_dir,
+    )
+    n_cells = cube.sizes[lat_dim] * cube.sizes[lon_dim]
+    times = pd.to_datetime(cube[TIME_DIM].values)
+
+    frames = []
+    for start in range(0, len(times), time_block):
+        block = cube.isel({TIME_DIM: slice(start, start + time_block)})
+        # (celdas, tiempo × variables)
+        X = np.stack([np.asarray(block[c].values, dtype=float) for c in cols], axis=-1)
+        n_t = X.shape[0]
+        X = X.reshape(n_t, n_cells, len(cols)).transpose(1, 0, 2).reshape(n_cells, -1)
+        valid = ~np.isnan(X)
+        num = W @ np.where(valid, X, 0.0)
+        den = W @ valid.astype(float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(den > 0, num / den, np.nan)
+        mean = mean.reshape(len(names), n_t, len(cols))
+        for r, name in enumerate(names):
+            part = pd.DataFrame(mean[r], columns=cols)
+            part.insert(0, TIME_DIM, times[start:start + n_t])
+            part.insert(0, "region", name)
+            frames.append(part)
+
+    df = pd.concat(frames, ignore_index=True)
+    return df.sort_values(["region", TIME_DIM]).reset_index(drop=True)
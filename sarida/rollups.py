@@ -0,0 +1,219 @@
+"""
+Agregados pre-calculados de la serie mensual a varias resoluciones.
+
+Resoluciones (``RESOLUTIONS``):
+
+- ``month``: el mes tal cual;
+- ``season``: trimestres DEF, MAM, JJA, SON (diciembre cuenta para el DEF del
+  año siguiente);
+- ``year``: año calendario;
+- ``hydro_year``: año hidrológico que empieza en ``HYDRO_START`` (abril, inicio
+  de la primera temporada de lluvias después de la seca de diciembre–marzo);
+- ``enso``: fase ENSO (El Niño / Neutral / La Niña según el ONI de NOAA CPC),
+  con todos los meses de cada fase juntos.
+
+Cada mes se repite una vez por resolución con su clave de periodo y todo se
+agrega con **un solo** ``groupby`` (media, desviación, mínimo, máximo y, para
+las variables acumuladas, suma). El resultado es una tabla larga y pequeña
+(una fila por resolución y periodo, columnas ``{variable}_{estadístico}``) que
+se guarda en Parquet por versión del dataset; las gráficas leen directamente
+sus filas.
+"""
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from sarida.era5 import TIME_DIM, VALUE_COLS
+from sarida.store import cache_key
+
+RESOLUTIONS = ("month", "season", "year", "hydro_year", "enso")
+HYDRO_START = 4
+SEASONS = {12: "DEF", 1: "DEF", 2: "DEF", 3: "MAM", 4: "MAM", 5: "MAM",
+           6: "JJA", 7: "JJA", 8: "JJA", 9: "SON", 10: "SON", 11: "SON"}
+# Meses que debe tener un periodo para considerarse completo
+FULL_MONTHS = {"month": 1, "season": 3, "year": 12, "hydro_year": 12, "enso": 1}
+ACCUMULATED = ("tp", "e", "pev")
+STATS = ("mean", "std", "min", "max")
+INDEX_PREFIXES = ("SPI_", "SPEI_")
+
+ONI_URL = "https://www.cpc.ncep.noaa.gov/data/indices/oni.ascii.txt"
+ONI_FILE = "oni.ascii.txt"
+ONI_MAX_AGE = 30 * 24 * 3600        # el ONI se publica una vez al mes
+ENSO_THRESHOLD = 0.5
+ENSO_MIN_SEASONS = 5
+# Trimestre móvil del ONI -> mes central
+ONI_SEASONS = {s: i + 1 for i, s in enumerate(
+    ["DJF", "JFM", "FMA", "MAM", "AMJ", "MJJ", "JJA", "JAS", "ASO", "SON", "OND", "NDJ"])}
+
+
+# ----- ENSO -----
+def read_oni(path) -> pd.DataFrame:
+    """ONI (``oni.ascii.txt`` de CPC) como serie mensual: ``valid_time``, ``oni``, ``enso``."""
+    raw = pd.read_csv(path, sep=r"\s+")
+    times = pd.to_datetime(pd.DataFrame({
+        "year": raw["YR"], "month": raw["SEAS"].map(ONI_SEASONS), "day": 1,
+    }))
+    oni = pd.DataFrame({TIME_DIM: times, "oni": raw["ANOM"].astype(float)})
+    oni["enso"] = enso_phase(oni["oni"].to_numpy())
+    return oni
+
+
+def enso_phase(oni: np.ndarray, threshold: float = ENSO_THRESHOLD,
+               min_seasons: int = ENSO_MIN_SEASONS) -> np.ndarray:
+    """
+    Fase ENSO por mes con la definición operativa de CPC: El Niño (La Niña) si el
+    ONI es ≥ ``threshold`` (≤ −``threshold``) durante al menos ``min_seasons``
+    trimestres seguidos; si no, Neutral.
+    """
+    oni = np.asarray(oni, dtype=float)
+    phase = np.full(oni.size, "Neutral", dtype=object)
+    with np.errstate(invalid="ignore"):
+        conditions = {"El Niño": oni >= threshold, "La Niña": oni <= -threshold}
+    for name, cond in conditions.items():
+        edges = np.diff(np.concatenate([[0], cond.astype(np.int8), [0]]))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        for s, e in zip(starts, ends):
+            if e - s >= min_seasons:
+                phase[s:e] = name
+    return phase
+
+
+def fetch_oni(cache_dir, max_age: float = ONI_MAX_AGE, timeout: int = 30) -> Path:
+    """Copia local del ONI; se vuelve a bajar si tiene más de ``max_age`` segundos."""
+    from sarida.assets import fetch_http
+
+    path = Path(cache_dir) / ONI_FILE
+    if not path.exists() or time.time() - path.stat().st_mtime > max_age:
+        fetch_http(ONI_URL, path, timeout=timeout)
+    return path
+
+
+# ----- agregados -----
+def period_keys(times, oni: pd.DataFrame = None) -> pd.DataFrame:
+    """Clave de periodo (texto) e inicio del periodo de cada mes, por resolución."""
+    times = pd.DatetimeIndex(times)
+    year, month = times.year.to_numpy(), times.month.to_numpy()
+
+    season_year = year + (month == 12)
+    season = np.array([SEASONS[m] for m in range(1, 13)], dtype=object)[month - 1]
+    season_start_month = np.select([month == 12, month <= 2, month <= 5, month <= 8],
+                                   [12, 12, 3, 6], 9)
+    season_start = pd.to_datetime(pd.DataFrame({
+        "year": np.where(season_start_month == 12, season_year - 1, year),
+        "month": season_start_month, "day": 1,
+    }))
+    hydro = year - (month < HYDRO_START)
+
+    keys = {
+        "month": (times.strftime("%Y-%m"), times),
+        "season": (pd.Index(season_year.astype(str)) + "-" + season, pd.DatetimeIndex(season_start)),
+        "year": (year.astype(str), pd.to_datetime(pd.DataFrame({"year": year, "month": 1, "day": 1}))),
+        "hydro_year": (
+            pd.Index(hydro.astype(str)) + "/" + pd.Index((hydro + 1).astype(str)).str[-2:],
+            pd.to_datetime(pd.DataFrame({"year": hydro, "month": HYDRO_START, "day": 1})),
+        ),
+    }
+    if oni is not None:
+        phase = pd.Series(oni["enso"].to_numpy(), index=pd.DatetimeIndex(oni[TIME_DIM]))
+        keys["enso"] = (phase.reindex(times).to_numpy(), pd.DatetimeIndex([pd.NaT] * len(times)))
+
+    return pd.concat([
+        pd.DataFrame({"resolution": res, "period": np.asarray(period, dtype=object),
+                      "start": np.asarray(start), "row": np.arange(len(times))})
+        for res, (period, start) in keys.items()
+    ], ignore_index=True)
+
+
+def build_rollups(df: pd.DataFrame, columns=None, time_col: str = TIME_DIM,
+                  oni: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Tabla de agregados de ``columns`` (por defecto las variables y los SPI/SPEI
+    presentes) para todas las resoluciones, en un solo ``groupby``.
+
+    Sin ``oni`` no se calcula la resolución ``enso``.
+    """
+    if columns is None:
+        columns = [c for c in VALUE_COLS if c in df.columns]
+        columns += [c for c in df.columns if str(c).startswith(INDEX_PREFIXES)]
+    columns = list(columns)
+    keys = period_keys(df[time_col], oni)
+    keys = keys[keys["period"].notna()]
+
+    values = df[columns].to_numpy(dtype=float)[keys["row"].to_numpy()]
+    long = pd.DataFrame(values, columns=columns)
+    long["resolution"] = keys["resolution"].to_numpy()
+    long["period"] = keys["period"].to_numpy()
+    long["start"] = keys["start"].to_numpy()
+    long["n_months"] = 1
+
+    aggs = {c: list(STATS) + (["sum"] if c in ACCUMULATED else []) for c in columns}
+    aggs.update({"start": "min", "n_months": "sum"})
+    out = long.groupby(["resolution", "period"], sort=False).agg(aggs)
+    out.columns = [c if c in ("start", "n_months") else f"{c}_{s}" for c, s in out.columns]
+    out = out.reset_index()
+    out["complete"] = out["n_months"] >= out["resolution"].map(FULL_MONTHS)
+    stats = [c for c in out.columns if c not in ("resolution", "period", "start", "n_months", "complete")]
+    return out.astype({c: "float32" for c in stats}).astype({"n_months": "int16"})
+
+
+class Rollups:
+    """Agregados de una versión del dataset, separados por resolución."""
+
+    def __init__(self, table: pd.DataFrame, version=None):
+        self.table = table
+        self.version = version
+        self._by_res = {res: t.reset_index(drop=True)
+                        for res, t in table.groupby("resolution", sort=False)}
+
+    @property
+    def resolutions(self) -> list:
+        return [r for r in RESOLUTIONS if r in self._by_res]
+
+    def get(self, resolution: str, columns=None, complete: bool = True) -> pd.DataFrame:
+        """
+        Filas de ``resolution`` ordenadas por inicio. ``columns`` elige
+        variables (se devuelven todas sus estadísticas) o columnas
+        ``{variable}_{estadístico}`` exactas.
+        """
+        t = self._by_res[resolution]
+        if complete:
+            t = t[t["complete"]]
+        if columns is not None:
+            wanted = []
+            for c in columns:
+                wanted += [c] if c in t.columns else [k for k in t.columns if k.rsplit("_", 1)[0] == c]
+            t = t[["period", "start", "n_months"] + wanted]
+        return t.sort_values("start", kind="stable") if resolution != "enso" else t
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".parquet.tmp")
+        self.table.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, version=None) -> "Rollups":
+        return cls(pd.read_parquet(path), version)
+
+
+def cached_rollups(df: pd.DataFrame, cache_dir, version: str, time_col: str = TIME_DIM,
+                   oni: pd.DataFrame = None) -> Rollups:
+    """
+    :func:`build_rollups` guardado en ``cache_dir/rollups_<version>.parquet``.
+
+    ``version`` identifica el dataset (huella o tamaño + fecha); con ONI el
+    nombre incluye el último mes del ONI para rehacerlo cuando se actualice.
+    """
+    key = cache_key(version)
+    if oni is not None:
+        key += f"_oni{pd.Timestamp(oni[TIME_DIM].max()):%Y%m}"
+    path = Path(cache_dir) / f"rollups_{key}.parquet"
+    if path.exists():
+        return Rollups.load(path, version)
+    rollups = Rollups(build_rollups(df, time_col=time_col, oni=oni), version)
+    rollups.save(path)
+    return rollups
@@ -0,0 +1,231 @@
+"""
+Planificador de descargas CDS concurrente y reanudable.
+
+Una petición grande (por ejemplo 1985–2024) se divide en trabajos por año o por
+año × variable. Los trabajos corren con ``max_workers`` hilos (el CDS limita las
+peticiones simultáneas por usuario, así que conviene no pasar de 4), se reintentan
+con espera exponencial y su estado se guarda en ``estado.json`` dentro de
+``workdir``. Si la corrida se interrumpe, la siguiente solo lanza los trabajos que
+no terminaron y luego combina las piezas en el almacén.
+
+Uso típico::
+
+    sched = RetrievalScheduler(cdsapi.Client, "descargas_era5", max_workers=4)
+    sched.run_missing(store, start="1985-01", cube=cube)
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import xarray as xr
+
+from sarida.era5 import (
+    BBOX_RIOHACHA, DATASET, SHORT_NAMES, VARIABLES, build_request, default_chunks,
+    era5_to_monthly_df, open_download,
+)
+from sarida.ingest import missing_months, plan_requests
+from sarida.store import TIME_COL
+
+PENDING, DONE, FAILED, MERGED = "pending", "done", "failed", "merged"
+
+
+def _months_label(months) -> str:
+    """Meses como tramos seguidos (``01-06``, ``01-03+07-09``) para el id del trabajo."""
+    runs = []
+    for m in sorted(months):
+        if runs and m == runs[-1][1] + 1:
+            runs[-1][1] = m
+        else:
+            runs.append([m, m])
+    return "+".join(f"{a:02d}-{b:02d}" for a, b in runs)
+
+
+class RetrievalScheduler:
+    """Corre trabajos CDS en paralelo guardando su estado en disco."""
+
+    def __init__(self, client_factory, workdir, max_workers: int = 4, retries: int = 3,
+                 backoff: float = 30.0, dataset: str = DATASET):
+        self.client_factory = client_factory
+        self.workdir = Path(workdir)
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.dataset = dataset
+        self.state_file = self.workdir / "estado.json"
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.jobs = self._load_state()
+
+    # ----- estado persistente -----
+    def _load_state(self) -> dict:
+        if not self.state_file.exists():
+            return {}
+        jobs = json.loads(self.state_file.read_text(encoding="utf-8"))
+        # Un trabajo "done" cuyo archivo desapareció vuelve a quedar pendiente
+        for job in jobs.values():
+            if job["status"] == DONE and not Path(job["target"]).exists():
+                job["status"] = PENDING
+        return jobs
+
+    def _save_state(self):
+        self.workdir.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_file.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self.jobs, indent=1), encoding="utf-8")
+        os.replace(tmp, self.state_file)
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            self.jobs[job_id].update(fields)
+            self._save_state()
+
+    # ----- planificación -----
+    def _coverage(self, year: int, area) -> tuple:
+        """
+        Meses de ``year`` ya pedidos (con sus variables) por trabajos sin combinar.
+
+        Solo cuentan los trabajos con la misma ``area``; los ya combinados están
+        en el almacén y, si el almacén perdió esos meses, hay que volver a
+        pedirlos. Devuelve ``({mes: variables}, {id: (meses, variables)})``.
+        """
+        covered, jobs = {}, {}
+        for job_id, job in self.jobs.items():
+            req = job["request"]
+            if job["year"] != year or job["status"] == MERGED or list(req["area"]) != list(area):
+                continue
+            months = {int(m) for m in req["month"]}
+            jobs[job_id] = (months, set(req["variable"]))
+            for m in months:
+                covered.setdefault(m, set()).update(req["variable"])
+        return covered, jobs
+
+    def plan(self, months, bbox=BBOX_RIOHACHA, split: str = "year", variables=VARIABLES) -> list:
+        """
+        Registra los trabajos necesarios para ``months`` y devuelve sus ids.
+
+        ``split="year"`` crea un trabajo por año; ``split="variable"`` uno por
+        año y variable (peticiones más pequeñas, útiles cuando el CDS está lento).
+        Los trabajos ya registrados se conservan con su estado y se comparan por
+        los meses y variables que cubren, no por su id: si un plan anterior (con
+        otra división u otro rango de meses) ya pide un mes, no se vuelve a pedir.
+        """
+        ids = []
+        for year, year_months in plan_requests(months):
+            area = build_request([year], year_months, bbox=bbox)["area"]
+            covered, existing = self._coverage(year, area)
+            groups = [[v] for v in variables] if split == "variable" else [list(variables)]
+            for group in groups:
+                ids += [
+                    j for j, (m, v) in existing.items()
+                    if m & set(year_months) and v & set(group) and j not in ids
+                ]
+                todo = [m for m in year_months if not set(group) <= covered.get(m, set())]
+                if not todo:
+                    continue
+                suffix = f"_{SHORT_NAMES.get(group[0], group[0])}" if split == "variable" else ""
+                job_id = f"{year}_{_months_label(todo)}{suffix}"
+                request = build_request([year], todo, bbox=bbox, variables=group)
+                old = self.jobs.get(job_id)
+                # Un id repetido con otra petición o ya combinado se vuelve a pedir
+                if old is None or old["status"] == MERGED or old["request"] != request:
+                    self.jobs[job_id] = {
+                        "year": year,
+                        "request": request,
+                        "target": str(self.workdir / f"era5_{job_id}.nc"),
+                        "status": PENDING,
+                        "attempts": 0,
+                        "error": None,
+                    }
+                if job_id not in ids:
+                    ids.append(job_id)
+        with self._lock:
+            self._save_state()
+        return ids
+
+    # ----- ejecución -----
+    def _client(self):
+        # Un cliente por hilo: cdsapi.Client no garantiza ser seguro entre hilos
+        if not hasattr(self._local, "client"):
+            self._local.client = self.client_factory()
+        return self._local.client
+
+    def _run_job(self, job_id: str) -> str:
+        job = self.jobs[job_id]
+        for attempt in range(self.retries):
+            try:
+                tmp = job["target"] + ".part"
+                self._client().retrieve(self.dataset, job["request"]).download(tmp)
+                os.replace(tmp, job["target"])
+                self._update(job_id, status=DONE, attempts=job["attempts"] + 1, error=None)
+                return job_id
+            except Exception as e:
+                self._update(job_id, status=FAILED, attempts=job["attempts"] + 1, error=str(e))
+                if attempt + 1 < self.retries:
+                    time.sleep(self.backoff * 2 ** attempt)
+        return job_id
+
+    def run(self, job_ids=None) -> dict:
+        """Corre los trabajos pendientes o fallidos; devuelve el conteo por estado."""
+        self.workdir.mkdir(parents=True, exist_ok=True)
+        job_ids = list(self.jobs) if job_ids is None else job_ids
+        todo = [j for j in job_ids if self.jobs[j]["status"] in (PENDING, FAILED)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for fut in as_completed([pool.submit(self._run_job, j) for j in todo]):
+                fut.result()
+        return self.summary()
+
+    def summary(self) -> dict:
+        counts = {}
+        for job in self.jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return counts
+
+    # ----- combinación -----
+    def merge_into(self, store, cube=None) -> list:
+        """
+        Combina en el almacén los años cuyos trabajos terminaron.
+
+        Se avanza en orden de año y se detiene en el primer año incompleto, para
+        que el cubo Zarr siempre crezca hacia adelante; lo que quede sin combinar
+        se retoma en la siguiente corrida. Devuelve los meses escritos.
+        """
+        by_year = {}
+        for job_id, job in self.jobs.items():
+            if job["status"] != MERGED:
+                by_year.setdefault(job["year"], []).append(job_id)
+
+        written = []
+        for year in sorted(by_year):
+            ids = by_year[year]
+            if any(self.jobs[j]["status"] != DONE for j in ids):
+                break
+            pieces = [open_download(self.jobs[j]["target"], chunks=default_chunks()) for j in ids]
+            # Las piezas pueden cubrir meses distintos de la misma variable (planes
+            # con otro rango): se combinan los valores en lugar de tomar la primera
+            ds = xr.merge(
+                [p.drop_vars(["number", "expver"], errors="ignore") for p in pieces],
+                compat="no_conflicts", join="outer",
+            )
+            try:
+                df = era5_to_monthly_df(ds, lazy=True)
+                months = [int(m) for j in ids for m in self.jobs[j]["request"]["month"]]
+                wanted = df[TIME_COL].dt.year.eq(year) & df[TIME_COL].dt.month.isin(months)
+                written += store.append(df[wanted])
+                if cube is not None:
+                    cube.append(ds)
+            finally:
+                for piece in pieces:
+                    piece.close()
+            for j in ids:
+                Path(self.jobs[j]["target"]).unlink(missing_ok=True)
+                self._update(j, status=MERGED)
+        return written
+
+    def run_missing(self, store, start="1985-01", end=None, bbox=BBOX_RIOHACHA,
+                    split: str = "year", cube=None) -> list:
+        """Planifica los meses faltantes del almacén, los descarga y los combina."""
+        self.plan(missing_months(store, start, end), bbox=bbox, split=split)
+        self.run()
+        return self.merge_into(store, cube=cube)
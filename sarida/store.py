@@ -0,0 +1,94 @@
+"""
+Almacén Parquet particionado por año/mes para las series mensuales.
+
+Estructura en disco (estilo Hive, legible con ``pd.read_parquet(root)``)::
+
+    root/
+      year=1985/month=01/part.parquet
+      year=1985/month=02/part.parquet
+      ...
+
+Cada mes vive en su propia partición: agregar un mes nuevo no reescribe los
+anteriores y saber qué meses existen solo requiere listar carpetas.
+"""
+import os
+from pathlib import Path
+
+import pandas as pd
+
+TIME_COL = "valid_time"
+PART_FILE = "part.parquet"
+
+
+class MonthlyStore:
+    """Dataset Parquet local con una partición por mes."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _partition(self, year: int, month: int) -> Path:
+        return self.root / f"year={year}" / f"month={month:02d}"
+
+    def months(self) -> set:
+        """Meses ya almacenados (como ``pd.Timestamp`` de inicio de mes)."""
+        found = set()
+        if not self.root.exists():
+            return found
+        for part in self.root.glob(f"year=*/month=*/{PART_FILE}"):
+            year = int(part.parent.parent.name.split("=", 1)[1])
+            month = int(part.parent.name.split("=", 1)[1])
+            found.add(pd.Timestamp(year=year, month=month, day=1))
+        return found
+
+    def append(self, df: pd.DataFrame) -> list:
+        """
+        Escribe cada mes de ``df`` en su partición y devuelve los meses escritos.
+
+        Si un mes ya existía se reemplaza completo (escritura atómica vía
+        archivo temporal + ``os.replace``).
+        """
+        if df.empty:
+            return []
+        df = df.copy()
+        df[TIME_COL] = pd.to_datetime(df[TIME_COL])
+        written = []
+        for month_start, chunk in df.groupby(df[TIME_COL].dt.to_period("M")):
+            ts = month_start.to_timestamp()
+            dest_dir = self._partition(ts.year, ts.month)
+            dest_dir.mkdir(parents=True, exist_ok=True)
+            tmp = dest_dir / (PART_FILE + ".tmp")
+            chunk.sort_values(TIME_COL).to_parquet(tmp, index=False)
+            os.replace(tmp, dest_dir / PART_FILE)
+            written.append(ts)
+        return written
+
+    def read(self, columns=None) -> pd.DataFrame:
+        """Lee todo el almacén como un DataFrame ordenado por fecha."""
+        if columns is not None and TIME_COL not in columns:
+            columns = [TIME_COL] + list(columns)
+        parts = sorted(self.root.glob(f"year=*/month=*/{PART_FILE}"))
+        if not parts:
+            return pd.DataFrame(columns=columns or [TIME_COL])
+        df = pd.concat(
+            [pd.read_parquet(p, columns=columns) for p in parts],
+            ignore_index=True,
+        )
+        return df.sort_values(TIME_COL).reset_index(drop=True)
+
+
+def read_monthly(path, columns=None) -> pd.DataFrame:
+    """
+    Lee una serie mensual desde un archivo Parquet o un almacén particionado.
+
+    Permite que el dashboard y los notebooks lean igual un ``dataset_clima.parquet``
+    plano o una carpeta generada por :class:`MonthlyStore`.
+    """
+    path = Path(path)
+    if path.is_dir():
+        return MonthlyStore(path).read(columns=columns)
+    return pd.read_parquet(path, columns=columns)
+
+
+def cache_key(version) -> str:
+    """``version`` (huella del dataset) apta para un nombre de archivo de caché."""
+    return "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in str(version))
@@ -0,0 +1,593 @@
+"""
+Mann-Kendall y pendiente de Sen en lote, en O(n log n) por serie.
+
+Equivale a ``pymannkendall.original_test`` sobre cada serie sin NaN, pero:
+
+- ``S`` sale de contar inversiones con un merge sort de abajo hacia arriba
+  (:func:`inversion_counts`) en lugar de comparar todos los pares;
+- la pendiente de Sen (mediana de las n(n−1)/2 pendientes) se selecciona sin
+  construir los pares: el número de pendientes ≤ ``t`` es el número de
+  inversiones de ``x − t·i``, así que basta buscar ``t`` contando inversiones;
+- todas las series (índices, regiones, píxeles: una por fila) se procesan
+  juntas, nivel por nivel del merge sort.
+
+:func:`cached_trends` guarda la tabla por versión del dataset y
+:class:`RangeTrend` responde el test sobre cualquier tramo de una serie con sumas
+de prefijos, para recalcular la tendencia al mover un rango de años.
+"""
+import os
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import special
+
+from sarida.era5 import TIME_DIM
+from sarida.store import cache_key
+
+ALPHA = 0.05
+INDEX_PREFIXES = ("SPI_", "SPEI_")
+SLOPE_RTOL = 1e-12     # ancho mínimo del intervalo, relativo al rango de la serie
+MAX_BISECT = 200
+BASE_BLOCK = 16        # bloques que se cuentan por comparación directa
+
+
+def compress(values: np.ndarray, positions: bool = False):
+    """
+    Filas sin NaN alineadas a la izquierda (relleno NaN) y su largo ``n``.
+
+    Con ``positions`` devuelve además la posición original de cada dato, para
+    las pendientes de Sen de series con huecos.
+    """
+    x = np.atleast_2d(np.asarray(values, dtype=float))
+    valid = np.isfinite(x)
+    n = valid.sum(axis=1)
+    # Orden estable: los válidos primero, conservando su orden en el tiempo
+    order = np.argsort(~valid, axis=1, kind="stable")
+    out = np.take_along_axis(x, order, axis=1)
+    out[np.arange(x.shape[1])[None, :] >= n[:, None]] = np.nan
+    return (out, n, order) if positions else (out, n)
+
+
+def _dense_ranks(z: np.ndarray, n: np.ndarray, width: int) -> np.ndarray:
+    """Rangos densos por fila (empates con el mismo rango); el relleno recibe ``width``."""
+    rows, cols = z.shape
+    pad = np.arange(cols)[None, :] >= n[:, None]
+    z = np.where(pad, np.inf, z)
+    order = np.argsort(z, axis=1, kind="stable")
+    zs = np.take_along_axis(z, order, axis=1)
+    dense = np.zeros(z.shape, dtype=np.int64)
+    with np.errstate(invalid="ignore"):          # inf - inf en el relleno
+        dense[:, 1:] = np.cumsum(np.diff(zs, axis=1) > 0, axis=1)
+    ranks = np.full((rows, width), width, dtype=np.int64)
+    np.put_along_axis(ranks[:, :cols], order, dense, axis=1)
+    ranks[:, :cols][pad] = width
+    return ranks
+
+
+def inversion_counts(ranks: np.ndarray, strict: bool = True) -> np.ndarray:
+    """
+    Pares ``i < j`` con ``r[i] > r[j]`` (``strict``) o ``r[i] >= r[j]`` por fila.
+
+    ``ranks`` es ``(filas, 2**m)`` de enteros no negativos. Merge sort de abajo
+    hacia arriba desde bloques de ``BASE_BLOCK``: en cada nivel se mezclan los pares de bloques vecinos y, para
+    cada elemento del bloque derecho, los del izquierdo que quedan antes en la
+    mezcla son los que no lo superan. El bit bajo de la clave marca el lado y
+    decide el orden de los empates (izquierdo primero si ``strict``).
+    """
+    arr = np.asarray(ranks, dtype=np.int64)
+    rows, width = arr.shape
+    right_bit = 1 if strict else 0
+
+    # Bloques base: comparación directa de todos los pares (evita ordenar
+    # millones de trozos de 1 o 2 elementos en los primeros niveles)
+    w = min(BASE_BLOCK, width)
+    base = arr.reshape(rows, width // w, w)
+    upper = np.triu(np.ones((w, w), dtype=bool), 1)
+    cmp = base[..., :, None] > base[..., None, :] if strict else base[..., :, None] >= base[..., None, :]
+    total = (cmp & upper).sum(axis=(1, 2, 3)).astype(np.int64)
+    arr = np.sort(base, axis=-1).reshape(rows, width)
+
+    while w < width:
+        nb = width // (2 * w)
+        side = np.repeat(np.array([1 - right_bit, right_bit], dtype=np.int64), w)
+        keys = (arr.reshape(rows, nb, 2 * w) << 1) | side
+        # Dos tramos ya ordenados: el sort estable (timsort) los mezcla en tiempo lineal
+        keys.sort(axis=-1, kind="stable")
+        is_right = (keys & 1) == right_bit
+        left_before = np.cumsum(~is_right, axis=-1)
+        total += np.where(is_right, w - left_before, 0).sum(axis=(1, 2))
+        arr = (keys >> 1).reshape(rows, width)
+        w *= 2
+    return total
+
+
+def _width(n_max: int) -> int:
+    return 1 << max(int(n_max - 1).bit_length(), 1)
+
+
+def mk_score(x: np.ndarray, n: np.ndarray):
+    """``S`` y su varianza con corrección por empates, para filas ya comprimidas."""
+    width = _width(x.shape[1])
+    ranks = _dense_ranks(x, n, width)
+    pairs = n * (n - 1) // 2
+    pad = width - n
+    greater = inversion_counts(ranks, strict=True)
+    greater_eq = inversion_counts(ranks, strict=False) - pad * (pad - 1) // 2
+    s = (pairs - greater_eq) - greater
+
+    # Tamaño de cada grupo de empates
+    rows = np.repeat(np.arange(len(n)), width)
+    flat = ranks.ravel()
+    real = flat < width
+    t = np.bincount(rows[real] * width + flat[real], minlength=len(n) * width).reshape(len(n), width)
+    ties = (t * (t - 1) * (2 * t + 5)).sum(axis=1)
+    var_s = (n * (n - 1) * (2 * n + 5) - ties) / 18.0
+    return s.astype(float), var_s
+
+
+def _slopes_le(x: np.ndarray, n: np.ndarray, t: np.ndarray, width: int,
+               pos: np.ndarray) -> np.ndarray:
+    """Número de pendientes ``(x[j] - x[i]) / (pos[j] - pos[i])`` (``i < j``) menores o iguales a ``t``."""
+    z = x - t[:, None] * pos
+    pad = width - n
+    return inversion_counts(_dense_ranks(z, n, width), strict=False) - pad * (pad - 1) // 2
+
+
+def _snap(x: np.ndarray, n: np.ndarray, lo: np.ndarray, hi: np.ndarray,
+          pos: np.ndarray) -> np.ndarray:
+    """
+    Pendiente real de un par dentro de ``(lo, hi]``.
+
+    Los pares con pendiente en ``(lo, hi]`` son los que cambian de orden entre
+    ``x − lo·i`` y ``x − hi·i``, y siempre hay uno adyacente en el primer orden.
+    Si queda un solo par es exactamente la pendiente buscada; si no, cualquiera
+    está a menos de ``hi − lo``.
+    """
+    i = np.arange(x.shape[1])[None, :]
+    pad = i >= n[:, None]
+    z = np.where(pad, np.inf, x - lo[:, None] * pos)
+    order = np.argsort(z, axis=1, kind="stable")
+    a, b = order[:, :-1], order[:, 1:]
+    xa, xb = np.take_along_axis(x, a, axis=1), np.take_along_axis(x, b, axis=1)
+    pa, pb = np.take_along_axis(pos, a, axis=1), np.take_along_axis(pos, b, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slopes = (xb - xa) / (pb - pa)
+    inside = (b < n[:, None]) & (slopes > lo[:, None]) & (slopes <= hi[:, None])
+    found = inside.any(axis=1)
+    first = np.argmax(inside, axis=1)
+    return np.where(found, slopes[np.arange(len(n)), first], hi)
+
+
+def sens_slope(x: np.ndarray, n: np.ndarray, pos: np.ndarray = None):
+    """
+    Pendiente de Sen e intercepto (como ``pymannkendall.sens_slope``) por fila.
+
+    ``pos`` es la posición en el tiempo de cada dato de las filas comprimidas
+    (de :func:`compress` con ``positions=True``); por defecto son consecutivos.
+    Como en ``pymannkendall``, cada pendiente se divide por la distancia real
+    entre los meses, así que los huecos internos no acortan la serie.
+
+    Se buscan a la vez las dos pendientes centrales de cada fila (iguales si
+    n(n−1)/2 es impar). El intervalo ``(lo, hi]`` que contiene la k-ésima
+    pendiente se achica por interpolación sobre los conteos (con bisección
+    cuando la interpolación no reduce el intervalo a la mitad) hasta que
+    contiene una sola pendiente o mide menos de ``SLOPE_RTOL`` del rango.
+    """
+    rows = len(n)
+    width = _width(x.shape[1])
+    pairs = n * (n - 1) // 2
+    k = np.concatenate([(pairs + 1) // 2, pairs // 2 + 1])          # rangos 1-based
+    pos = np.broadcast_to(np.arange(x.shape[1]), x.shape) if pos is None else pos
+    pos = np.asarray(pos, dtype=float)
+    xx = np.concatenate([x, x])
+    nn = np.concatenate([n, n])
+    pp = np.concatenate([pos, pos])
+
+    # Filas sin datos (píxeles de mar) quedan en NaN sin avisos
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        spread = np.nanmax(xx, axis=1) - np.nanmin(xx, axis=1)
+    spread = np.where(np.isfinite(spread) & (spread > 0), spread, 1.0)
+    # Ninguna pendiente sale de ±rango: conteos 0 y todos los pares
+    lo, hi = -spread * 1.01, spread * 1.01
+    c_lo, c_hi = np.zeros_like(k), np.concatenate([pairs, pairs])
+    slow = np.zeros(k.shape, dtype=bool)
+    for _ in range(MAX_BISECT):
+        active = (c_hi - c_lo > 1) & (hi - lo > SLOPE_RTOL * spread)
+        if not active.any():
+            break
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frac = np.clip((k - c_lo - 0.5) / (c_hi - c_lo), 0.01, 0.99)
+        t = np.where(slow, 0.5 * (lo + hi), lo + frac * (hi - lo))
+        # Solo se cuentan las filas que siguen abiertas
+        count = np.zeros_like(k)
+        count[active] = _slopes_le(xx[active], nn[active], t[active], width, pp[active])
+        enough = active & (count >= k)
+        below = active & (count < k)
+        old = hi - lo
+        hi, c_hi = np.where(enough, t, hi), np.where(enough, count, c_hi)
+        lo, c_lo = np.where(below, t, lo), np.where(below, count, c_lo)
+        slow = active & (hi - lo > 0.5 * old)
+
+    slope = _snap(xx, nn, lo, hi, pp)
+    slope = 0.5 * (slope[:rows] + slope[rows:])
+    slope = np.where(pairs > 0, slope, np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        valid = np.arange(x.shape[1])[None, :] < n[:, None]
+        center = np.nanmedian(np.where(valid, pos, np.nan), axis=1)
+        intercept = np.nanmedian(x, axis=1) - center * slope
+    return slope, intercept
+
+
+def mk_batch(values: np.ndarray, alpha: float = ALPHA) -> dict:
+    """
+    Mann-Kendall original de cada fila de ``values`` ``(series, tiempo)``.
+
+    Los NaN se descartan (como ``method="skip"``) para ``S``; la pendiente de
+    Sen usa la posición original de cada mes, también con huecos internos.
+    Devuelve arreglos ``n``, ``s``, ``var_s``, ``z``, ``p``, ``tau``, ``h``,
+    ``trend``, ``slope`` e ``intercept`` (en la posición original).
+    """
+    x, n, pos = compress(values, positions=True)
+    s, var_s = mk_score(x, n)
+    out = {"n": n, "s": s, "var_s": var_s, **significance(s, var_s, n, alpha)}
+    out["slope"], out["intercept"] = sens_slope(x, n, pos)
+    return out
+
+
+def significance(s, var_s, n, alpha: float = ALPHA) -> dict:
+    """``z`` (con corrección por continuidad), ``p`` bilateral, ``tau``, ``h`` y ``trend``."""
+    s, var_s, n = np.asarray(s, dtype=float), np.asarray(var_s, dtype=float), np.asarray(n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = np.where(s > 0, (s - 1) / np.sqrt(var_s), np.where(s < 0, (s + 1) / np.sqrt(var_s), 0.0))
+        tau = s / (0.5 * n * (n - 1))
+    # ndtr en vez de stats.norm: sin sobrecosto por llamada en las consultas sueltas
+    # Series con menos de 2 datos: sin prueba (NaN, no p = 1)
+    p = np.where(var_s > 0, 2 * special.ndtr(-np.abs(z)), np.nan)
+    z = np.where(var_s > 0, z, np.nan)
+    h = np.abs(z) > special.ndtri(1 - alpha / 2)
+    trend = np.where(h & (z > 0), "increasing", np.where(h & (z < 0), "decreasing", "no trend"))
+    return {"z": z, "p": p, "tau": tau, "h": h, "trend": trend}
+
+
+def fdr_qvalues(p: np.ndarray) -> np.ndarray:
+    """
+    Valores q de Benjamini–Hochberg por fila (los NaN no cuentan como pruebas).
+
+    Un píxel es significativo con tasa de falsos descubrimientos ``alpha`` si su
+    ``q <= alpha``.
+    """
+    p = np.atleast_2d(np.asarray(p, dtype=float))
+    m = np.isfinite(p).sum(axis=1, keepdims=True)
+    order = np.argsort(np.where(np.isfinite(p), p, np.inf), axis=1)
+    ps = np.take_along_axis(p, order, axis=1)
+    rank = np.arange(1, p.shape[1] + 1)[None, :]
+    with np.errstate(invalid="ignore"):
+        q = ps * m / rank
+    # Mínimo acumulado desde el final (los NaN del relleno no participan)
+    q = np.minimum.accumulate(np.where(np.isfinite(q), q, np.inf)[:, ::-1], axis=1)[:, ::-1]
+    q = np.where(np.isfinite(ps), np.minimum(q, 1.0), np.nan)
+    out = np.empty_like(q)
+    np.put_along_axis(out, order, q, axis=1)
+    return out
+
+
+def trend_table(df: pd.DataFrame, columns=None, alpha: float = ALPHA) -> pd.DataFrame:
+    """Una fila por columna (por defecto todos los SPI/SPEI) con el resultado de :func:`mk_batch`."""
+    if columns is None:
+        columns = [c for c in df.columns if str(c).startswith(INDEX_PREFIXES)]
+    out = pd.DataFrame(mk_batch(df[list(columns)].to_numpy(dtype=float).T, alpha))
+    out.insert(0, "index", list(columns))
+    return out
+
+
+def cached_trends(df: pd.DataFrame, cache_dir, version: str, columns=None,
+                  time_col: str = TIME_DIM, alpha: float = ALPHA) -> pd.DataFrame:
+    """:func:`trend_table` guardado en ``cache_dir/tendencias_<version>.parquet``."""
+    key = cache_key(version)
+    path = Path(cache_dir) / f"tendencias_{key}_a{alpha:g}.parquet"
+    if path.exists():
+        table = pd.read_parquet(path)
+        if columns is None or list(table["index"]) == list(columns):
+            return table
+    table = trend_table(df.sort_values(time_col), columns, alpha)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".parquet.tmp")
+    table.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return table
+
+
+class RangeTrend:
+    """
+    Mann-Kendall de una serie sobre cualquier tramo ``[i, j]`` sin recorrerla.
+
+    - ``S`` sale de una suma de prefijos 2-D de la matriz de signos
+      ``sign(x[b] − x[a])`` (``a < b``): cuatro lecturas por consulta.
+    - La varianza solo necesita ``n`` (y los empates del tramo si la serie tiene).
+    - La pendiente de Sen de los tramos de años completos se precalcula en lote
+      con :func:`mk_batch`; para tramos arbitrarios de meses se selecciona la
+      mediana sobre la matriz de pendientes ya construida.
+
+    Los NaN se descartan al construir y los meses restantes se toman como
+    consecutivos: sirve para series sin huecos internos (los NaN del principio
+    o del final no cambian nada).
+    """
+
+    def __init__(self, times, x, prefix, years, year_slopes, has_ties: bool):
+        self.times = pd.DatetimeIndex(times)
+        self.x = np.asarray(x, dtype=float)
+        self.prefix = prefix                  # (n+1, n+1) int32
+        self.years = np.asarray(years)
+        self.year_slopes = year_slopes        # (Y, Y): [año inicial, año final]
+        self.has_ties = bool(has_ties)
+        self._slopes = None
+        y = self.times.year.to_numpy()
+        self._first = np.searchsorted(y, self.years, side="left")
+        self._last = np.searchsorted(y, self.years, side="right") - 1
+
+    @classmethod
+    def build(cls, values, times, min_years: int = 2) -> "RangeTrend":
+        values = np.asarray(values, dtype=float)
+        keep = np.isfinite(values)
+        x, times = values[keep], pd.DatetimeIndex(times)[keep]
+        n = x.size
+        signs = np.triu(np.sign(x[None, :] - x[:, None]), 1).astype(np.int32)
+        prefix = np.zeros((n + 1, n + 1), dtype=np.int32)
+        prefix[1:, 1:] = signs.cumsum(axis=0).cumsum(axis=1)
+
+        # Todas las ventanas de años completos en un solo lote
+        year_of = times.year.to_numpy()
+        years = np.unique(year_of)
+        y0, y1 = np.triu_indices(years.size, min_years - 1)
+        mask = (year_of[None, :] >= years[y0][:, None]) & (year_of[None, :] <= years[y1][:, None])
+        slopes, _ = sens_slope(*compress(np.where(mask, x[None, :], np.nan)))
+        year_slopes = np.full((years.size, years.size), np.nan)
+        year_slopes[y0, y1] = slopes
+        return cls(times, x, prefix, years, year_slopes, np.unique(x).size < n)
+
+    def _positions(self, start, end):
+        i = int(np.searchsorted(self.times, pd.Timestamp(start), side="left"))
+        j = int(np.searchsorted(self.times, pd.Timestamp(end), side="right")) - 1
+        return i, j
+
+    def score(self, i: int, j: int):
+        """``S`` y su varianza del tramo de posiciones ``[i, j]``."""
+        p = self.prefix
+        s = int(p[j + 1, j + 1] - p[i, j + 1] - p[j + 1, i] + p[i, i])
+        n = j - i + 1
+        ties = 0.0
+        if self.has_ties:
+            t = np.unique(self.x[i:j + 1], return_counts=True)[1]
+            ties = float((t * (t - 1) * (2 * t + 5)).sum())
+        return s, (n * (n - 1) * (2 * n + 5) - ties) / 18.0
+
+    def slope(self, i: int, j: int) -> float:
+        """Pendiente de Sen del tramo ``[i, j]`` (por mes)."""
+        yi = np.searchsorted(self._first, i)
+        yj = np.searchsorted(self._last, j)
+        if (yi < self.years.size and yj < self.years.size and self._first[yi] == i
+                and self._last[yj] == j and np.isfinite(self.year_slopes[yi, yj])):
+            return float(self.year_slopes[yi, yj])
+        if self._slopes is None:
+            k = np.arange(self.x.size)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                self._slopes = (self.x[None, :] - self.x[:, None]) / (k[None, :] - k[:, None])
+        block = self._slopes[i:j + 1, i:j + 1]
+        return float(np.median(block[np.triu_indices(j - i + 1, 1)])) if j > i else np.nan
+
+    def query(self, start, end, alpha: float = ALPHA) -> dict:
+        """Resultado de Mann-Kendall (como :func:`mk_batch`) para los meses ``start..end``."""
+        i, j = self._positions(start, end)
+        n = j - i + 1
+        s, var_s = self.score(i, j) if n > 1 else (0, np.nan)
+        out = {k: v.item() for k, v in significance(s, var_s, n, alpha).items()}
+        slope = self.slope(i, j) if n > 1 else np.nan
+        out.update(n=n, s=s, var_s=var_s, slope=slope,
+                   intercept=float(np.median(self.x[i:j + 1]) - (n - 1) / 2.0 * slope) if n else np.nan,
+                   start=self.times[i] if n else None, end=self.times[j] if n else None)
+        return out
+
+    def query_years(self, first_year: int, last_year: int, alpha: float = ALPHA) -> dict:
+        return self.query(f"{first_year}-01-01", f"{last_year}-12-31", alpha)
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez_compressed(tmp, times=self.times.as_unit("ns").asi8, x=self.x, prefix=self.prefix,
+                            years=self.years, year_slopes=self.year_slopes,
+                            has_ties=np.array(self.has_ties))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path) -> "RangeTrend":
+        with np.load(path) as z:
+            return cls(pd.to_datetime(z["times"]), z["x"], z["prefix"], z["years"],
+                       z["year_slopes"], bool(z["has_ties"]))
+
+
+def cached_range_trend(df: pd.DataFrame, column: str, cache_dir, version: str,
+                       time_col: str = TIME_DIM) -> RangeTrend:
+    """:class:`RangeTrend` de ``column`` guardado en ``cache_dir/rango_<columna>_<version>.npz``."""
+    key = cache_key(version)
+    path = Path(cache_dir) / f"rango_{column}_{key}.npz"
+    if path.exists():
+        return RangeTrend.load(path)
+    df = df.sort_values(time_col)
+    rt = RangeTrend.build(df[column].to_numpy(dtype=float), df[time_col])
+    rt.save(path)
+    return rt
+
+
+# ----- variantes robustas a la autocorrelación -----
+BOOT_BLOCK = 24        # meses por bloque: el doble de la ventana más larga (SPEI_12)
+N_BOOT = 1000
+BOOT_CHUNK = 100       # réplicas por tarea; fija para que el resultado no dependa de los procesos
+
+
+def acf(x: np.ndarray, n: np.ndarray, nlags: int) -> np.ndarray:
+    """Autocorrelación (como ``pymannkendall``) de filas comprimidas, por FFT: ``(filas, nlags+1)``."""
+    valid = np.arange(x.shape[1])[None, :] < n[:, None]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        y = np.where(valid, x - np.nanmean(np.where(valid, x, np.nan), axis=1, keepdims=True), 0.0)
+    size = 1 << int(2 * x.shape[1] - 1).bit_length()
+    f = np.fft.rfft(y, size, axis=1)
+    acov = np.fft.irfft(f * np.conj(f), size, axis=1)[:, :nlags + 1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return acov / acov[:, :1]
+
+
+def hamed_rao(values: np.ndarray, alpha: float = ALPHA, lag: int = None) -> dict:
+    """
+    Mann-Kendall modificado de Hamed y Rao (1998), por fila.
+
+    La varianza de ``S`` se infla con las autocorrelaciones significativas de
+    los rangos de la serie sin tendencia (pendiente de Sen). ``lag`` limita los
+    rezagos considerados (por defecto, todos). Devuelve lo mismo que
+    :func:`mk_batch` más ``n_ns`` (el factor de corrección).
+    """
+    from scipy.stats import rankdata
+
+    x, n, pos = compress(values, positions=True)
+    s, var_s = mk_score(x, n)
+    slope, intercept = sens_slope(x, n, pos)
+    detrended = x - np.arange(1, x.shape[1] + 1)[None, :] * slope[:, None]
+    ranks = rankdata(detrended, axis=1, nan_policy="omit")
+    ranks = np.where(np.isfinite(detrended), ranks, np.nan)
+
+    nlags = x.shape[1] - 1
+    r = acf(ranks, n, nlags)[:, 1:]
+    i = np.arange(1, nlags + 1)[None, :]
+    nn = n[:, None].astype(float)
+    max_lag = nn if lag is None else np.minimum(nn, lag + 1)
+    bound = special.ndtri(1 - alpha / 2) / np.sqrt(nn)
+    use = (i < max_lag) & (np.abs(r) > bound)
+    sni = np.where(use, (nn - i) * (nn - i - 1) * (nn - i - 2) * r, 0.0).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        n_ns = 1 + 2 / (n * (n - 1) * (n - 2)) * sni
+    var_s = var_s * n_ns
+    return {"n": n, "s": s, "var_s": var_s, **significance(s, var_s, n, alpha),
+            "slope": slope, "intercept": intercept, "n_ns": n_ns}
+
+
+def prewhitened(values: np.ndarray, alpha: float = ALPHA) -> dict:
+    """
+    Mann-Kendall sobre la serie pre-blanqueada ``x[t] − r1·x[t−1]`` (Yue y Wang
+    2002), por fila. La pendiente de Sen es la de la serie original.
+    """
+    x, n, pos = compress(values, positions=True)
+    r1 = acf(x, n, 1)[:, 1]
+    white = x[:, 1:] - r1[:, None] * x[:, :-1]
+    xw, nw = compress(white)
+    s, var_s = mk_score(xw, nw)
+    slope, intercept = sens_slope(x, n, pos)
+    return {"n": nw, "s": s, "var_s": var_s, **significance(s, var_s, nw, alpha),
+            "slope": slope, "intercept": intercept, "r1": r1}
+
+
+def _block_boot_slopes(fitted: np.ndarray, resid: np.ndarray, n: np.ndarray, pos: np.ndarray,
+                       reps: int, block: int, seed) -> np.ndarray:
+    """Pendientes de Sen de ``reps`` réplicas por bloques móviles de los residuos: ``(reps, filas)``."""
+    rng = np.random.default_rng(seed)
+    rows, width = resid.shape
+    n_blocks = -(-width // block)
+    # Inicio de cada bloque dentro de los n − block + 1 posibles de su fila
+    starts = (rng.random((reps, rows, n_blocks)) * np.maximum(n - block + 1, 1)[None, :, None]).astype(int)
+    idx = (starts[..., None] + np.arange(block)).reshape(reps, rows, -1)[..., :width]
+    idx = np.minimum(idx, np.maximum(n - 1, 0)[None, :, None])
+    sample = fitted[None] + np.take_along_axis(np.broadcast_to(resid, (reps, rows, width)), idx, axis=2)
+    sample = np.where(np.arange(width)[None, None, :] < n[None, :, None], sample, np.nan)
+    slope, _ = sens_slope(sample.reshape(reps * rows, width), np.tile(n, reps), np.tile(pos, (reps, 1)))
+    return slope.reshape(reps, rows)
+
+
+def block_bootstrap_slope(values: np.ndarray, n_boot: int = N_BOOT, block: int = BOOT_BLOCK,
+                          level: float = 0.9, seed: int = 0, workers: int = None) -> dict:
+    """
+    Intervalo de confianza de la pendiente de Sen por bootstrap de bloques móviles.
+
+    Se remuestrean en bloques de ``block`` meses los residuos respecto a la recta
+    de Kendall-Theil (así se conserva la autocorrelación) y se suman a la recta.
+    Las réplicas van en tareas de ``BOOT_CHUNK``, cada una vectorizada y con su
+    propia semilla derivada de ``seed``: el resultado es el mismo con cualquier
+    número de ``workers``.
+    """
+    x, n, pos = compress(values, positions=True)
+    slope, intercept = sens_slope(x, n, pos)
+    fitted = intercept[:, None] + slope[:, None] * pos
+    resid = np.where(np.isfinite(x), x - fitted, 0.0)
+
+    sizes = [min(BOOT_CHUNK, n_boot - i) for i in range(0, n_boot, BOOT_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(sizes) == 1:
+        parts = [_block_boot_slopes(fitted, resid, n, pos, reps, block, sd) for reps, sd in zip(sizes, seeds)]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(sizes))) as pool:
+            futures = [pool.submit(_block_boot_slopes, fitted, resid, n, pos, reps, block, sd)
+                       for reps, sd in zip(sizes, seeds)]
+            parts = [f.result() for f in futures]
+    boot = np.concatenate(parts)
+    tail = (1 - level) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        lo, hi = np.nanquantile(boot, [tail, 1 - tail], axis=0)
+    return {"slope": slope, "slope_lo": lo, "slope_hi": hi, "slope_se": np.nanstd(boot, axis=0, ddof=1)}
+
+
+def robust_trend_table(df: pd.DataFrame, columns=None, alpha: float = ALPHA, n_boot: int = N_BOOT,
+                       block: int = BOOT_BLOCK, seed: int = 0, workers: int = None) -> pd.DataFrame:
+    """
+    Por columna: ``p`` del test original, de Hamed–Rao y con pre-blanqueo, la
+    pendiente de Sen y su intervalo bootstrap por bloques (90 %).
+    """
+    if columns is None:
+        columns = [c for c in df.columns if str(c).startswith(INDEX_PREFIXES)]
+    values = df[list(columns)].to_numpy(dtype=float).T
+    original = mk_batch(values, alpha)
+    hr = hamed_rao(values, alpha)
+    pw = prewhitened(values, alpha)
+    boot = block_bootstrap_slope(values, n_boot, block, seed=seed, workers=workers)
+    return pd.DataFrame({
+        "index": list(columns),
+        "n": original["n"],
+        "s": original["s"],
+        "p": original["p"],
+        "trend": original["trend"],
+        "p_hamed_rao": hr["p"],
+        "trend_hamed_rao": hr["trend"],
+        "n_ns": hr["n_ns"],
+        "p_prewhitened": pw["p"],
+        "trend_prewhitened": pw["trend"],
+        "r1": pw["r1"],
+        "slope": original["slope"],
+        "intercept": original["intercept"],
+        "slope_lo": boot["slope_lo"],
+        "slope_hi": boot["slope_hi"],
+        "slope_se": boot["slope_se"],
+    })
+
+
+def cached_robust_trends(df: pd.DataFrame, cache_dir, version: str, columns=None,
+                         time_col: str = TIME_DIM, alpha: float = ALPHA, n_boot: int = N_BOOT,
+                         block: int = BOOT_BLOCK, seed: int = 0, workers: int = None) -> pd.DataFrame:
+    """:func:`robust_trend_table` guardado por versión del dataset y parámetros del bootstrap."""
+    key = cache_key(version)
+    path = Path(cache_dir) / f"tendencias_robustas_{key}_a{alpha:g}_b{n_boot}x{block}_s{seed}.parquet"
+    if path.exists():
+        table = pd.read_parquet(path)
+        if columns is None or list(table["index"]) == list(columns):
+            return table
+    table = robust_trend_table(df.sort_values(time_col), columns, alpha, n_boot, block, seed, workers)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".parquet.tmp")
+    table.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return table
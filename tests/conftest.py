@@ -0,0 +1,39 @@
+"""Datos sintéticos compartidos por las pruebas (sin red ni archivos del repo)."""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sarida.era5 import TIME_DIM, VALUE_COLS  # noqa: E402
+
+
+def synthetic_era5(start="2019-01", end="2021-12", ny=3, nx=4, seed=0) -> xr.Dataset:
+    """Cubo mensual con las variables ERA5-Land sobre la caja de Riohacha."""
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start, end, freq="MS")
+    lat = np.linspace(11.75, 11.35, ny)
+    lon = np.linspace(-73.15, -72.65, nx)
+    shape = (len(times), ny, nx)
+    base = {
+        "t2m": (300.0, 1.0), "swvl1": (0.25, 0.05), "swvl2": (0.25, 0.05),
+        "swvl3": (0.25, 0.05), "swvl4": (0.25, 0.05), "ssrd": (2.0e7, 1.0e6),
+        "pev": (-0.006, 0.001), "e": (-0.002, 0.0005), "tp": (0.002, 0.001),
+    }
+    data = {}
+    for var in VALUE_COLS:
+        mean, sd = base[var]
+        values = mean + sd * rng.standard_normal(shape)
+        if var == "tp":
+            values = np.abs(values)
+        data[var] = ((TIME_DIM, "latitude", "longitude"), values.astype("float32"))
+    return xr.Dataset(data, coords={TIME_DIM: times, "latitude": lat, "longitude": lon})
+
+
+@pytest.fixture
+def era5_source():
+    return synthetic_era5()
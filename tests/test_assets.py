@@ -0,0 +1,77 @@
+import hashlib
+
+from sarida.assets import fetch_http
+
+
+class _Response:
+    def __init__(self, status, body=b"", headers=None):
+        self.status_code = status
+        self.body = body
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+    def iter_content(self, chunk_size):
+        yield self.body
+
+
+class _Server:
+    """Servidor HTTP mínimo con rangos: 416 si el rango empieza en o después del final."""
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self.calls = []
+
+    def get(self, url, stream=True, timeout=None, headers=None):
+        headers = headers or {}
+        self.calls.append(headers)
+        size = len(self.content)
+        if "Range" in headers:
+            start = int(headers["Range"].split("=")[1].rstrip("-"))
+            if start >= size:
+                return _Response(416, headers={"Content-Range": f"bytes */{size}"})
+            return _Response(206, self.content[start:])
+        return _Response(200, self.content)
+
+
+def test_resume_from_partial(tmp_path):
+    server = _Server(b"0123456789")
+    dest = tmp_path / "dataset.parquet"
+    (tmp_path / "dataset.parquet.part").write_bytes(b"0123")
+    fetch_http("http://x/dataset", dest, session=server)
+    assert dest.read_bytes() == b"0123456789"
+    assert server.calls[0]["Range"] == "bytes=4-"
+
+
+def test_416_with_complete_part_is_kept(tmp_path):
+    server = _Server(b"0123456789")
+    dest = tmp_path / "dataset.parquet"
+    (tmp_path / "dataset.parquet.part").write_bytes(b"0123456789")
+    fetch_http("http://x/dataset", dest, session=server)
+    assert dest.read_bytes() == b"0123456789"
+    assert len(server.calls) == 1
+
+
+def test_416_with_longer_part_restarts(tmp_path):
+    server = _Server(b"new")
+    dest = tmp_path / "dataset.parquet"
+    (tmp_path / "dataset.parquet.part").write_bytes(b"old version, longer")
+    fetch_http("http://x/dataset", dest, session=server)
+    assert dest.read_bytes() == b"new"
+    assert "Range" not in server.calls[-1]
+
+
+def test_416_with_longer_part_and_checksum(tmp_path):
+    server = _Server(b"new")
+    dest = tmp_path / "dataset.parquet"
+    (tmp_path / "dataset.parquet.part").write_bytes(b"stale bytes")
+    fetch_http("http://x/dataset", dest, sha256=hashlib.sha256(b"new").hexdigest(), session=server)
+    assert dest.read_bytes() == b"new"
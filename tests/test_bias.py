@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+import sarida.bias as bias
+from sarida.bias import QuantileMaps, _interp_rows, fit_series_maps
+from sarida.era5 import TIME_DIM
+
+
+def _tables(rows=5, n_q=11, seed=0):
+    rng = np.random.default_rng(seed)
+    xp = np.sort(rng.gamma(2.0, 1.0, (rows, n_q)), axis=1)
+    fp = np.sort(rng.gamma(2.0, 1.5, (rows, n_q)), axis=1)
+    xp[2] = np.nan                                     # mes sin traslape suficiente
+    return xp, fp
+
+
+def test_interp_rows_matches_np_interp_in_range():
+    xp, fp = _tables()
+    rng = np.random.default_rng(1)
+    rows = rng.integers(0, len(xp), 400)
+    lo, hi = np.nan_to_num(xp[rows, 0], nan=3.0), np.nan_to_num(xp[rows, -1], nan=3.0)
+    x = lo + rng.random(rows.size) * (hi - lo)
+    x[::37] = np.nan
+
+    out = _interp_rows(x, rows, xp, fp)
+    expected = np.array([
+        np.interp(v, xp[r], fp[r]) if np.isfinite(xp[r]).all() and np.isfinite(v) else v
+        for v, r in zip(x, rows)
+    ])
+    np.testing.assert_allclose(out, expected, rtol=1e-12, equal_nan=True)
+
+
+def test_interp_rows_scales_outside_table():
+    xp, fp = _tables()
+    x = np.array([xp[0, -1] * 2, xp[1, 0] / 2, 5.0])
+    rows = np.array([0, 1, 2])
+    out = _interp_rows(x, rows, xp, fp)
+    assert np.isclose(out[0], x[0] * fp[0, -1] / xp[0, -1])
+    assert np.isclose(out[1], x[1] * fp[1, 0] / xp[1, 0])
+    assert out[2] == 5.0                                # fila sin tabla: sin corregir
+
+
+def _write_station(path, scale=1.5, seed=0):
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("2000-01-01", "2011-12-31", freq="D")
+    pd.DataFrame({
+        "CodigoEstacion": "15065010", "Latitud": 11.5, "Longitud": -72.9,
+        "Fecha": days.strftime("%Y-%m-%d"), "Valor": scale * rng.gamma(0.5, 4.0, len(days)),
+    }).to_csv(path, index=False)
+
+
+def test_fit_series_maps_cache_follows_station_fingerprint(tmp_path, monkeypatch):
+    stations = tmp_path / "estaciones"
+    stations.mkdir()
+    _write_station(stations / "est.csv")
+    times = pd.date_range("2000-01", "2011-12", freq="MS")
+    df = pd.DataFrame({TIME_DIM: times,
+                       "tp": np.random.default_rng(2).gamma(0.5, 0.004, len(times))})
+    cache = tmp_path / "cache"
+
+    first = fit_series_maps(df, stations, cache_dir=cache)
+    assert (cache / "qm_serie.npz").exists()
+    assert np.isfinite(first.q_obs).all()
+
+    # Mismos CSV: se reutiliza la tabla sin volver a leer las estaciones
+    calls = []
+    read = bias.read_station_csvs
+    monkeypatch.setattr(bias, "read_station_csvs", lambda p: calls.append(p) or read(p))
+    again = fit_series_maps(df, stations, cache_dir=cache)
+    assert calls == []
+    np.testing.assert_array_equal(again.q_obs, first.q_obs)
+
+    # CSV nuevo: cambia la huella y se reajusta
+    _write_station(stations / "est.csv", scale=3.0)
+    refit = fit_series_maps(df, stations, cache_dir=cache)
+    assert len(calls) == 1
+    assert refit.fingerprint != first.fingerprint
+    assert QuantileMaps.load(cache / "qm_serie.npz").fingerprint == refit.fingerprint
+    assert np.nanmean(refit.q_obs) > 1.5 * np.nanmean(first.q_obs)
@@ -0,0 +1,67 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sarida.calibration import Calibration, IndexStore
+from sarida.indices import SI_BOUND, spi_spei
+
+
+def _series(seed=3):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("1991-01", "2021-06", freq="MS")
+    # Con esta forma la gamma de 3 parámetros pone ``loc`` bastante arriba de 0
+    pr = rng.gamma(8.0, 10.0, len(times))
+    pet = 150 + 10 * rng.standard_normal(len(times))
+    return times, pr, pet
+
+
+def test_dry_month_outside_calibration_is_not_clipped():
+    times, pr, pet = _series()
+    pr[-1] = 10.0                                           # junio 2021, más seco que todo 1991–2020
+    calib = Calibration.fit(pr, pet, times)
+    spi = calib.indices(pr, pet, times)["SPI_1"]
+    assert np.isfinite(spi.iloc[-1])
+    assert -SI_BOUND < spi.iloc[-1] < -3
+    assert (spi.dropna().abs() < SI_BOUND).all()
+
+    # Con la gamma de 3 parámetros el mismo mes caía fuera del soporte
+    in_period = times <= "2020-12"
+    spi3, _, params = spi_spei(pr, pet, times.month, (1,), fit_mask=in_period)
+    assert params["loc"][0, 5] > 10.0
+    assert spi3[0, -1] == -SI_BOUND
+
+
+def test_index_store_update_keeps_published_months(tmp_path):
+    times, pr, pet = _series()
+    store = IndexStore(tmp_path)
+    first = store.update(pr[:-3], pet[:-3], times[:-3])
+    pr[-1] = 10.0
+    full = store.update(pr, pet, times)
+    pd.testing.assert_frame_equal(full.loc[first.index], first, check_freq=False)
+    assert -SI_BOUND < full["SPI_1"].iloc[-1] < -3
+
+
+BUNDLED = Path(__file__).resolve().parents[1] / "Dashboard" / "data_stream-moda.nc"
+
+
+@pytest.mark.skipif(not BUNDLED.exists(), reason="sin el NetCDF del dashboard")
+def test_spei_on_bundled_netcdf_is_bounded_and_stable():
+    import xarray as xr
+
+    from sarida.era5 import era5_to_monthly_df
+    from sarida.indices import era5_pr_pet
+
+    with xr.open_dataset(BUNDLED) as ds:
+        df = era5_to_monthly_df(ds).sort_values("valid_time")
+    times = pd.DatetimeIndex(df["valid_time"])
+    pr, pet = era5_pr_pet(df["tp"], df["pev"])
+    spei = Calibration.fit(pr, pet, times).indices(pr, pet, times).filter(like="SPEI_")
+    assert (spei.dropna().abs() < 4).all().all()
+    # Antes (gamma de 3 parámetros) marzo de 2020 daba SPEI_3 ≈ −7.2
+    assert spei.loc["2020-03-01", "SPEI_3"] > -3
+
+    # Una perturbación del orden del redondeo no mueve el índice
+    nudged = Calibration.fit(pr * (1 + 3e-8), pet, times).indices(pr * (1 + 3e-8), pet, times)
+    assert np.nanmax(np.abs(nudged[spei.columns].to_numpy() - spei.to_numpy())) < 1e-5
@@ -0,0 +1,29 @@
+import numpy as np
+
+from sarida.changepoints import binary_segmentation, pettitt
+
+
+def _ar1(rows, n, phi, shift=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    e = rng.normal(size=(rows, n))
+    x = np.empty((rows, n))
+    x[:, 0] = e[:, 0] / np.sqrt(1 - phi ** 2)
+    for t in range(1, n):
+        x[:, t] = phi * x[:, t - 1] + e[:, t]
+    return x + np.where(np.arange(n) < n // 2, 0.0, shift)
+
+
+def test_no_breaks_in_autocorrelated_series_without_changes():
+    # 40 años mensuales con la persistencia de un SPEI_12
+    x = _ar1(100, 480, 0.95)
+    rows, _, _ = binary_segmentation(x)
+    assert len(rows) / len(x) < 0.1
+    assert (pettitt(x)["p"] < 0.05).mean() < 0.1
+
+
+def test_level_shift_is_still_found():
+    x = _ar1(50, 480, 0.5, shift=1.5)
+    rows, pos, _ = binary_segmentation(x)
+    assert np.array_equal(np.sort(rows), np.arange(len(x)))
+    assert np.median(np.abs(pos - 240)) <= 6
+    assert (pettitt(x)["p"] < 0.05).all()
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from sarida.clusters import cluster_summary, label_clusters
+from sarida.era5 import TIME_DIM
+
+
+def _field():
+    times = pd.date_range("2000-01", periods=24, freq="MS")
+    values = np.zeros((24, 6, 8))
+    # Sequía que se desplaza una columna por mes (meses 3–11)
+    for i, t in enumerate(range(3, 12)):
+        col = min(i, 6)
+        values[t, 1:3, col:col + 2] = -1.5
+    # Dos núcleos separados (meses 14–16) que se unen en el mes 17
+    values[14:17, 0, 0] = -2.0
+    values[14:17, 5, 7] = -2.0
+    values[17, :, :] = -1.2
+    # Evento aislado de un mes
+    values[21, 4, 4] = -1.1
+    return xr.DataArray(values, dims=(TIME_DIM, "latitude", "longitude"),
+                        coords={TIME_DIM: times, "latitude": np.linspace(11.7, 11.2, 6),
+                                "longitude": np.linspace(-73.2, -72.5, 8)})
+
+
+@pytest.mark.parametrize("block", [1, 4, 5])
+def test_clusters_cross_time_blocks(block):
+    da = _field()
+    track = label_clusters(da, time_block=block)
+    whole = label_clusters(da, time_block=len(da[TIME_DIM]))
+    pd.testing.assert_frame_equal(track, whole)
+
+    summary = cluster_summary(track)
+    assert len(summary) == 3
+    moving, merged, single = summary.sort_values("start").itertuples()
+    assert (moving.start, moving.end, moving.duration) == (pd.Timestamp("2000-04"), pd.Timestamp("2000-12"), 9)
+    assert moving.lon_end > moving.lon_start
+    assert (merged.start, merged.end, merged.max_cells) == (pd.Timestamp("2001-03"), pd.Timestamp("2001-06"), 48)
+    assert single.duration == 1
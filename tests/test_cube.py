@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from conftest import synthetic_era5
+from sarida.cube import CubeStore
+from sarida.era5 import TIME_DIM
+from sarida.gridded import grid_indices, index_names
+
+
+def test_append_after_grid_indices_keeps_cube_readable(tmp_path):
+    source = synthetic_era5("2015-01", "2021-06")
+    store = CubeStore(tmp_path / "cubo.zarr")
+    store.append(source.sel({TIME_DIM: slice(None, "2020-12")}))
+    names = grid_indices(store, windows=(1, 3), workers=1)
+
+    added = store.append(source)
+    assert len(added) == 6
+    ds = xr.open_zarr(store.root)                          # antes fallaba: tamaños de valid_time distintos
+    assert all(ds[n].sizes[TIME_DIM] == ds["tp"].sizes[TIME_DIM] for n in names)
+    assert ds[names[0]].sel({TIME_DIM: "2021-03"}).isnull().all()
+
+    # Al recalcular se llenan los meses nuevos sin tocar el resto del cubo
+    before = ds["SPI_1"].sel({TIME_DIM: "2020"}).load()
+    grid_indices(store, windows=(1, 3), workers=1)
+    ds = store.open(chunks=None)
+    assert np.isfinite(ds["SPI_3"].sel({TIME_DIM: "2021"}).values).all()
+    xr.testing.assert_allclose(ds["SPI_1"].sel({TIME_DIM: "2020"}), before)
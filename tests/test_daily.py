@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sarida.calibration import Calibration
+from sarida.daily import DailyState, run_daily
+
+
+def _monthly(seed=1):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("1991-01", "2021-01", freq="MS")
+    tp = rng.gamma(2.0, 40.0, len(times))
+    pev = 150 + 20 * rng.standard_normal(len(times))
+    tp[-3:], pev[-3:] = 35.0, 160.0                    # noviembre–enero iguales
+    return pd.DataFrame({"valid_time": times, "tp": tp, "pev": pev})
+
+
+def test_provisional_matches_published_scale(tmp_path):
+    monthly = _monthly()
+    calib = Calibration.fit(monthly["tp"], monthly["pev"], monthly["valid_time"])
+    published = calib.indices(monthly["tp"], monthly["pev"], monthly["valid_time"]).iloc[-1]
+
+    drop = tmp_path / "diarios"
+    drop.mkdir()
+    for day in pd.date_range("2020-11-03", "2021-01-31"):
+        # ERA5 diario: m de agua del día (pev negativa)
+        pd.DataFrame([{"tp": 35.0 / 30000, "pev": -160.0 / 30000}]).to_csv(drop / f"{day:%Y-%m-%d}.csv", index=False)
+
+    rows = run_daily(drop, tmp_path / "estado.json", calibration=calib)
+    last = rows.iloc[-1]
+    for col in ("SPI_1", "SPEI_1", "SPI_3", "SPEI_3"):
+        assert last[col] == pytest.approx(published[col], abs=1e-9)
+
+    # La calibración queda guardada en el estado
+    state = DailyState.load(tmp_path / "estado.json")
+    np.testing.assert_array_equal(state.calibration.params["a"], calib.params["a"])
+
+
+def test_run_daily_needs_calibration_or_history(tmp_path):
+    with pytest.raises(ValueError):
+        run_daily(tmp_path, tmp_path / "estado.json")
@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sarida.events import EventCatalogue
+
+
+@pytest.mark.parametrize("unit", ["s", "us", "ns"])
+def test_overlapping_independent_of_time_unit(unit):
+    times = pd.date_range("2000-01-01", periods=24, freq="MS").as_unit(unit)
+    spi = np.zeros(24)
+    spi[5:9] = -1.5
+    spi[15:17] = -2.0
+    df = pd.DataFrame({"valid_time": times, "SPI_3": spi})
+
+    cat = EventCatalogue.from_frame(df)
+    assert len(cat) == 2
+    assert len(cat.overlapping("2000-07-01", "2000-07-31")) == 1
+    assert len(cat.overlapping("2000-07-01", "2000-07-31", index="SPI_3")) == 1
+    assert len(cat.overlapping("2000-01-01", "2001-12-31")) == 2
+    assert len(cat.overlapping("2000-11-01", "2001-02-28", index="SPI_3")) == 0
@@ -0,0 +1,23 @@
+import numpy as np
+
+from sarida.extremes import DURATION_THRESHOLD, ExtremeFits
+
+
+def test_duration_gpd_fits_excesses_over_threshold():
+    rng = np.random.default_rng(0)
+    years = 40.0
+    # Duraciones enteras de al menos un mes, como las de detect_events
+    durations = 1 + np.floor(rng.exponential(3.0, size=60))
+    fits = ExtremeFits.fit({"dur": {"values": durations, "kind": "gpd",
+                                    "threshold": DURATION_THRESHOLD, "years": years}})
+
+    kept = durations[durations > DURATION_THRESHOLD]
+    assert np.isclose(fits.rate[0], kept.size / years)
+    assert np.nanmin(fits.samples[0]) == kept.min() - DURATION_THRESHOLD
+
+    levels = fits.return_levels().loc["dur"]
+    finite = levels.dropna()
+    assert (finite >= DURATION_THRESHOLD).all()
+    assert finite.is_monotonic_increasing
+    # Un nivel con menos de un exceso en T años no se extrapola bajo el umbral
+    assert np.isnan(levels[fits.rate[0] * np.array([2, 5, 10, 25, 50, 100]) < 1]).all()
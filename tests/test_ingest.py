@@ -0,0 +1,38 @@
+import pandas as pd
+
+from sarida.cds_local import LocalCDSClient
+from sarida.ingest import ingest_missing
+from sarida.store import MonthlyStore
+
+
+def _requested(client):
+    return {(int(y), int(m)) for _, req in client.requests for y in req["year"] for m in req["month"]}
+
+
+def test_ingest_missing_only_requests_missing_months(tmp_path, era5_source):
+    store = MonthlyStore(tmp_path / "almacen")
+    client = LocalCDSClient(era5_source)
+    written = ingest_missing(client, store, start="2019-01", end="2020-06",
+                             workdir=tmp_path / "descargas")
+    assert len(written) == 18
+    assert len(client.requests) == 2                      # una petición por año
+
+    # Se borra un mes del medio: la siguiente corrida solo pide ese y los nuevos
+    (store.root / "year=2020" / "month=03" / "part.parquet").unlink()
+    client = LocalCDSClient(era5_source)
+    written = ingest_missing(client, store, start="2019-01", end="2020-08",
+                             workdir=tmp_path / "descargas")
+    assert sorted(written) == [pd.Timestamp("2020-03-01"), pd.Timestamp("2020-07-01"),
+                               pd.Timestamp("2020-08-01")]
+    assert _requested(client) == {(2020, 3), (2020, 7), (2020, 8)}
+    assert len(store.months()) == 20
+
+
+def test_ingest_missing_noop_when_complete(tmp_path, era5_source):
+    store = MonthlyStore(tmp_path / "almacen")
+    ingest_missing(LocalCDSClient(era5_source), store, start="2019-01", end="2019-12",
+                   workdir=tmp_path / "descargas")
+    client = LocalCDSClient(era5_source)
+    assert ingest_missing(client, store, start="2019-01", end="2019-12",
+                          workdir=tmp_path / "descargas") == []
+    assert client.requests == []
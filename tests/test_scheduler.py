@@ -0,0 +1,81 @@
+import pandas as pd
+
+from sarida.cds_local import LocalCDSClient
+from sarida.ingest import missing_months
+from sarida.scheduler import DONE, FAILED, MERGED, RetrievalScheduler
+from sarida.store import MonthlyStore
+
+
+def _scheduler(workdir, client, **kwargs):
+    kwargs = {"max_workers": 1, "retries": 1, "backoff": 0.0, **kwargs}
+    return RetrievalScheduler(lambda: client, workdir, **kwargs)
+
+
+def test_scheduler_resumes_after_failures(tmp_path, era5_source):
+    store = MonthlyStore(tmp_path / "almacen")
+    workdir = tmp_path / "descargas"
+    client = LocalCDSClient(era5_source, failures=1)
+    sched = _scheduler(workdir, client)
+    ids = sched.plan(missing_months(store, "2019-01", "2021-12"))
+    assert len(ids) == 3
+
+    counts = sched.run()
+    assert counts == {FAILED: 1, DONE: 2}
+    failed = [j for j in ids if sched.jobs[j]["status"] == FAILED]
+    # El año que falló es el primero: no se combina nada para no dejar huecos
+    assert sched.merge_into(store) == []
+
+    # Una corrida nueva lee estado.json y solo repite el trabajo fallido
+    client = LocalCDSClient(era5_source)
+    sched = _scheduler(workdir, client)
+    assert sched.run() == {DONE: 3}
+    assert len(client.requests) == 1
+    assert client.requests[0][1]["year"] == [failed[0].split("_")[0]]
+    assert len(sched.merge_into(store)) == 36
+    assert sched.summary() == {MERGED: 3}
+    assert missing_months(store, "2019-01", "2021-12") == []
+
+
+def test_scheduler_retries_within_a_run(tmp_path, era5_source):
+    store = MonthlyStore(tmp_path / "almacen")
+    client = LocalCDSClient(era5_source, failures=2)
+    sched = _scheduler(tmp_path / "descargas", client, retries=3)
+    written = sched.run_missing(store, start="2019-01", end="2019-12")
+    assert len(written) == 12
+    assert len(client.requests) == 3
+
+
+def test_replan_reuses_jobs_from_previous_plan(tmp_path, era5_source):
+    store = MonthlyStore(tmp_path / "almacen")
+    workdir = tmp_path / "descargas"
+    client = LocalCDSClient(era5_source)
+    sched = _scheduler(workdir, client)
+    sched.plan(missing_months(store, "2019-01", "2019-06"))
+    sched.run()
+
+    # Otro rango y otra división: solo se piden julio–diciembre, por variable
+    client = LocalCDSClient(era5_source)
+    sched = _scheduler(workdir, client)
+    ids = sched.plan(missing_months(store, "2019-01", "2019-12"), split="variable")
+    assert "2019_01-06" in ids
+    sched.run()
+    assert {m for _, req in client.requests for m in req["month"]} == {f"{m:02d}" for m in range(7, 13)}
+    assert len(client.requests) == 9                      # una por variable
+
+    written = sched.merge_into(store)
+    assert len(written) == 12
+    assert not store.read().isna().any().any()
+
+
+def test_replan_requests_again_after_merge(tmp_path, era5_source):
+    store = MonthlyStore(tmp_path / "almacen")
+    workdir = tmp_path / "descargas"
+    sched = _scheduler(workdir, LocalCDSClient(era5_source))
+    sched.run_missing(store, start="2019-01", end="2019-12")
+
+    # Un mes combinado que desaparece del almacén se vuelve a pedir
+    (store.root / "year=2019" / "month=05" / "part.parquet").unlink()
+    client = LocalCDSClient(era5_source)
+    sched = _scheduler(workdir, client)
+    assert sched.run_missing(store, start="2019-01", end="2019-12") == [pd.Timestamp("2019-05-01")]
+    assert [req["month"] for _, req in client.requests] == [["05"]]